@@ -1,3 +1,8 @@
+import startup_profile
+
+startup_profile.enable()
+
+import io
 import json
 import logging
 import os
@@ -6,26 +11,273 @@ import time
 from datetime import datetime
 
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
 
 from integrations.database import update_database
+from integrations.errors import RETRY_QUEUE, handle_processing_error, redispatch_expired_jobs
 from integrations.notifications import send_completion_notification
 from integrations.tracking import (
+    begin_upload_commit,
     create_job_record,
     update_job_status,
     get_job_status,
-    delete_job_record,
+    get_job_statuses,
+    get_upload_session,
+    query_jobs,
+    delete_job_records,
+    expire_job_records,
     get_old_completed_jobs,
+    get_referenced_output_blobs,
+    job_output_blobs,
+    job_previews,
+    job_etag,
+    save_segment_manifest,
+    wait_for_job_change,
+)
+from integrations.auth import ANONYMOUS, ApiKeyIdentity, get_authenticator, require_auth, require_identity
+from integrations.ratelimit import charge_encode_seconds, check_rate_limit
+from integrations.singleflight import FOLLOWER_WAIT_SECONDS, JobInProgress, new_owner_token, run_once
+from processing import generate_upload_blob_sas_url
+from processing.admission import AdmissionRejected, assess_image
+from processing.capabilities import get_capabilities, probe_capabilities
+from processing.deadline import JOB_TIMEOUT, REQUEST_TIMEOUT, Deadline, DeadlineExceeded, LeaseLost
+from processing.retention import (
+    delete_processed_blobs,
+    minutes_until_expiry,
+    reconcile_orphaned_outputs,
+    sweep_expired_outputs,
+)
+from processing.scheduler import SchedulerTimeout, get_scheduler
+from processing.scratch import get_scratch_manager, run_reaper
+from processing.storage import (
+    PROCESSED_CONTAINER,
+    STORAGE_BACKEND,
+    UPLOADS_CONTAINER,
+    BlobNotFound,
+    SignedWriteUnsupported,
+    StorageBackend,
+    get_storage,
+)
+from processing.transfer import get_transfer_stats
+from processing.ingest import (
+    IMAGE_EXTENSIONS,
+    MAX_UPLOAD_SIZE,
+    VIDEO_EXTENSIONS,
+    InvalidUpload,
+    UploadNotFound,
+    UploadTooLarge,
+    commit_chunked_upload,
+    get_extension,
+    get_upload_progress,
+    new_upload_blob_name,
+    stage_chunk,
+    stage_stream,
+    start_chunked_upload,
 )
-from integrations.auth import require_auth
-from processing.image import process_image
-from processing.video import process_video
 
 
 app = func.FunctionApp()
 
 START_TIME = time.time()
 
+_background_started = False
+_background_lock = threading.Lock()
+
+
+def _prewarm() -> None:
+    """Load the processors and storage clients a real job will need."""
+    try:
+        import processing.image  # noqa: F401  (Pillow)
+        import processing.video  # noqa: F401
+        from integrations.tracking import _get_table_client
+
+        # Loads ffmpeg and its shared libraries and caches the codec map
+        probe_capabilities()
+        _get_table_client()
+        get_storage()
+        logging.info("Background prewarm finished")
+    except Exception as exc:
+        logging.warning("Background prewarm failed: %s", str(exc))
+
+
+# Per-instance background work, started by the first real request rather than
+# at import so that health/version probes and cold starts stay cheap
+BACKGROUND_WORKERS = [("prewarm", _prewarm), ("scratch-reaper", run_reaper)]
+
+
+def _start_background_workers() -> None:
+    global _background_started
+
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        for name, target in BACKGROUND_WORKERS:
+            threading.Thread(target=target, name=name, daemon=True).start()
+        _background_started = True
+        logging.info("Started background workers: %s", ", ".join(name for name, _ in BACKGROUND_WORKERS))
+
+
+def _admission_rejected_response(exc: AdmissionRejected) -> func.HttpResponse:
+    """413 response for jobs rejected by the pre-decode admission gate."""
+    return func.HttpResponse(
+        body=json.dumps({
+            "status": "error",
+            "error": str(exc),
+            "admission": exc.assessment,
+        }),
+        mimetype="application/json",
+        status_code=413,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
+
+
+def _retry_later_response(
+    retry_after: float,
+    message: str = "Rate limit exceeded",
+    status_code: int = 429,
+) -> func.HttpResponse:
+    """429 (rate limited), 503 (no encode capacity) or 409 (busy upload) response with Retry-After."""
+    return func.HttpResponse(
+        body=json.dumps({"status": "error", "error": message, "retry_after": round(retry_after, 1)}),
+        mimetype="application/json",
+        status_code=status_code,
+        headers={
+            "Retry-After": str(max(1, int(retry_after + 0.999))),
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "Retry-After",
+        },
+    )
+
+
+def _in_progress_response(exc: JobInProgress) -> func.HttpResponse:
+    """202 for a duplicate request whose blob is still being processed elsewhere."""
+    return func.HttpResponse(
+        body=json.dumps({
+            "status": "processing",
+            "blob_name": exc.blob_name,
+            "message": str(exc),
+            "status_url": f"/api/status?blob_name={exc.blob_name}",
+            "retry_after": exc.retry_after,
+        }),
+        mimetype="application/json",
+        status_code=202,
+        headers={
+            "Retry-After": str(exc.retry_after),
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "Retry-After",
+        },
+    )
+
+
+def _lease_lost_response(blob_name: str, exc: LeaseLost) -> func.HttpResponse:
+    """202 for a job another worker took over mid-run; the result will be its."""
+    logging.warning("Handed %s over to another worker: %s", blob_name, str(exc))
+    return _in_progress_response(JobInProgress(blob_name))
+
+
+def _deadline_exceeded_response(exc: DeadlineExceeded) -> func.HttpResponse:
+    """504 for a job abandoned at its deadline (its ffmpeg was killed)."""
+    return func.HttpResponse(
+        body=json.dumps({"status": "error", "error": str(exc), "stage": exc.stage}),
+        mimetype="application/json",
+        status_code=504,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
+
+
+def _run_processing(
+    blob_name: str,
+    file_size: int,
+    file_extension: str,
+    identity: ApiKeyIdentity | None = None,
+    batch_id: str | None = None,
+    previews: str | None = None,
+    notify: bool = False,
+    deadline: Deadline | None = None,
+    owner: str | None = None,
+) -> dict:
+    """Create the job record and run the image or video processor for an uploaded blob.
+
+    The identity's name and weight select the tenant's fair-share bucket for
+    encode slots, and the measured processing time is charged to its
+    encode-seconds budget.
+
+    Processing is single-flight per blob: a retry that arrives while the
+    blob is being processed (here or on another instance) gets the running
+    job's result instead of encoding again. With notify, the database update
+    and completion notification are sent once, by the run that did the work.
+
+    The deadline (created where the request entered) bounds the whole run;
+    losing the job's lease to another worker cancels it with LeaseLost.
+    The run claims the job as `owner` (pass the caller's token so its own
+    status writes are conditional on still holding the job).
+
+    Raises:
+        JobInProgress: If the duplicate's wait for the running job timed out
+        LeaseLost: If another worker took the job over (leave its record alone)
+        DeadlineExceeded: If the deadline passed first (ffmpeg killed, temp files removed)
+    """
+    deadline = deadline or Deadline(JOB_TIMEOUT)
+    owner = owner or new_owner_token()
+    tenant = identity.name if identity else None
+    create_job_record(blob_name, file_size, file_extension, tenant=tenant, batch_id=batch_id)
+
+    def process() -> dict:
+        job = {
+            "blob_name": blob_name,
+            "file_size": file_size,
+            "tenant": tenant,
+            "weight": identity.weight if identity else 1.0,
+            "deadline": deadline,
+        }
+        # Segments a failed earlier attempt already encoded (long videos)
+        job["segment_manifest"] = (get_job_status(blob_name) or {}).get("segments")
+        job["on_checkpoint"] = lambda manifest: save_segment_manifest(blob_name, manifest)
+        # Processors (Pillow, ffmpeg plumbing) are imported on first use, not at cold start
+        if file_extension in VIDEO_EXTENSIONS:
+            from processing.previews import parse_preview_request
+            from processing.video import process_video
+
+            logging.info("Processing as VIDEO")
+            # "poster,sprite,preview" turns on previews on top of VIDEO_PREVIEWS
+            job["encoding_config"] = parse_preview_request(previews)
+            result = process_video(blob_name, job)
+        else:
+            from processing.image import parse_variant_request, process_image
+
+            logging.info("Processing as IMAGE")
+            # "srcset" (or explicit widths like "320,640") adds responsive variants
+            job["variant_widths"] = parse_variant_request(previews)
+            result = process_image(blob_name, job)
+
+        # One line per job; the full dict (previews, encoder details) only at DEBUG
+        logging.info(
+            "Processing result for %s: %s, %s -> %s bytes in %.1fs",
+            blob_name, result.get("status"), result.get("original_size"), result.get("compressed_size"),
+            result.get("processing_time", 0.0),
+        )
+        logging.debug("Full processing result for %s: %s", blob_name, result)
+
+        if identity:
+            charge_encode_seconds(identity, result.get("processing_time", 0.0) - result.get("queue_wait", 0.0))
+
+        if not update_job_status(blob_name, "completed", result=result, owner=owner):
+            raise LeaseLost("completion", "Job was taken over by another worker")
+
+        if notify:
+            update_database(blob_name, result)
+            send_completion_notification(blob_name, result)
+        return result
+
+    return run_once(
+        blob_name,
+        process,
+        timeout=deadline.timeout(FOLLOWER_WAIT_SECONDS),
+        owner=owner,
+        on_lease_lost=lambda: deadline.cancel("Lease lost to another worker", error=LeaseLost),
+    )
+
 
 @app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
 def health(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
@@ -54,15 +306,28 @@ def health(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override
             "build_time": build_time,
             "bundle_version": bundle_version,
             "host_uptime_seconds": int(time.time() - START_TIME),
+            "scheduler": get_scheduler().snapshot(),
+            "background_workers": _background_started,
+            "capabilities": get_capabilities(),
+            "transfers": get_transfer_stats().snapshot(),
+            "scratch": get_scratch_manager().snapshot(),
             "endpoints": [
                 "POST /api/process",
                 "POST /api/upload",
+                "POST /api/upload/start",
+                "PUT /api/upload/chunk",
+                "GET /api/upload/progress",
+                "POST /api/upload/commit",
+                "POST /api/upload-url",
                 "GET /api/status",
+                "GET|POST /api/status/bulk",
                 "GET /api/health",
                 "GET /api/warmup",
                 "GET /api/version",
             ],
         }
+        if startup_profile.ENABLED:
+            body["startup_profile"] = startup_profile.summary()
         return func.HttpResponse(
             body=json.dumps(body),
             mimetype="application/json",
@@ -118,9 +383,11 @@ def version_check(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[o
 def warmup(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
     """Dedicated warmup endpoint used by clients before uploads.
 
-    Establishes connections to critical dependencies so that the first real
-    upload request avoids cold-start overhead. Requires the standard API key
-    to prevent unauthenticated probing.
+    Establishes connections to critical dependencies and primes the media
+    toolchain (ffmpeg version/encoders/filters, a tiny synthetic encode and a
+    Pillow codec round trip) so that the first real upload request avoids
+    cold-start overhead. Requires the standard API key to prevent
+    unauthenticated probing.
     """
 
     # Require API key for consistency with upload endpoint
@@ -128,14 +395,15 @@ def warmup(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override
     if auth_response:
         return auth_response
 
+    _start_background_workers()
+
     storage_status = "skipped"
     storage_error: str | None = None
 
     try:
-        connection_string = os.environ.get("AzureWebJobsStorage")
-        if connection_string:
-            # Instantiate the blob service client to warm caches / sockets
-            BlobServiceClient.from_connection_string(connection_string)
+        if STORAGE_BACKEND != "azure" or os.environ.get("AzureWebJobsStorage"):
+            # Instantiate the storage backend to warm caches / sockets
+            get_storage()
             storage_status = "ready"
         else:
             storage_status = "missing-connection-string"
@@ -143,6 +411,9 @@ def warmup(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override
         storage_status = "error"
         storage_error = str(exc)
 
+    # Cached after the first call, so repeated warmup pings stay cheap
+    capabilities = probe_capabilities()
+
     headers = {
         "Access-Control-Allow-Origin": "*",
         "Cache-Control": "no-store",
@@ -157,6 +428,8 @@ def warmup(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override
         "uptime_seconds": int(time.time() - START_TIME),
         "timestamp": datetime.utcnow().isoformat(),
         "storage": storage_status,
+        "h264_encoder": capabilities.get("h264_encoder"),
+        "ffmpeg_version": capabilities.get("ffmpeg_version"),
     }
 
     if storage_error:
@@ -204,12 +477,73 @@ def wherefrom(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[overr
         )
 
 
+STATUS_MAX_WAIT = float(os.environ.get("STATUS_MAX_WAIT", "30"))
+# Long-polls held at once. Each one blocks a worker thread from the pool that
+# also runs /api/process, so the rest are answered straight away.
+STATUS_MAX_WAITERS = int(os.environ.get("STATUS_MAX_WAITERS", "4"))
+# Retry-After for pollers that were answered without waiting
+STATUS_POLL_RETRY_AFTER = 2
+_status_waiters = threading.BoundedSemaphore(STATUS_MAX_WAITERS)
+
+
+def _build_status_response(job_status: dict) -> dict:
+    """Client-facing status fields for a job record."""
+    response = {
+        "blob_name": job_status.get("blob_name"),
+        "status": job_status.get("status"),
+        "file_size": job_status.get("file_size"),
+        "file_type": job_status.get("file_type"),
+        "created_at": job_status.get("created_at"),
+        "updated_at": job_status.get("updated_at"),
+    }
+
+    # Add processing details if available
+    if job_status.get("processing_started_at"):
+        response["processing_started_at"] = job_status.get("processing_started_at")
+    if job_status.get("status") == "processing" and job_status.get("heartbeat_at"):
+        response["heartbeat_at"] = job_status.get("heartbeat_at")
+    if job_status.get("retry_count"):
+        response["retry_count"] = job_status.get("retry_count")
+    if job_status.get("status") in ("processing", "queued", "failed") and job_status.get("segments"):
+        try:
+            manifest = json.loads(job_status["segments"])
+            response["segments"] = {"done": len(manifest.get("done", [])), "count": manifest.get("count")}
+        except (TypeError, ValueError):
+            pass
+
+    # Add completion details if completed
+    if job_status.get("status") == "completed":
+        response["completed_at"] = job_status.get("completed_at")
+        response["processed_blob_name"] = job_status.get("processed_blob_name")
+        response["renditions"] = job_output_blobs(job_status)
+        response["previews"] = job_previews(job_status)
+        response["original_size"] = job_status.get("original_size")
+        response["compressed_size"] = job_status.get("compressed_size")
+        response["compression_ratio"] = job_status.get("compression_ratio")
+        response["processing_time"] = job_status.get("processing_time")
+        response["output_url"] = job_status.get("output_url")
+
+    # Add error details if failed
+    if job_status.get("status") == "failed":
+        response["failed_at"] = job_status.get("failed_at")
+        response["error_message"] = job_status.get("error_message")
+
+    return response
+
+
 @app.route(route="status", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
 def get_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
     """Get processing status for a blob.
 
     Query parameters:
         blob_name: Name of the blob to check status for
+        wait: Optional long-poll seconds (max STATUS_MAX_WAIT). With an
+            If-None-Match header, the response is held until the status
+            changes or the wait expires. Only STATUS_MAX_WAITERS long-polls
+            are held at once; beyond that the current status is returned
+            immediately with Retry-After.
+
+    Responses carry an ETag; a matching If-None-Match returns 304.
 
     Requires authentication via X-API-Key header.
     """
@@ -218,6 +552,8 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[over
     if auth_response:
         return auth_response
 
+    _start_background_workers()
+
     try:
         blob_name = req.params.get("blob_name")
 
@@ -228,8 +564,22 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[over
                 status_code=400,
             )
 
-        # Get job status from Table Storage
-        job_status = get_job_status(blob_name)
+        try:
+            wait = min(max(float(req.params.get("wait", "0")), 0.0), STATUS_MAX_WAIT)
+        except ValueError:
+            wait = 0.0
+        if_none_match = req.headers.get("If-None-Match")
+
+        # Get job status (short-TTL in-process cache in front of Table Storage)
+        waited = False
+        if wait and if_none_match and _status_waiters.acquire(blocking=False):
+            try:
+                job_status = wait_for_job_change(blob_name, if_none_match, wait)
+                waited = True
+            finally:
+                _status_waiters.release()
+        else:
+            job_status = get_job_status(blob_name)
 
         if not job_status:
             return func.HttpResponse(
@@ -238,39 +588,24 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[over
                 status_code=404,
             )
 
-        # Build response
-        response = {
-            "blob_name": job_status.get("blob_name"),
-            "status": job_status.get("status"),
-            "file_size": job_status.get("file_size"),
-            "file_type": job_status.get("file_type"),
-            "created_at": job_status.get("created_at"),
-            "updated_at": job_status.get("updated_at"),
+        etag = job_etag(job_status)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Access-Control-Expose-Headers": "ETag, Retry-After",
         }
+        if wait and if_none_match and not waited:
+            # Too many long-polls in flight: tell the client when to ask again
+            headers["Retry-After"] = str(STATUS_POLL_RETRY_AFTER)
 
-        # Add processing details if available
-        if job_status.get("processing_started_at"):
-            response["processing_started_at"] = job_status.get("processing_started_at")
-
-        # Add completion details if completed
-        if job_status.get("status") == "completed":
-            response["completed_at"] = job_status.get("completed_at")
-            response["processed_blob_name"] = job_status.get("processed_blob_name")
-            response["original_size"] = job_status.get("original_size")
-            response["compressed_size"] = job_status.get("compressed_size")
-            response["compression_ratio"] = job_status.get("compression_ratio")
-            response["processing_time"] = job_status.get("processing_time")
-            response["output_url"] = job_status.get("output_url")
-
-        # Add error details if failed
-        if job_status.get("status") == "failed":
-            response["failed_at"] = job_status.get("failed_at")
-            response["error_message"] = job_status.get("error_message")
+        if if_none_match == etag:
+            return func.HttpResponse(status_code=304, headers=headers)
 
         return func.HttpResponse(
-            body=json.dumps(response),
+            body=json.dumps(_build_status_response(job_status)),
             mimetype="application/json",
             status_code=200,
+            headers=headers,
         )
 
     except Exception as exc:
@@ -282,14 +617,104 @@ def get_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[over
         )
 
 
+STATUS_BULK_MAX_BLOBS = 100
+
+
+@app.route(route="status/bulk", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET", "POST"])
+def get_bulk_status(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """Get processing status for many blobs in one call.
+
+    POST /api/status/bulk
+    Body: {"blob_names": ["upload-1.png", "upload-2.mp4"]} (max 100)
+
+    GET /api/status/bulk?step_id=<id> or ?batch_id=<id>
+
+    Returns {"jobs": [...], "count": n}; each item has the same fields as
+    GET /api/status. Unknown blob names are returned with status "not_found".
+
+    Requires authentication via X-API-Key header.
+    """
+    auth_response = require_auth(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+
+    try:
+        if req.method == "POST":
+            try:
+                req_body = req.get_json()
+            except ValueError:
+                req_body = {}
+            blob_names = req_body.get("blob_names")
+
+            if not isinstance(blob_names, list) or not blob_names:
+                return func.HttpResponse(
+                    body=json.dumps({"error": "blob_names must be a non-empty list"}),
+                    mimetype="application/json",
+                    status_code=400,
+                )
+            if len(blob_names) > STATUS_BULK_MAX_BLOBS:
+                return func.HttpResponse(
+                    body=json.dumps({"error": f"At most {STATUS_BULK_MAX_BLOBS} blob_names per request"}),
+                    mimetype="application/json",
+                    status_code=400,
+                )
+
+            statuses = get_job_statuses([str(name) for name in blob_names])
+            jobs = [
+                _build_status_response(job) if job else {"blob_name": name, "status": "not_found"}
+                for name, job in statuses.items()
+            ]
+        else:
+            step_id = req.params.get("step_id")
+            batch_id = req.params.get("batch_id")
+            if not step_id and not batch_id:
+                return func.HttpResponse(
+                    body=json.dumps({"error": "step_id or batch_id parameter is required"}),
+                    mimetype="application/json",
+                    status_code=400,
+                )
+            jobs = [_build_status_response(job) for job in query_jobs(step_id=step_id, batch_id=batch_id)]
+
+        return func.HttpResponse(
+            body=json.dumps({"jobs": jobs, "count": len(jobs)}),
+            mimetype="application/json",
+            status_code=200,
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    except Exception as exc:
+        logging.error("Bulk status check failed: %s", str(exc))
+        return func.HttpResponse(
+            body=json.dumps({"error": str(exc)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+
 @app.route(route="process", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
 def process_media(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
     """Main processing endpoint - call this after uploading blob to storage.
 
     POST /api/process
-    Body: {"blob_name": "upload-123.png"}
+    Body: {"blob_name": "upload-123.mp4", "previews": "<optional: poster,sprite,preview>"}
+    Headers: X-Api-Key: <your-api-key>
     """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+    deadline = Deadline(REQUEST_TIMEOUT)
+
+    retry_after = check_rate_limit(identity)
+    if retry_after:
+        return _retry_later_response(retry_after)
+
     blob_name = None
+    # Status writes below only land while this request still holds the job
+    owner = new_owner_token()
     try:
         req_body = req.get_json()
         blob_name = req_body.get("blob_name")
@@ -305,13 +730,9 @@ def process_media(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[o
         logging.info("Blob name: %s", blob_name)
 
         # Get blob metadata for file size
+        storage = get_storage()
         try:
-            blob_service = BlobServiceClient.from_connection_string(
-                os.environ["AzureWebJobsStorage"]
-            )
-            blob_client = blob_service.get_blob_client(container="uploads", blob=blob_name)
-            blob_properties = blob_client.get_blob_properties()
-            file_size = blob_properties.size
+            file_size = storage.size(UPLOADS_CONTAINER, blob_name)
         except Exception:
             file_size = 0
 
@@ -319,39 +740,26 @@ def process_media(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[o
         file_extension = blob_name.lower().split(".")[-1] if "." in blob_name else "unknown"
         logging.info("File size: %s, Type: %s", file_size, file_extension)
 
-        # Create job tracking record
-        create_job_record(blob_name, file_size, file_extension)
-
-        # Update status to processing
-        update_job_status(blob_name, "processing")
-
-        # Process based on file type
-        if file_extension in ["mp4", "mov", "avi", "webm"]:
-            logging.info("Processing as VIDEO")
-            result = process_video(blob_name, {"blob_name": blob_name, "file_size": file_size})
-        elif file_extension in ["jpg", "jpeg", "png", "gif", "webp"]:
-            logging.info("Processing as IMAGE")
-            result = process_image(blob_name, {"blob_name": blob_name, "file_size": file_size})
-        else:
-            update_job_status(blob_name, "failed", error_message=f"Unsupported file type: {file_extension}")
+        if file_extension not in VIDEO_EXTENSIONS + IMAGE_EXTENSIONS:
+            create_job_record(blob_name, file_size, file_extension)
+            update_job_status(
+                blob_name, "failed", error_message=f"Unsupported file type: {file_extension}", owner=owner
+            )
             return func.HttpResponse(
                 body=json.dumps({"error": f"Unsupported file type: {file_extension}"}),
                 mimetype="application/json",
                 status_code=400,
             )
 
-        logging.info("Processing result: %s", result)
-
-        # Update status to completed
-        update_job_status(blob_name, "completed", result=result)
-
-        # Update database and notify
-        update_database(blob_name, result)
-        send_completion_notification(blob_name, result)
+        # A retry while this blob is still processing joins the running job
+        result = _run_processing(
+            blob_name, file_size, file_extension, identity, previews=req_body.get("previews"), notify=True,
+            deadline=deadline, owner=owner,
+        )
 
         # Cleanup: Delete original upload blob
         try:
-            blob_client.delete_blob()
+            storage.delete(UPLOADS_CONTAINER, blob_name)
             logging.info("Deleted upload blob: %s", blob_name)
         except Exception as cleanup_exc:
             logging.warning("Failed to delete upload blob: %s", str(cleanup_exc))
@@ -368,12 +776,42 @@ def process_media(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[o
             status_code=200,
         )
 
+    except JobInProgress as exc:
+        return _in_progress_response(exc)
+
+    except LeaseLost as exc:
+        return _lease_lost_response(blob_name, exc)
+
+    except DeadlineExceeded as exc:
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _deadline_exceeded_response(exc)
+
+    except SchedulerTimeout as exc:
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _retry_later_response(30, str(exc), status_code=503)
+
+    except AdmissionRejected as exc:
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _admission_rejected_response(exc)
+
     except Exception as exc:
         logging.error("Processing failed: %s", str(exc))
         # Update job status to failed
         if blob_name:
             try:
-                update_job_status(blob_name, "failed", error_message=str(exc))
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
             except Exception:
                 pass
         return func.HttpResponse(
@@ -383,6 +821,41 @@ def process_media(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[o
         )
 
 
+# Results up to this size are returned in the /api/upload response body; larger
+# ones redirect to the processed blob, which streams with Content-Length and
+# Range support instead of passing through the worker's memory
+UPLOAD_INLINE_MAX_BYTES = int(float(os.environ.get("UPLOAD_INLINE_MAX_MB", "8")) * 1024 * 1024)
+# Largest /api/upload request body: the file plus room for the multipart framing
+UPLOAD_MAX_BODY_BYTES = MAX_UPLOAD_SIZE + 64 * 1024
+# Lifetime of the URL a redirected /api/upload result points at
+UPLOAD_RESULT_URL_MINUTES = int(os.environ.get("UPLOAD_RESULT_URL_MINUTES", "60"))
+
+
+def _redirects_result(result: dict, compressed_size: int) -> bool:
+    """Whether an /api/upload result is served by storage (303) rather than inline.
+
+    Large results are, unless the client could not reach their URL; only
+    small ones pass through the worker.
+    """
+    output_url = result.get("output_url") or ""
+    return compressed_size > UPLOAD_INLINE_MAX_BYTES and bool(output_url) and not output_url.startswith("file:")
+
+
+def _sign_result_url(storage: StorageBackend, result: dict) -> tuple[str, datetime]:
+    """Read-only URL of a redirected /api/upload result and its expiry (naive UTC).
+
+    Valid for UPLOAD_RESULT_URL_MINUTES, but never past the output's
+    expires_at tag: the expiry sweep deletes the blob then, and the URL
+    would only answer 404.
+    """
+    minutes = float(UPLOAD_RESULT_URL_MINUTES)
+    left = minutes_until_expiry(result.get("output_expires_at"))
+    if left is not None:
+        minutes = min(minutes, left)
+    # Signed here, not reused from output_url, so the lifetime is this one
+    return storage.sign_url(PROCESSED_CONTAINER, result["processed_blob_name"], "r", minutes, cache=False)
+
+
 @app.route(route="upload", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET", "POST", "OPTIONS"])
 def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
     """Accept file upload, compress it, and return compressed file data.
@@ -393,10 +866,26 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
 
     POST endpoint:
         Content-Type: multipart/form-data
-        Body: file field with file data
+        Body: file field with file data, optional step_id, batch_id and previews
+            (videos: comma-separated poster, sprite, preview) fields
         Headers: X-Api-Key: <your-api-key>
 
-    Returns: Compressed file as binary blob
+    Returns: Compressed file as binary blob, or for results over
+        UPLOAD_INLINE_MAX_MB a 303 redirect to its time-limited URL
+
+    Size limit: the Python worker receives the whole request body before this
+    handler runs, so memory grows with the upload. Bodies over
+    UPLOAD_MAX_BODY_BYTES (100MB plus multipart framing, by Content-Length)
+    get 413. Large or resumable uploads should use the chunked endpoints
+    (/api/upload/start, /chunk, /commit), which hold one chunk per request.
+
+    Redirect contract: the 303 has no body. Location is a read-only URL of the
+    processed file, valid until X-Result-Expires (ISO 8601 UTC): for
+    UPLOAD_RESULT_URL_MINUTES, but no longer than the processed file is kept
+    (OUTPUT_TTL_MINUTES after it was written). X-Compressed-Size is the file's length. A GET on Location
+    answers with Content-Length and honours Range, so clients resume or seek
+    by re-requesting Location (not by repeating the POST, which re-encodes)
+    until it expires.
     """
     # Handle CORS preflight
     if req.method == "OPTIONS":
@@ -406,7 +895,7 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
                 "Access-Control-Allow-Headers": "Content-Type, X-Api-Key, X-Warmup",
-                "Access-Control-Expose-Headers": "X-Original-Size, X-Compressed-Size, X-Compression-Ratio, X-Processing-Time",
+                "Access-Control-Expose-Headers": "X-Original-Size, X-Compressed-Size, X-Compression-Ratio, X-Processing-Time, X-Result-Expires, Location",
             }
         )
 
@@ -446,12 +935,31 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
             )
 
     # Check authentication for POST requests
-    auth_response = require_auth(req)
+    identity, auth_response = require_identity(req)
     if auth_response:
         return auth_response
 
+    _start_background_workers()
+    deadline = Deadline(REQUEST_TIMEOUT)
+
+    retry_after = check_rate_limit(identity)
+    if retry_after:
+        return _retry_later_response(retry_after)
+
+    # The host has already buffered the whole body, so this cap is what bounds the
+    # request's memory; checking it first skips parsing an oversized multipart payload
+    content_length = req.headers.get("Content-Length")
+    body_size = int(content_length) if content_length and content_length.isdigit() else len(req.get_body())
+    if body_size > UPLOAD_MAX_BODY_BYTES:
+        return func.HttpResponse(
+            body=json.dumps({"error": "File too large. Maximum size is 100MB."}),
+            mimetype="application/json",
+            status_code=413,
+        )
+
     blob_name = None
-    blob_client = None
+    storage = None
+    owner = new_owner_token()
 
     try:
         # Get uploaded file from multipart form data
@@ -469,99 +977,62 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
         logging.info("=== UPLOAD AND PROCESS STARTED ===")
         logging.info("Original filename: %s", original_filename)
 
-        # Validate file type
-        file_extension = original_filename.lower().split(".")[-1] if "." in original_filename else "unknown"
-
-        allowed_extensions = ["mp4", "mov", "avi", "webm", "flv", "wmv", "jpg", "jpeg", "png", "gif", "bmp", "webp"]
-        if file_extension not in allowed_extensions:
-            return func.HttpResponse(
-                body=json.dumps({"error": f"Unsupported file type: {file_extension}. Supported: {', '.join(allowed_extensions)}"}),
-                mimetype="application/json",
-                status_code=400,
-            )
-
-        # Generate unique blob name
-        timestamp = int(time.time() * 1000)
-        blob_name = f"upload-{timestamp}.{file_extension}"
+        # Validate file type and generate a unique, sharded blob name
+        file_extension = get_extension(original_filename)
+        try:
+            blob_name = new_upload_blob_name(original_filename, req.form.get("step_id"))
+        except InvalidUpload as exc:
+            return _upload_error_response(exc)
 
         logging.info("Generated blob name: %s", blob_name)
 
-        # Upload file to Azure Blob Storage
-        blob_service = BlobServiceClient.from_connection_string(
-            os.environ["AzureWebJobsStorage"]
-        )
-        blob_client = blob_service.get_blob_client(container="uploads", blob=blob_name)
-
-        # Read file data
-        file_content = file_data.stream.read()
-        file_size = len(file_content)
-
-        logging.info("File size: %s bytes", file_size)
-
-        # Validate file size (max 100MB)
-        max_size = 100 * 1024 * 1024  # 100MB
-        if file_size > max_size:
-            return func.HttpResponse(
-                body=json.dumps({"error": "File too large. Maximum size is 100MB."}),
-                mimetype="application/json",
-                status_code=400,
-            )
+        # Upload file to the 'uploads' container
+        storage = get_storage()
 
-        # Upload to blob storage
-        blob_client.upload_blob(file_content, overwrite=True)
-        logging.info("Uploaded to Azure Storage: %s", blob_name)
-
-        # Create job tracking record
-        create_job_record(blob_name, file_size, file_extension)
-        update_job_status(blob_name, "processing")
+        def check_image_header(first_chunk: bytes) -> None:
+            # Check image dimensions from the header before paying for the upload
+            if file_extension not in IMAGE_EXTENSIONS:
+                return
+            try:
+                assessment = assess_image(io.BytesIO(first_chunk))
+            except Exception:
+                # Header not identifiable from the first chunk; process_image re-checks
+                return
+            if assessment["action"] == "reject":
+                raise AdmissionRejected(assessment)
 
-        # Process based on file type
-        if file_extension in ["mp4", "mov", "avi", "webm", "flv", "wmv"]:
-            logging.info("Processing as VIDEO")
-            result = process_video(blob_name, {"blob_name": blob_name, "file_size": file_size})
-        elif file_extension in ["jpg", "jpeg", "png", "gif", "bmp", "webp"]:
-            logging.info("Processing as IMAGE")
-            result = process_image(blob_name, {"blob_name": blob_name, "file_size": file_size})
-        else:
-            update_job_status(blob_name, "failed", error_message=f"Unsupported file type: {file_extension}")
+        # Copy the (already buffered) file to blob storage in staged blocks
+        try:
+            file_size = stage_stream(blob_name, file_data.stream, on_first_chunk=check_image_header)
+        except UploadTooLarge as exc:
             return func.HttpResponse(
-                body=json.dumps({"error": f"Unsupported file type: {file_extension}"}),
+                body=json.dumps({"error": str(exc)}),
                 mimetype="application/json",
-                status_code=400,
+                status_code=413,
             )
+        logging.info("Uploaded to %s storage: %s (%s bytes)", storage.name, blob_name, file_size)
 
-        logging.info("Processing result: %s", result)
-
-        # Update status to completed
-        update_job_status(blob_name, "completed", result=result)
-
-        # Get processed blob URL
-        output_url = result.get("output_url")
-        processed_blob_name = blob_name.replace("upload-", "processed-")
-
-        # For videos, change extension to .mp4
-        if file_extension in ["mov", "avi", "webm", "flv", "wmv"]:
-            processed_blob_name = processed_blob_name.rsplit(".", 1)[0] + ".mp4"
-        # For images, change to .webp
-        elif file_extension in ["jpg", "jpeg", "png", "gif", "bmp"]:
-            processed_blob_name = processed_blob_name.rsplit(".", 1)[0] + ".webp"
-
-        logging.info("Downloading processed file: %s", processed_blob_name)
-
-        # Download compressed file from processed container
-        processed_blob_client = blob_service.get_blob_client(
-            container="processed",
-            blob=processed_blob_name
+        result = _run_processing(
+            blob_name, file_size, file_extension, identity, req.form.get("batch_id"), req.form.get("previews"),
+            deadline=deadline, owner=owner,
         )
-        compressed_data = processed_blob_client.download_blob().readall()
 
+        processed_blob_name = result["processed_blob_name"]
+
+        compressed_size = storage.size(PROCESSED_CONTAINER, processed_blob_name)
         logging.info("Compressed file size: %s bytes (ratio: %.2f%%)",
-                    len(compressed_data),
+                    compressed_size,
                     result.get("compression_ratio", 0) * 100)
 
+        redirect = _redirects_result(result, compressed_size)
+        compressed_data = b""
+        if not redirect:
+            logging.info("Downloading processed file: %s", processed_blob_name)
+            compressed_data = storage.read(PROCESSED_CONTAINER, processed_blob_name)
+
         # Cleanup: Delete upload blob
         try:
-            blob_client.delete_blob()
+            storage.delete(UPLOADS_CONTAINER, blob_name)
             logging.info("Deleted upload blob: %s", blob_name)
         except Exception as cleanup_exc:
             logging.warning("Failed to delete upload blob: %s", str(cleanup_exc))
@@ -576,30 +1047,76 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
             content_type = "image/webp"
             output_filename = original_filename.rsplit(".", 1)[0] + ".webp"
 
+        headers = {
+            "Content-Disposition": f'attachment; filename="{output_filename}"',
+            "X-Original-Size": str(file_size),
+            "X-Compressed-Size": str(compressed_size),
+            "X-Compression-Ratio": str(result.get("compression_ratio", 0)),
+            "X-Processing-Time": str(result.get("processing_time", 0)),
+            # CORS headers to expose custom headers to browser
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Expose-Headers": "X-Original-Size, X-Compressed-Size, X-Compression-Ratio, X-Processing-Time, X-Previews, X-Result-Expires, Location",
+        }
+        if result.get("previews"):
+            # Poster/sprite/preview SAS URLs as JSON: {"poster": "https://...", ...}
+            headers["X-Previews"] = json.dumps({kind: entry["url"] for kind, entry in result["previews"].items()})
+
+        if redirect:
+            # GET on the SAS URL streams the file with Content-Length and Range support
+            result_url, result_expires = _sign_result_url(storage, result)
+            logging.info("Redirecting to processed file (%s bytes): %s", compressed_size, processed_blob_name)
+            headers["Location"] = result_url
+            headers["X-Result-Expires"] = result_expires.isoformat() + "Z"
+            headers["Cache-Control"] = "no-store"
+            return func.HttpResponse(status_code=303, headers=headers)
+
         # Return compressed file as binary response
         return func.HttpResponse(
             body=compressed_data,
             mimetype=content_type,
             status_code=200,
-            headers={
-                "Content-Disposition": f'attachment; filename="{output_filename}"',
-                "X-Original-Size": str(file_size),
-                "X-Compressed-Size": str(len(compressed_data)),
-                "X-Compression-Ratio": str(result.get("compression_ratio", 0)),
-                "X-Processing-Time": str(result.get("processing_time", 0)),
-                # CORS headers to expose custom headers to browser
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Expose-Headers": "X-Original-Size, X-Compressed-Size, X-Compression-Ratio, X-Processing-Time",
-            }
+            headers=headers,
         )
 
+    except (AdmissionRejected, SchedulerTimeout) as exc:
+        if blob_name and storage:
+            try:
+                storage.delete(UPLOADS_CONTAINER, blob_name)
+            except Exception:
+                pass
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        if isinstance(exc, SchedulerTimeout):
+            return _retry_later_response(30, str(exc), status_code=503)
+        return _admission_rejected_response(exc)
+
+    except LeaseLost as exc:
+        # The new owner still needs the upload blob
+        return _lease_lost_response(blob_name, exc)
+
+    except DeadlineExceeded as exc:
+        if blob_name and storage:
+            try:
+                storage.delete(UPLOADS_CONTAINER, blob_name)
+            except Exception:
+                pass
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _deadline_exceeded_response(exc)
+
     except Exception as exc:
         logging.error("Upload and process failed: %s", str(exc))
 
         # Cleanup upload blob on error
-        if blob_name and blob_client:
+        if blob_name and storage:
             try:
-                blob_client.delete_blob()
+                storage.delete(UPLOADS_CONTAINER, blob_name)
                 logging.info("Cleaned up upload blob after error: %s", blob_name)
             except Exception:
                 pass
@@ -607,7 +1124,7 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
         # Update job status to failed
         if blob_name:
             try:
-                update_job_status(blob_name, "failed", error_message=str(exc))
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
             except Exception:
                 pass
 
@@ -618,79 +1135,538 @@ def upload_and_process(req: func.HttpRequest) -> func.HttpResponse:  # type: ign
         )
 
 
-def cleanup_old_files() -> None:
-    """Cleanup function that deletes processed files older than 10 minutes.
+def _upload_error_response(exc: Exception) -> func.HttpResponse:
+    if isinstance(exc, UploadTooLarge):
+        status_code = 413
+    elif isinstance(exc, UploadNotFound):
+        status_code = 404
+    else:
+        status_code = 400
+    return func.HttpResponse(
+        body=json.dumps({"status": "error", "error": str(exc)}),
+        mimetype="application/json",
+        status_code=status_code,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
+
+
+@app.route(route="upload/start", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def start_upload(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """Start a chunked upload.
+
+    POST /api/upload/start
+    Body: {"filename": "video.mp4", "step_id": "<optional SIMPI step ID>"}
+
+    Returns the blob_name to use for subsequent chunk and commit calls. The
+    upload belongs to the calling API key; chunk, progress and commit calls
+    made with another key get 404.
+    """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+
+    retry_after = check_rate_limit(identity)
+    if retry_after:
+        return _retry_later_response(retry_after)
+
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        req_body = {}
+
+    filename = req_body.get("filename")
+    if not filename:
+        return func.HttpResponse(
+            body=json.dumps({"error": "filename is required"}),
+            mimetype="application/json",
+            status_code=400,
+        )
+
+    try:
+        upload = start_chunked_upload(filename, req_body.get("step_id"))
+    except InvalidUpload as exc:
+        return _upload_error_response(exc)
+
+    try:
+        create_job_record(
+            upload["blob_name"], 0, get_extension(upload["blob_name"]), status="uploading", tenant=identity.name
+        )
+    except Exception as exc:
+        logging.error("Failed to start chunked upload: %s", str(exc))
+        return func.HttpResponse(
+            body=json.dumps({"status": "error", "error": str(exc)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+    return func.HttpResponse(
+        body=json.dumps(upload),
+        mimetype="application/json",
+        status_code=200,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
+
+
+@app.route(route="upload/chunk", auth_level=func.AuthLevel.ANONYMOUS, methods=["PUT"])
+def upload_chunk(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """Stage one chunk of a chunked upload.
+
+    PUT /api/upload/chunk?blob_name=upload-123.mp4&block_id=0
+    Body: raw chunk bytes (at most max_chunk_size from /api/upload/start)
+
+    Re-sending a block_id replaces the previously staged chunk.
+    """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+
+    blob_name = req.params.get("blob_name")
+    try:
+        get_upload_session(blob_name, identity.name)
+        staged = stage_chunk(blob_name, req.params.get("block_id"), req.get_body())
+    except (InvalidUpload, UploadTooLarge) as exc:
+        return _upload_error_response(exc)
+    except Exception as exc:
+        logging.error("Chunk upload failed: %s", str(exc))
+        return func.HttpResponse(
+            body=json.dumps({"status": "error", "error": str(exc)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+    return func.HttpResponse(
+        body=json.dumps(staged),
+        mimetype="application/json",
+        status_code=200,
+        headers={"Access-Control-Allow-Origin": "*"},
+    )
+
+
+@app.route(route="upload/progress", auth_level=func.AuthLevel.ANONYMOUS, methods=["GET"])
+def upload_progress(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """List the chunks already staged so an interrupted upload can resume.
+
+    GET /api/upload/progress?blob_name=upload-123.mp4
+    """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+
+    blob_name = req.params.get("blob_name")
+    try:
+        get_upload_session(blob_name, identity.name)
+        progress = get_upload_progress(blob_name)
+    except InvalidUpload as exc:
+        return _upload_error_response(exc)
+
+    return func.HttpResponse(
+        body=json.dumps(progress),
+        mimetype="application/json",
+        status_code=200,
+        headers={"Access-Control-Allow-Origin": "*", "Cache-Control": "no-store"},
+    )
+
+
+@app.route(route="upload/commit", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def commit_upload(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """Commit a chunked upload and start processing.
+
+    POST /api/upload/commit
+    Body: {"blob_name": "upload-123.mp4", "block_ids": [0, 1, 2], "previews": "<optional: poster,sprite,preview>"}
 
-    Runs in background thread every 5 minutes.
+    Returns the same JSON as /api/process once processing has finished. A
+    retried commit for a blob that is already processing or done does not
+    re-commit; it joins the running job (202 if that outlasts the wait). A
+    commit that arrives while another one is assembling the blocks gets 409
+    with Retry-After; retrying it then joins the job.
     """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+    deadline = Deadline(REQUEST_TIMEOUT)
+
+    retry_after = check_rate_limit(identity)
+    if retry_after:
+        return _retry_later_response(retry_after)
+
+    blob_name = None
+    # Status writes below only land while this request still holds the job
+    owner = new_owner_token()
     try:
-        logging.info("=== CLEANUP STARTED ===")
+        req_body = req.get_json()
+        blob_name = req_body.get("blob_name")
+
+        try:
+            existing = get_upload_session(blob_name, identity.name, max_age=0)
+        except UploadNotFound as exc:
+            return _upload_error_response(exc)
+
+        if existing.get("status") in ("queued", "processing", "completed"):
+            # Client retry: the blocks were committed by the first request
+            file_size = int(existing.get("file_size") or 0)
+            logging.info("Commit retry for %s (%s); joining the existing job", blob_name, existing.get("status"))
+        elif not begin_upload_commit(blob_name):
+            return _retry_later_response(2, f"{blob_name} is already being committed", status_code=409)
+        else:
+            try:
+                file_size = commit_chunked_upload(blob_name, req_body.get("block_ids"))
+            except (InvalidUpload, UploadTooLarge) as exc:
+                # Nothing was committed; the client may fix the request and commit again
+                update_job_status(blob_name, "uploading")
+                return _upload_error_response(exc)
+
+            logging.info("=== CHUNKED UPLOAD COMMITTED: %s (%s bytes) ===", blob_name, file_size)
 
-        # Get completed jobs older than 10 minutes
-        old_jobs = get_old_completed_jobs(minutes_old=10)
-        logging.info("Found %d old completed jobs to clean up", len(old_jobs))
+        result = _run_processing(
+            blob_name, file_size, get_extension(blob_name), identity, req_body.get("batch_id"),
+            req_body.get("previews"), notify=True, deadline=deadline, owner=owner,
+        )
+
+        # Cleanup: Delete original upload blob
+        try:
+            get_storage().delete(UPLOADS_CONTAINER, blob_name)
+            logging.info("Deleted upload blob: %s", blob_name)
+        except Exception as cleanup_exc:
+            logging.warning("Failed to delete upload blob: %s", str(cleanup_exc))
 
-        blob_service = BlobServiceClient.from_connection_string(
-            os.environ["AzureWebJobsStorage"]
+        return func.HttpResponse(
+            body=json.dumps({
+                "status": "success",
+                "blob_name": blob_name,
+                "result": result,
+            }),
+            mimetype="application/json",
+            status_code=200,
+            headers={"Access-Control-Allow-Origin": "*"},
         )
 
-        deleted_count = 0
-        error_count = 0
+    except JobInProgress as exc:
+        return _in_progress_response(exc)
 
-        for job in old_jobs:
+    except LeaseLost as exc:
+        return _lease_lost_response(blob_name, exc)
+
+    except DeadlineExceeded as exc:
+        if blob_name:
             try:
-                blob_name = job.get("blob_name")
-                processed_blob_name = job.get("processed_blob_name")
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _deadline_exceeded_response(exc)
 
-                if not processed_blob_name:
-                    # Derive from blob_name if not stored
-                    processed_blob_name = blob_name.replace("upload-", "processed-")
+    except SchedulerTimeout as exc:
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _retry_later_response(30, str(exc), status_code=503)
 
-                # Delete processed blob
-                try:
-                    processed_client = blob_service.get_blob_client(
-                        container="processed", blob=processed_blob_name
-                    )
-                    processed_client.delete_blob()
-                    logging.info("Deleted processed blob: %s", processed_blob_name)
-                except Exception as blob_exc:
-                    logging.warning(
-                        "Failed to delete processed blob %s: %s",
-                        processed_blob_name,
-                        str(blob_exc)
-                    )
+    except AdmissionRejected as exc:
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return _admission_rejected_response(exc)
+
+    except Exception as exc:
+        logging.error("Chunked upload processing failed: %s", str(exc))
+        if blob_name:
+            try:
+                update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+            except Exception:
+                pass
+        return func.HttpResponse(
+            body=json.dumps({"status": "error", "error": str(exc)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+
+@app.route(route="upload-url", auth_level=func.AuthLevel.ANONYMOUS, methods=["POST"])
+def issue_upload_url(req: func.HttpRequest) -> func.HttpResponse:  # type: ignore[override]
+    """Issue a short-lived, write-only SAS URL for a direct-to-storage upload.
+
+    POST /api/upload-url
+    Body: {"filename": "video.mp4", "step_id": "<optional SIMPI step ID>",
+           "previews": "<optional: poster,sprite,preview>"}
+
+    The client PUTs the file to upload_url (with header x-ms-blob-type: BlockBlob).
+    Processing starts from the BlobCreated Event Grid trigger, or when the
+    client calls POST /api/process with the returned blob_name.
+
+    The local storage backend has no URL clients can PUT to and answers 501;
+    upload through POST /api/upload or the chunked upload endpoints instead.
+    """
+    identity, auth_response = require_identity(req)
+    if auth_response:
+        return auth_response
+
+    _start_background_workers()
+
+    retry_after = check_rate_limit(identity)
+    if retry_after:
+        return _retry_later_response(retry_after)
+
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        req_body = {}
+
+    filename = req_body.get("filename")
+    if not filename:
+        return func.HttpResponse(
+            body=json.dumps({"error": "filename is required"}),
+            mimetype="application/json",
+            status_code=400,
+        )
+
+    try:
+        blob_name = new_upload_blob_name(filename, req_body.get("step_id"))
+    except InvalidUpload as exc:
+        return _upload_error_response(exc)
+
+    try:
+        expiry_minutes = int(os.environ.get("UPLOAD_SAS_EXPIRY_MINUTES", "15"))
+        upload_url, expires_on = generate_upload_blob_sas_url(blob_name, expiry_minutes)
+        create_job_record(
+            blob_name,
+            0,
+            get_extension(blob_name),
+            status="awaiting_upload",
+            tenant=identity.name,
+            batch_id=req_body.get("batch_id"),
+            previews=req_body.get("previews"),
+        )
+    except SignedWriteUnsupported as exc:
+        return func.HttpResponse(
+            body=json.dumps({"error": str(exc), "storage_backend": STORAGE_BACKEND}),
+            mimetype="application/json",
+            status_code=501,
+        )
+    except Exception as exc:
+        logging.error("Failed to issue upload URL: %s", str(exc))
+        return func.HttpResponse(
+            body=json.dumps({"status": "error", "error": str(exc)}),
+            mimetype="application/json",
+            status_code=500,
+        )
+
+    return func.HttpResponse(
+        body=json.dumps({
+            "blob_name": blob_name,
+            "upload_url": upload_url,
+            "expires_at": expires_on.isoformat() + "Z",
+            "method": "PUT",
+            "headers": {"x-ms-blob-type": "BlockBlob"},
+            "max_size": MAX_UPLOAD_SIZE,
+        }),
+        mimetype="application/json",
+        status_code=200,
+        headers={"Access-Control-Allow-Origin": "*", "Cache-Control": "no-store"},
+    )
+
+
+UPLOADS_SUBJECT_PREFIX = f"/blobServices/default/containers/{UPLOADS_CONTAINER}/blobs/"
 
-                # Delete job tracking record
-                delete_job_record(blob_name)
 
-                deleted_count += 1
+@app.event_grid_trigger(arg_name="event")
+def on_upload_blob_created(event: func.EventGridEvent) -> None:
+    """Start processing when a direct upload lands in the 'uploads' container.
 
-            except Exception as job_exc:
-                logging.error("Error cleaning up job %s: %s", job.get("blob_name"), str(job_exc))
-                error_count += 1
+    Subscribed to Microsoft.Storage.BlobCreated events on the storage account.
+    Only blobs whose job record is still awaiting_upload (issued by
+    /api/upload-url) are processed; uploads through /api/upload and
+    /api/upload/commit are processed inline and ignored here.
+    """
+    _start_background_workers()
+
+    if event.event_type != "Microsoft.Storage.BlobCreated":
+        return
+
+    subject = event.subject or ""
+    if not subject.startswith(UPLOADS_SUBJECT_PREFIX):
+        return
+
+    blob_name = subject[len(UPLOADS_SUBJECT_PREFIX):]
+    job_status = get_job_status(blob_name)
+    if not job_status or job_status.get("status") != "awaiting_upload":
+        logging.info("Ignoring BlobCreated for %s (not a pending direct upload)", blob_name)
+        return
+
+    file_size = int((event.get_json() or {}).get("contentLength") or 0)
+    logging.info("=== DIRECT UPLOAD RECEIVED: %s (%s bytes) ===", blob_name, file_size)
+
+    duplicate = False
+    owner = new_owner_token()
+    try:
+        if file_size > MAX_UPLOAD_SIZE:
+            raise UploadTooLarge("File too large. Maximum size is 100MB.")
+
+        tenant = job_status.get("tenant")
+        identity = (get_authenticator().get_identity(tenant) if tenant else None) or ANONYMOUS
+        result = _run_processing(
+            blob_name, file_size, get_extension(blob_name), identity, job_status.get("batch_id"),
+            job_status.get("previews_requested"), notify=True, owner=owner,
+        )
+
+        logging.info("=== DIRECT UPLOAD PROCESSING COMPLETED: %s ===", blob_name)
+
+    except JobInProgress as exc:
+        # Duplicate delivery; the owner finishes the job and deletes the upload
+        logging.info("Duplicate BlobCreated for %s: %s", blob_name, str(exc))
+        duplicate = True
+
+    except LeaseLost as exc:
+        # Another worker took the job over and still needs the upload
+        logging.warning("Handed %s over to another worker: %s", blob_name, str(exc))
+        duplicate = True
+
+    except Exception as exc:
+        logging.error("Direct upload processing failed for %s: %s", blob_name, str(exc))
+        try:
+            update_job_status(blob_name, "failed", error_message=str(exc), owner=owner)
+        except Exception:
+            pass
+
+    finally:
+        if not duplicate:
+            try:
+                get_storage().delete(UPLOADS_CONTAINER, blob_name)
+                logging.info("Deleted upload blob: %s", blob_name)
+            except Exception as cleanup_exc:
+                logging.warning("Failed to delete upload blob: %s", str(cleanup_exc))
+
+
+def cleanup_old_files() -> None:
+    """Cleanup for job records written before outputs carried an expiry.
+
+    Deletes exactly the outputs recorded on each completed job older than 10
+    minutes (processed blob plus renditions) in batches, then the job records
+    whose outputs are gone.
+    """
+    try:
+        logging.info("=== LEGACY CLEANUP STARTED ===")
+
+        old_jobs = [job for job in get_old_completed_jobs(minutes_old=10) if not job.get("expires_at")]
+        logging.info("Found %d old completed jobs without expiry", len(old_jobs))
+
+        outputs = {job.get("blob_name"): job_output_blobs(job) for job in old_jobs if job.get("blob_name")}
+        _, failed = delete_processed_blobs(
+            [name for names in outputs.values() for name in names]
+        )
+
+        # Keep records whose outputs could not be deleted so the next run retries them
+        failed_set = set(failed)
+        done = [blob_name for blob_name, names in outputs.items() if not failed_set.intersection(names)]
+        deleted_count = delete_job_records(done)
 
         logging.info(
-            "=== CLEANUP COMPLETED: %d jobs cleaned, %d errors ===",
+            "=== LEGACY CLEANUP COMPLETED: %d jobs cleaned, %d outputs failed to delete ===",
             deleted_count,
-            error_count
+            len(failed)
         )
 
     except Exception as exc:
         logging.error("Cleanup failed: %s", str(exc))
 
 
-def cleanup_worker():
-    """Background worker that runs cleanup every 5 minutes."""
-    while True:
+def reconcile_outputs() -> None:
+    """Remove 'processed' blobs that no job record references any more."""
+    try:
+        removed = reconcile_orphaned_outputs(get_referenced_output_blobs())
+        logging.info("Orphaned output reconciliation removed %d blobs", removed)
+    except Exception as exc:
+        logging.error("Orphaned output reconciliation failed: %s", str(exc))
+
+
+@app.timer_trigger(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def expire_outputs(timer: func.TimerRequest) -> None:
+    """Every 5 minutes: delete outputs and job records whose expiry has passed.
+
+    Outputs are found through their expires_at blob index tag and job records
+    through the expiry index partition, so each run only touches expired items.
+    Timer triggers hold a singleton lock, so one instance runs the sweep.
+    """
+    try:
+        removed_outputs = sweep_expired_outputs()
+        removed_jobs = expire_job_records()
+        logging.info("Expiry sweep removed %d outputs and %d job records", removed_outputs, removed_jobs)
+    except Exception as exc:
+        logging.error("Expiry sweep failed: %s", str(exc))
+
+
+@app.timer_trigger(schedule="0 30 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def reconcile_storage(timer: func.TimerRequest) -> None:
+    """Hourly: clean up legacy job records and orphaned outputs."""
+    cleanup_old_files()
+    reconcile_outputs()
+
+
+@app.timer_trigger(schedule="0 * * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def reap_expired_leases(timer: func.TimerRequest) -> None:
+    """Every minute: re-dispatch jobs whose worker stopped heartbeating.
+
+    A processing job's lease is renewed every JOB_LEASE_SECONDS / 3 by its
+    owner; once it lapses the owner is presumed dead and the job goes to the
+    retry queue (with backoff) instead of staying "processing" forever.
+    """
+    try:
+        reaped = redispatch_expired_jobs()
+        if reaped:
+            logging.warning("Re-dispatched %d jobs with expired leases", reaped)
+    except Exception as exc:
+        logging.error("Lease reaper failed: %s", str(exc))
+
+
+@app.queue_trigger(arg_name="msg", queue_name=RETRY_QUEUE, connection="AzureWebJobsStorage")
+def retry_processing(msg: func.QueueMessage) -> None:
+    """Process a job re-dispatched by the lease reaper."""
+    job = msg.get_json()
+    blob_name = job["blob_name"]
+    logging.info("=== RETRY %s OF %s ===", job.get("retry_count"), blob_name)
+    owner = new_owner_token()
+
+    try:
         try:
-            time.sleep(300)  # 5 minutes
-            cleanup_old_files()
-        except Exception as exc:
-            logging.error("Cleanup worker error: %s", str(exc))
+            file_size = get_storage().size(UPLOADS_CONTAINER, blob_name)
+        except BlobNotFound:
+            update_job_status(blob_name, "failed", error_message="Upload blob is gone; cannot retry", owner=owner)
+            return
+
+        tenant = job.get("tenant")
+        identity = (get_authenticator().get_identity(tenant) if tenant else None) or ANONYMOUS
+        _run_processing(
+            blob_name, file_size, get_extension(blob_name), identity,
+            job.get("batch_id"), job.get("previews"), notify=True, owner=owner,
+        )
+        get_storage().delete(UPLOADS_CONTAINER, blob_name)
+        logging.info("=== RETRY COMPLETED: %s ===", blob_name)
+
+    except JobInProgress as exc:
+        logging.info("Retry of %s skipped: %s", blob_name, str(exc))
 
+    except LeaseLost as exc:
+        # The new owner retries or finishes the job; requeueing it would run it twice
+        logging.warning("Retry of %s handed over to another worker: %s", blob_name, str(exc))
+
+    except Exception as exc:
+        logging.error("Retry of %s failed: %s", blob_name, str(exc))
+        requeued = handle_processing_error(msg, job, str(exc))
+        # Hand the record back too, or the stopped heartbeat would get it re-dispatched twice
+        update_job_status(
+            blob_name, "queued" if requeued else "failed", error_message=str(exc), retry_count=job["retry_count"],
+            owner=owner,
+        )
 
-# Start cleanup worker in background thread
-cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-cleanup_thread.start()
-logging.info("Background cleanup worker started")
 
+startup_profile.finish()
@@ -1,56 +1,295 @@
 """API authentication utilities."""
 
+import hashlib
+import hmac
+import json
 import logging
 import os
-from typing import Optional
+import signal
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import azure.functions as func
 
 
-def validate_api_key(req: func.HttpRequest) -> tuple[bool, Optional[str]]:
-    """Validate API key from request headers.
+# JSON key file (same format as COMPRESSION_API_KEYS) that is re-read on
+# reload, e.g. a mounted Key Vault secret or Azure Files share. App settings
+# are fixed for the worker's lifetime, so rotating keys without a restart
+# needs this file.
+API_KEYS_FILE = os.environ.get("COMPRESSION_API_KEYS_FILE", "")
+# Seconds between reloads of the key file
+AUTH_RELOAD_SECONDS = int(os.environ.get("AUTH_RELOAD_SECONDS", "300"))
 
-    Supports multiple API keys from environment variables:
-    - COMPRESSION_API_KEY_DEV: Development environment key
-    - COMPRESSION_API_KEY_PROD: Production environment key
 
-    Args:
-        req: Azure Function HTTP request
+class ApiKeyIdentity(NamedTuple):
+    """Identity attached to a request authenticated with an API key."""
 
-    Returns:
-        Tuple of (is_valid, error_message)
+    name: str
+    quota: Dict
+    weight: float = 1.0
+
+
+# Used when no keys are configured and authentication is disabled
+ANONYMOUS = ApiKeyIdentity(name="anonymous", quota={})
+
+
+class KeyConfigError(ValueError):
+    """Raised when a key source cannot be read or parsed."""
+
+
+def _digest(api_key: str) -> bytes:
+    return hashlib.sha256(api_key.encode("utf-8")).digest()
+
+
+def _load_key_entries() -> List[Tuple[bytes, ApiKeyIdentity]]:
+    """Read configured keys as (sha256 digest, identity).
+
+    Sources:
+    - COMPRESSION_API_KEY_DEV / COMPRESSION_API_KEY_PROD: plain keys named
+      "dev" and "prod"
+    - COMPRESSION_API_KEYS: JSON object of named keys. Each value is either a
+      plain key, "sha256:<hex digest>", or an object with "key" or "sha256"
+      plus optional "quota" (dict) and "weight" (number).
+    - COMPRESSION_API_KEYS_FILE: file with the same JSON object; the only
+      source that can change while the worker runs
+
+    Raises:
+        KeyConfigError: If a configured source is unreadable or not a JSON
+            object (single invalid entries are skipped and logged)
     """
-    # Get valid API keys from environment (support multiple keys)
-    valid_keys = []
+    entries: List[Tuple[bytes, ApiKeyIdentity]] = []
 
-    # Compression-specific keys
-    dev_key = os.environ.get("COMPRESSION_API_KEY_DEV", "")
-    prod_key = os.environ.get("COMPRESSION_API_KEY_PROD", "")
+    for name, env_var in (("dev", "COMPRESSION_API_KEY_DEV"), ("prod", "COMPRESSION_API_KEY_PROD")):
+        key = os.environ.get(env_var, "")
+        if key:
+            entries.append((_digest(key), ApiKeyIdentity(name=name, quota={})))
 
-    if dev_key:
-        valid_keys.append(dev_key)
-    if prod_key:
-        valid_keys.append(prod_key)
+    raw = os.environ.get("COMPRESSION_API_KEYS", "")
+    if raw:
+        entries.extend(_parse_named_keys(raw, "COMPRESSION_API_KEYS"))
 
-    if not valid_keys:
-        logging.warning("No API keys configured - authentication disabled")
-        return True, None
+    if API_KEYS_FILE:
+        try:
+            with open(API_KEYS_FILE, "r", encoding="utf-8") as fh:
+                entries.extend(_parse_named_keys(fh.read(), API_KEYS_FILE))
+        except OSError as exc:
+            raise KeyConfigError(f"Cannot read API key file {API_KEYS_FILE}: {exc}") from exc
+
+    return entries
+
+
+def _keys_configured() -> bool:
+    """Whether any key source is set, loadable or not."""
+    return bool(
+        API_KEYS_FILE
+        or os.environ.get("COMPRESSION_API_KEYS")
+        or os.environ.get("COMPRESSION_API_KEY_DEV")
+        or os.environ.get("COMPRESSION_API_KEY_PROD")
+    )
+
+
+def _parse_named_keys(raw: str, source: str) -> List[Tuple[bytes, ApiKeyIdentity]]:
+    """Entries of a JSON object of named keys (see _load_key_entries).
+
+    Raises:
+        KeyConfigError: If `raw` is not a JSON object
+    """
+    entries: List[Tuple[bytes, ApiKeyIdentity]] = []
+    try:
+        named_keys = json.loads(raw)
+    except ValueError as exc:
+        raise KeyConfigError(f"{source} is not valid JSON: {exc}") from exc
+    if not isinstance(named_keys, dict):
+        raise KeyConfigError(f"{source} must be a JSON object of named keys, not {type(named_keys).__name__}")
+
+    for name, spec in named_keys.items():
+        if isinstance(spec, str):
+            spec = {"sha256": spec[7:]} if spec.startswith("sha256:") else {"key": spec}
+
+        try:
+            if spec.get("sha256"):
+                digest = bytes.fromhex(spec["sha256"])
+            elif spec.get("key"):
+                digest = _digest(spec["key"])
+            else:
+                raise ValueError("missing key or sha256")
+            identity = ApiKeyIdentity(
+                name=name,
+                quota=dict(spec.get("quota") or {}),
+                weight=float(spec.get("weight", 1.0)),
+            )
+        except (AttributeError, TypeError, ValueError) as exc:
+            logging.error("Ignoring invalid API key entry %s: %s", name, str(exc))
+            continue
+
+        entries.append((digest, identity))
+
+    return entries
+
+
+class ApiKeyAuthenticator:
+    """Holds the compiled key set and matches presented keys in constant time.
+
+    Keys are stored only as SHA-256 digests. Every lookup compares the digest of
+    the presented key against all configured digests with hmac.compare_digest,
+    so timing does not reveal which key (or how much of it) matched.
+
+    The set is reloaded every reload_seconds and on SIGHUP. Only
+    COMPRESSION_API_KEYS_FILE can change in between; app settings are fixed
+    for the worker's lifetime.
+
+    Authentication fails closed: a reload that cannot read or parse the key
+    sources, or that finds no keys at all, keeps the last good set. While
+    any key source is configured authentication stays enabled, so a key
+    file that is broken from the start rejects every key instead of
+    admitting anonymous requests.
+    """
+
+    def __init__(self, reload_seconds: int = AUTH_RELOAD_SECONDS):
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._entries: List[Tuple[bytes, ApiKeyIdentity]] = []
+        self._loaded_at = 0.0
+        self._reload_requested = True
+
+    def request_reload(self) -> None:
+        """Re-read the key file on the next lookup (e.g. from a SIGHUP handler)."""
+        self._reload_requested = True
+
+    def _maybe_reload(self) -> None:
+        if not self._reload_requested and time.monotonic() - self._loaded_at < self.reload_seconds:
+            return
+
+        with self._lock:
+            if not self._reload_requested and time.monotonic() - self._loaded_at < self.reload_seconds:
+                return
+            self._loaded_at = time.monotonic()
+            self._reload_requested = False
+            try:
+                entries = _load_key_entries()
+            except KeyConfigError as exc:
+                logging.error("API key reload failed, keeping %d loaded keys: %s", len(self._entries), str(exc))
+                return
+            if not entries and self._entries:
+                logging.error("API key reload found no keys, keeping %d loaded keys", len(self._entries))
+                return
+            self._entries = entries
+            logging.info("Loaded %d API keys", len(self._entries))
+
+    @property
+    def enabled(self) -> bool:
+        self._maybe_reload()
+        return bool(self._entries) or _keys_configured()
+
+    def get_identity(self, name: str) -> Optional[ApiKeyIdentity]:
+        """Look up a configured identity by key name (e.g. from a job record)."""
+        self._maybe_reload()
+        for _, identity in self._entries:
+            if identity.name == name:
+                return identity
+        return None
+
+    def authenticate(self, api_key: str) -> Optional[ApiKeyIdentity]:
+        """Return the identity for a presented key, or None if it is unknown."""
+        self._maybe_reload()
 
-    # Check for API key in headers
-    api_key = req.headers.get("X-Api-Key") or req.headers.get("X-API-Key") or req.headers.get("Authorization")
+        presented = _digest(api_key)
+        matched: Optional[ApiKeyIdentity] = None
+        for digest, identity in self._entries:
+            if hmac.compare_digest(presented, digest) and matched is None:
+                matched = identity
+        return matched
+
+
+_authenticator = ApiKeyAuthenticator()
+
+
+def _install_reload_signal() -> None:
+    # signal handlers can only be installed from the main thread
+    if not hasattr(signal, "SIGHUP") or threading.current_thread() is not threading.main_thread():
+        return
+    try:
+        signal.signal(signal.SIGHUP, lambda signum, frame: _authenticator.request_reload())
+    except (ValueError, OSError):
+        pass
+
+
+_install_reload_signal()
+
+
+def get_authenticator() -> ApiKeyAuthenticator:
+    return _authenticator
+
+
+def _get_presented_key(req: func.HttpRequest) -> Optional[str]:
+    # Request headers are case-insensitive, so this also covers X-API-Key
+    api_key = req.headers.get("X-Api-Key") or req.headers.get("Authorization")
 
     # Handle Bearer token format
     if api_key and api_key.startswith("Bearer "):
         api_key = api_key[7:]  # Remove "Bearer " prefix
 
+    return api_key or None
+
+
+def authenticate_request(req: func.HttpRequest) -> Tuple[Optional[ApiKeyIdentity], Optional[str]]:
+    """Authenticate a request and resolve the identity of its API key.
+
+    Args:
+        req: Azure Function HTTP request
+
+    Returns:
+        Tuple of (identity, error_message). identity is ANONYMOUS when no keys
+        are configured, None when authentication failed.
+    """
+    if not _authenticator.enabled:
+        logging.warning("No API keys configured - authentication disabled")
+        return ANONYMOUS, None
+
+    api_key = _get_presented_key(req)
     if not api_key:
-        return False, "Missing API key. Provide X-Api-Key header or Authorization: Bearer <key>"
+        return None, "Missing API key. Provide X-Api-Key header or Authorization: Bearer <key>"
 
-    if api_key not in valid_keys:
+    identity = _authenticator.authenticate(api_key)
+    if identity is None:
         logging.warning("Invalid API key provided")
-        return False, "Invalid API key"
+        return None, "Invalid API key"
 
-    return True, None
+    return identity, None
+
+
+def validate_api_key(req: func.HttpRequest) -> tuple[bool, Optional[str]]:
+    """Validate API key from request headers.
+
+    Args:
+        req: Azure Function HTTP request
+
+    Returns:
+        Tuple of (is_valid, error_message)
+    """
+    identity, error_message = authenticate_request(req)
+    return identity is not None, error_message
+
+
+def _unauthorized_response(error_message: Optional[str]) -> func.HttpResponse:
+    return func.HttpResponse(
+        body=json.dumps({"error": error_message}),
+        mimetype="application/json",
+        status_code=401
+    )
+
+
+def require_identity(req: func.HttpRequest) -> Tuple[Optional[ApiKeyIdentity], Optional[func.HttpResponse]]:
+    """Like require_auth, but also return the caller's identity.
+
+    Returns:
+        Tuple of (identity, None) on success, (None, 401 HttpResponse) on failure
+    """
+    identity, error_message = authenticate_request(req)
+    if identity is None:
+        return None, _unauthorized_response(error_message)
+    return identity, None
 
 
 def require_auth(req: func.HttpRequest) -> Optional[func.HttpResponse]:
@@ -62,13 +301,5 @@ def require_auth(req: func.HttpRequest) -> Optional[func.HttpResponse]:
     Returns:
         HttpResponse with 401 if auth fails, None if auth succeeds
     """
-    is_valid, error_message = validate_api_key(req)
-
-    if not is_valid:
-        return func.HttpResponse(
-            body=f'{{"error": "{error_message}"}}',
-            mimetype="application/json",
-            status_code=401
-        )
-
-    return None
+    _, auth_response = require_identity(req)
+    return auth_response
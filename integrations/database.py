@@ -7,11 +7,20 @@ from typing import Dict
 import requests
 
 
+# upload-<shard>-step-<step_id>-<22 hex id>.<ext> (see processing/naming.py); processed
+# names may carry more than one suffix (".w640.webp", ".sprite.vtt")
+_SHARDED_STEP_PATTERN = re.compile(r"^(?:upload|processed)-[0-9a-f]{2}-step-(.+)-[0-9a-f]{22}(?:\.[^.]+)+$")
+
+
 def extract_step_id_from_blob_name(blob_name: str) -> str:
     parts = blob_name.split("-")
     if len(parts) >= 2 and parts[0] == "step":
         return parts[1]
 
+    match = _SHARDED_STEP_PATTERN.match(blob_name)
+    if match:
+        return match.group(1)
+
     uuid_pattern = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
     match = re.search(uuid_pattern, blob_name, re.IGNORECASE)
     if match:
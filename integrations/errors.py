@@ -2,15 +2,31 @@ import base64
 import json
 import logging
 import os
-from typing import Dict
+from typing import Dict, Optional
 
 import azure.functions as func
-from azure.storage.queue import QueueClient
 
 from integrations.database import update_database_error
+from integrations.tracking import find_expired_leases, release_expired_lease, update_job_status
 
 
-def handle_processing_error(msg: func.QueueMessage, job: Dict, error: str) -> None:
+RETRY_QUEUE = "media-processing-queue"
+POISON_QUEUE = "media-processing-poison-queue"
+
+
+def _queue_client(queue_name: str):
+    # Imported here so function_app's cold start never loads the Queue SDK
+    from azure.storage.queue import QueueClient
+
+    return QueueClient.from_connection_string(os.environ["AzureWebJobsStorage"], queue_name)
+
+
+def handle_processing_error(msg: Optional[func.QueueMessage], job: Dict, error: str) -> bool:
+    """Requeue a failed job with backoff, or poison it after MAX_RETRY_ATTEMPTS.
+
+    Returns:
+        True if the job was requeued, False if it went to the poison queue
+    """
     job["retry_count"] = int(job.get("retry_count", 0)) + 1
     job["last_error"] = error
 
@@ -20,26 +36,53 @@ def handle_processing_error(msg: func.QueueMessage, job: Dict, error: str) -> No
         # Exponential backoff in seconds: 2, 4, 8 minutes
         delay = 2 ** job["retry_count"] * 60
 
-        queue_client = QueueClient.from_connection_string(
-            os.environ["AzureWebJobsStorage"], "media-processing-queue"
-        )
+        queue_client = _queue_client(RETRY_QUEUE)
 
         message = base64.b64encode(json.dumps(job).encode()).decode()
         queue_client.send_message(message, visibility_timeout=delay)
         logging.info("Requeued job %s for retry %s", job.get("blob_name"), job["retry_count"])
-        return
+        return True
 
     # Max retries reached: send to poison queue and update DB
     send_to_poison_queue(job, error)
     update_database_error(job.get("blob_name", "unknown"), error)
+    return False
 
 
 def send_to_poison_queue(job: Dict, error: str) -> None:
     poison_job = {**job, "final_error": error}
-    queue_client = QueueClient.from_connection_string(
-        os.environ["AzureWebJobsStorage"], "media-processing-poison-queue"
-    )
+    queue_client = _queue_client(POISON_QUEUE)
     message = base64.b64encode(json.dumps(poison_job).encode()).decode()
     queue_client.send_message(message)
 
 
+def redispatch_expired_jobs() -> int:
+    """Re-dispatch processing jobs whose owner stopped renewing its lease.
+
+    Each expired job is released (ETag-conditional, so one reaper wins) and
+    sent through handle_processing_error: requeued with backoff until
+    MAX_RETRY_ATTEMPTS, then poisoned and marked failed.
+
+    Returns:
+        Number of jobs taken back from dead owners
+    """
+    reaped = 0
+    for entity in find_expired_leases():
+        error = f"Lease expired (owner {entity.get('owner') or 'unknown'} stopped heartbeating)"
+        if release_expired_lease(entity, error) is None:
+            continue
+        reaped += 1
+
+        job = {
+            "blob_name": entity["RowKey"],
+            "file_size": int(entity.get("file_size") or 0),
+            "file_type": entity.get("file_type", ""),
+            "tenant": entity.get("tenant"),
+            "batch_id": entity.get("batch_id"),
+            "previews": entity.get("previews_requested"),
+            "retry_count": int(entity.get("retry_count") or 0),
+        }
+        if not handle_processing_error(None, job, error):
+            update_job_status(job["blob_name"], "failed", error_message=f"{error}; retries exhausted")
+
+    return reaped
@@ -0,0 +1,239 @@
+"""Per-tenant token-bucket rate limiting.
+
+Each API key identity gets two buckets:
+- requests: one token per authenticated request
+- encode_seconds: refilled in encode-seconds per second and charged with the
+  measured processing time after each job. It may go into debt; new requests
+  are refused until it is positive again, so a tenant that just submitted a
+  long video waits before submitting the next one.
+
+Buckets live in process. Set RATE_LIMIT_TABLE to share them across instances
+through Azure Table Storage; if the table is unreachable the in-process
+buckets are used. A request reads both buckets and writes at most one of
+them, with a single ETag-conditional create or update, so two instances
+cannot both take the last token. Checks that change nothing (the encode
+budget test, a refused take) are not written back: refill is derived from
+the stored timestamp. Contended writes are retried with jitter; an
+encode-seconds charge that still does not land is kept as in-process debt
+and added to the tenant's next charge or request.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from integrations.auth import ApiKeyIdentity
+
+
+DEFAULT_REQUESTS_PER_MINUTE = float(os.environ.get("RATE_LIMIT_REQUESTS_PER_MINUTE", "120"))
+DEFAULT_ENCODE_SECONDS_PER_HOUR = float(os.environ.get("RATE_LIMIT_ENCODE_SECONDS_PER_HOUR", "3600"))
+RATE_LIMIT_TABLE = os.environ.get("RATE_LIMIT_TABLE", "")
+# Upper bound of the random pause before the first retry of a contended write (doubles per retry)
+RETRY_JITTER_SECONDS = 0.02
+
+
+class TokenBucket:
+    """Classic token bucket; take() may be allowed to overdraw into debt."""
+
+    def __init__(self, rate: float, capacity: float, tokens: Optional[float] = None, updated: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.time() if updated is None else updated
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float = 1.0, allow_debt: bool = False) -> float:
+        """Take tokens. Returns 0 on success, otherwise seconds until possible."""
+        self._refill(time.time())
+        if self.tokens >= amount or allow_debt:
+            self.tokens -= amount
+            return 0.0
+        return self.retry_after(amount)
+
+    def retry_after(self, amount: float = 0.0) -> float:
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def positive(self) -> bool:
+        self._refill(time.time())
+        return self.tokens > 0
+
+
+def _limits(identity: ApiKeyIdentity) -> Dict[str, Tuple[float, float]]:
+    """(rate per second, capacity) for each bucket of an identity."""
+    quota = identity.quota or {}
+    requests_per_minute = float(quota.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE))
+    encode_per_hour = float(quota.get("encode_seconds_per_hour", DEFAULT_ENCODE_SECONDS_PER_HOUR))
+    return {
+        "requests": (requests_per_minute / 60.0, float(quota.get("request_burst", requests_per_minute))),
+        "encode_seconds": (encode_per_hour / 3600.0, float(quota.get("encode_burst", encode_per_hour))),
+    }
+
+
+class _LocalBucketStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+
+    def apply(
+        self, tenant: str, bucket_name: str, rate: float, capacity: float, operation, write: bool = True
+    ) -> float:
+        with self._lock:
+            bucket = self._buckets.get((tenant, bucket_name))
+            if bucket is None or bucket.rate != rate or bucket.capacity != capacity:
+                bucket = TokenBucket(rate, capacity, bucket.tokens if bucket else None, bucket.updated if bucket else None)
+                self._buckets[(tenant, bucket_name)] = bucket
+            return operation(bucket)
+
+
+class _TableBucketStore:
+    """Bucket state shared through Table Storage with ETag-conditional writes."""
+
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, table_name: str, fallback: _LocalBucketStore):
+        self.table_name = table_name
+        self.fallback = fallback
+        self._table_client = None
+
+    def _client(self):
+        if self._table_client is None:
+            from azure.data.tables import TableServiceClient
+
+            service = TableServiceClient.from_connection_string(os.environ["AzureWebJobsStorage"])
+            try:
+                service.create_table(self.table_name)
+            except ResourceExistsError:
+                pass
+            self._table_client = service.get_table_client(self.table_name)
+        return self._table_client
+
+    def apply(
+        self, tenant: str, bucket_name: str, rate: float, capacity: float, operation, write: bool = True
+    ) -> float:
+        """Run `operation` on the stored bucket and persist it if it took tokens.
+
+        Returns the operation's result (0 when tokens were taken). With
+        write=False, or when the operation refuses, nothing is written.
+        """
+        try:
+            client = self._client()
+            for attempt in range(self.MAX_ATTEMPTS):
+                if attempt:
+                    # Spread out instances that keep colliding on the same bucket
+                    time.sleep(random.uniform(0, RETRY_JITTER_SECONDS * 2 ** (attempt - 1)))
+                try:
+                    entity = client.get_entity(partition_key=tenant, row_key=bucket_name)
+                    bucket = TokenBucket(rate, capacity, float(entity["tokens"]), float(entity["updated"]))
+                except ResourceNotFoundError:
+                    entity = None
+                    bucket = TokenBucket(rate, capacity)
+
+                result = operation(bucket)
+                if not write or result:
+                    return result
+                state = {
+                    "PartitionKey": tenant,
+                    "RowKey": bucket_name,
+                    "tokens": bucket.tokens,
+                    "updated": bucket.updated,
+                }
+                try:
+                    if entity is None:
+                        client.create_entity(state)
+                    else:
+                        client.update_entity(
+                            state,
+                            mode="replace",
+                            etag=entity.metadata["etag"],
+                            match_condition=MatchConditions.IfNotModified,
+                        )
+                    return result
+                except (ResourceExistsError, ResourceModifiedError):
+                    continue  # another instance won the race; re-read and retry
+            # Still contended: refuse rather than let the local bucket overdraw
+            logging.info("Rate limit bucket %s/%s contended; refusing", tenant, bucket_name)
+            return 1.0
+        except Exception as exc:
+            logging.warning("Shared rate limit store unavailable, using local buckets: %s", str(exc))
+
+        return self.fallback.apply(tenant, bucket_name, rate, capacity, operation, write)
+
+
+_local_store = _LocalBucketStore()
+_store = _TableBucketStore(RATE_LIMIT_TABLE, _local_store) if RATE_LIMIT_TABLE else _local_store
+
+# tenant -> encode-seconds whose charge could not be written yet
+_unbilled: Dict[str, float] = {}
+_unbilled_lock = threading.Lock()
+
+
+def check_rate_limit(identity: ApiKeyIdentity) -> Optional[float]:
+    """Consume one request token for the identity.
+
+    Returns:
+        None if the request may proceed, otherwise seconds to wait (Retry-After)
+    """
+    limits = _limits(identity)
+
+    if identity.name in _unbilled:
+        _settle_encode_seconds(identity, 0.0)
+
+    rate, capacity = limits["encode_seconds"]
+    encode_wait = _store.apply(
+        identity.name, "encode_seconds", rate, capacity,
+        lambda bucket: 0.0 if bucket.positive() else bucket.retry_after(0.001),
+        write=False,
+    )
+    if encode_wait:
+        logging.info("Rate limited %s: encode-seconds budget exhausted", identity.name)
+        return encode_wait
+
+    rate, capacity = limits["requests"]
+    request_wait = _store.apply(identity.name, "requests", rate, capacity, lambda bucket: bucket.take(1.0))
+    if request_wait:
+        logging.info("Rate limited %s: request budget exhausted", identity.name)
+        return request_wait
+
+    return None
+
+
+def _settle_encode_seconds(identity: ApiKeyIdentity, seconds: float) -> None:
+    """Charge `seconds` plus any unbilled debt; keep it all as debt if the write fails."""
+    with _unbilled_lock:
+        seconds += _unbilled.pop(identity.name, 0.0)
+    if seconds <= 0:
+        return
+
+    rate, capacity = _limits(identity)["encode_seconds"]
+    # take(allow_debt=True) always succeeds, so a non-zero result means the write did not land
+    if _store.apply(
+        identity.name, "encode_seconds", rate, capacity,
+        lambda bucket: bucket.take(seconds, allow_debt=True),
+    ):
+        with _unbilled_lock:
+            _unbilled[identity.name] = _unbilled.get(identity.name, 0.0) + seconds
+        logging.warning(
+            "Could not charge %.1f encode-seconds to %s (bucket contended); charging them with its next request",
+            seconds, identity.name,
+        )
+
+
+def charge_encode_seconds(identity: ApiKeyIdentity, seconds: float) -> None:
+    """Charge measured processing time against the identity's encode budget.
+
+    A charge that cannot be written is not dropped: it is carried as debt
+    and added to the identity's next charge or rate limit check.
+    """
+    _settle_encode_seconds(identity, max(0.0, seconds))
@@ -0,0 +1,173 @@
+"""Single-flight processing: one run per blob, however many callers ask.
+
+Clients retry /api/process and /api/upload/commit aggressively on timeouts.
+Without coordination each retry starts another full encode of the same blob,
+and the runs race on the job record and the output blobs.
+
+- Within an instance, a caller that arrives while the blob is being processed
+  attaches to the in-flight future and gets the same result (or exception).
+- Across instances, the job entity is the lock: the first caller claims it
+  with an ETag-conditional update (claim_job). The others wait for the
+  record to reach completed or failed and return the owner's result.
+
+A follower that is still waiting after SINGLE_FLIGHT_WAIT_SECONDS gets
+JobInProgress, which the endpoints turn into 202 + Retry-After.
+A job without a record has no owner to wait for: claim_job raises
+JobRecordMissing, and so does a follower whose record disappears.
+
+The claim is a lease: while work() runs, a heartbeat thread renews it every
+LEASE_SECONDS / 3. If the instance dies the lease lapses, and the reaper
+(errors.redispatch_expired_jobs) hands the job to the retry queue.
+"""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional
+
+from integrations.tracking import (
+    LEASE_SECONDS,
+    JobRecordMissing,
+    claim_job,
+    job_result,
+    renew_lease,
+    wait_for_job_result,
+)
+
+
+# Seconds a duplicate caller waits for the owner before answering "still processing"
+FOLLOWER_WAIT_SECONDS = float(os.environ.get("SINGLE_FLIGHT_WAIT_SECONDS", "300"))
+# Retry-After suggested to callers that gave up waiting
+RETRY_AFTER_SECONDS = 15
+
+INSTANCE_ID = os.environ.get("WEBSITE_INSTANCE_ID", "")[:12] or socket.gethostname()
+
+_inflight: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+class JobInProgress(Exception):
+    """Raised to a duplicate caller when the owning run has not finished in time."""
+
+    def __init__(self, blob_name: str, owner: Optional[str] = None):
+        self.blob_name = blob_name
+        self.owner = owner
+        self.retry_after = RETRY_AFTER_SECONDS
+        super().__init__(f"{blob_name} is already being processed" + (f" by {owner}" if owner else ""))
+
+
+def new_owner_token() -> str:
+    """Owner recorded on a claimed job: instance, process and a per-run suffix."""
+    return f"{INSTANCE_ID}/{os.getpid()}/{uuid.uuid4().hex[:8]}"
+
+
+class _Heartbeat:
+    """Renews the owner's lease on a job in a background thread."""
+
+    def __init__(
+        self,
+        blob_name: str,
+        owner: str,
+        on_lost: Optional[Callable[[], None]] = None,
+        interval: float = LEASE_SECONDS / 3,
+    ):
+        self.blob_name = blob_name
+        self.owner = owner
+        self.on_lost = on_lost
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{blob_name}", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                if not renew_lease(self.blob_name, self.owner):
+                    self.lost = True
+                    logging.warning("Lost the lease on %s; another worker may pick it up", self.blob_name)
+                    if self.on_lost:
+                        self.on_lost()
+                    return
+            except Exception as exc:
+                # A missed beat is fine; the lease outlives two of them
+                logging.warning("Heartbeat for %s failed: %s", self.blob_name, str(exc))
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _follow(blob_name: str, job: Dict, timeout: float) -> Dict:
+    """Result of a run owned by another instance."""
+    if job.get("status") != "completed":
+        logging.info("%s is owned by %s; waiting for its result", blob_name, job.get("owner"))
+        job = wait_for_job_result(blob_name, timeout)
+        if job is None:
+            raise JobRecordMissing(blob_name)
+
+    if job.get("status") == "completed":
+        logging.info("Returning result of %s's run for %s", job.get("owner"), blob_name)
+        return job_result(job)
+    if job.get("status") == "failed":
+        raise RuntimeError(job.get("error_message") or f"Processing of {blob_name} failed")
+    raise JobInProgress(blob_name, job.get("owner"))
+
+
+def run_once(
+    blob_name: str,
+    work: Callable[[], Dict],
+    timeout: float = FOLLOWER_WAIT_SECONDS,
+    on_lease_lost: Optional[Callable[[], None]] = None,
+    owner: Optional[str] = None,
+) -> Dict:
+    """Run work() for blob_name unless a run is already in flight; share its result.
+
+    The job record must exist (create_job_record) before this is called.
+    work() runs only after this caller has claimed the job, so it should
+    not set the "processing" status itself. on_lease_lost is called from the
+    heartbeat thread if the lease is taken away mid-run (e.g. to cancel work()).
+    The job is claimed as `owner` (default: a new token), which work() can use
+    to make its status writes conditional on still holding the job.
+
+    Raises:
+        JobInProgress: If another run is still going after `timeout` seconds
+        JobRecordMissing: If the job has no record (or it was deleted while
+            following another run)
+    """
+    with _lock:
+        future = _inflight.get(blob_name)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[blob_name] = future
+
+    if not leader:
+        logging.info("Joining in-flight processing of %s", blob_name)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            raise JobInProgress(blob_name, INSTANCE_ID) from None
+
+    try:
+        owner = owner or new_owner_token()
+        claimed, job = claim_job(blob_name, owner)
+        if claimed:
+            with _Heartbeat(blob_name, owner, on_lease_lost):
+                result = work()
+        else:
+            result = _follow(blob_name, job, timeout)
+        future.set_result(result)
+        return result
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(blob_name, None)
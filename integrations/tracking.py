@@ -1,38 +1,177 @@
 """Job tracking using Azure Table Storage."""
 
+import hashlib
+import json
 import logging
 import os
-from datetime import datetime, timezone
-from typing import Dict, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
-from azure.data.tables import TableServiceClient, TableClient
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+from integrations.database import extract_step_id_from_blob_name
+from processing.ingest import UploadNotFound, output_extension
+from processing.naming import processed_blob_name
+from processing.retention import format_expiry
+from processing.segments import SEGMENT_TTL_MINUTES, manifest_segment_blobs
+
+if TYPE_CHECKING:
+    from azure.data.tables import TableClient
 
 
 TABLE_NAME = "processingjobs"
 
+# Seconds a status read is served from the in-process cache
+STATUS_CACHE_TTL = float(os.environ.get("STATUS_CACHE_TTL", "2"))
+STATUS_CACHE_MAX_ENTRIES = 10000
+# Parallel point reads used by get_job_statuses()
+BULK_READ_WORKERS = int(os.environ.get("STATUS_BULK_READ_WORKERS", "16"))
+# Minutes a finished (completed or failed) job record is kept
+JOB_RECORD_TTL_MINUTES = int(os.environ.get("JOB_RECORD_TTL_MINUTES", "10"))
+# Seconds a processing claim is valid without a heartbeat; the owner renews it
+# every LEASE_SECONDS / 3 while it works
+LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "120"))
+# Records claimed without a lease count as abandoned this long after processing started
+CLAIM_TIMEOUT = float(os.environ.get("SINGLE_FLIGHT_CLAIM_TIMEOUT", "900"))
+CLAIM_ATTEMPTS = 5
+# Seconds a "committing" chunked upload blocks other commits (then presumed abandoned)
+UPLOAD_COMMIT_TIMEOUT = 120
+FINISHED_STATUSES = ("completed", "failed")
+# Index partition with one "<expires_at>|<blob_name>" row per finished job, so
+# expired records are found with a RowKey range scan instead of a table scan
+EXPIRY_PARTITION = "expiry"
+# Index partition with one "<step_id>|<blob_name>" row per job of a SIMPI step,
+# so a step's jobs are found with a RowKey range scan instead of a table scan
+STEP_PARTITION = "steps"
+
+
+class JobRecordMissing(LookupError):
+    """Raised when a job's record does not exist (never created, or deleted)."""
+
+    def __init__(self, blob_name: str):
+        self.blob_name = blob_name
+        super().__init__(f"No job record for {blob_name}")
+
+
+_table_client: Optional["TableClient"] = None
+_table_client_lock = threading.Lock()
+
+# blob_name -> (cached_at, job dict or None when not found)
+_status_cache: Dict[str, Tuple[float, Optional[Dict]]] = {}
+# Notified whenever this instance changes a job, to wake long-polls
+_status_changed = threading.Condition()
+
+
+def _get_table_client() -> "TableClient":
+    """Get Azure Table Storage client.
+
+    The client (and the create_table round trip) is shared by all calls in
+    this process.
+    """
+    global _table_client
+
+    if _table_client is not None:
+        return _table_client
+
+    with _table_client_lock:
+        if _table_client is None:
+            # Imported here so health/version requests never load the Tables SDK
+            from azure.data.tables import TableServiceClient
+
+            connection_string = os.environ["AzureWebJobsStorage"]
+            table_service = TableServiceClient.from_connection_string(connection_string)
+
+            # Ensure table exists
+            try:
+                table_service.create_table(TABLE_NAME)
+            except ResourceExistsError:
+                pass
+
+            _table_client = table_service.get_table_client(TABLE_NAME)
+
+    return _table_client
+
 
-def _get_table_client() -> TableClient:
-    """Get Azure Table Storage client."""
-    connection_string = os.environ["AzureWebJobsStorage"]
-    table_service = TableServiceClient.from_connection_string(connection_string)
+def _cache_job(blob_name: str, job: Optional[Dict]) -> None:
+    """Store the latest known state of a job and wake any long-polls."""
+    with _status_changed:
+        if len(_status_cache) >= STATUS_CACHE_MAX_ENTRIES:
+            cutoff = time.monotonic() - STATUS_CACHE_TTL
+            for name in [n for n, (cached_at, _) in _status_cache.items() if cached_at < cutoff]:
+                del _status_cache[name]
+        _status_cache[blob_name] = (time.monotonic(), dict(job) if job is not None else None)
+        _status_changed.notify_all()
 
-    # Ensure table exists
+
+def _invalidate_job(blob_name: str) -> None:
+    with _status_changed:
+        _status_cache.pop(blob_name, None)
+        _status_changed.notify_all()
+
+
+def _expiry_row_key(blob_name: str, expires_at: str) -> str:
+    return f"{expires_at}|{blob_name}"
+
+
+def _drop_expiry_row(table_client: "TableClient", blob_name: str, expires_at: Optional[str]) -> None:
+    """Delete the index row of an expires_at the record no longer carries."""
+    if not expires_at:
+        return
     try:
-        table_service.create_table(TABLE_NAME)
-    except ResourceExistsError:
+        table_client.delete_entity(partition_key=EXPIRY_PARTITION, row_key=_expiry_row_key(blob_name, expires_at))
+    except ResourceNotFoundError:
         pass
 
-    return table_service.get_table_client(TABLE_NAME)
+
+def _step_row_key(blob_name: str) -> Optional[str]:
+    """Step index RowKey of a job, derived from its blob name (None without a step)."""
+    try:
+        return f"{extract_step_id_from_blob_name(blob_name)}|{blob_name}"
+    except ValueError:
+        return None
+
+
+def _drop_step_rows(table_client: "TableClient", blob_names: List[str]) -> None:
+    """Delete the step index rows of deleted job records."""
+    row_keys = [key for key in map(_step_row_key, blob_names) if key]
+    if row_keys:
+        _delete_rows(table_client, STEP_PARTITION, row_keys)
+
+
+def job_etag(job: Dict) -> str:
+    """Strong ETag for a job's status.
+
+    Derived from updated_at and status, plus the segment manifest, which
+    advances without touching updated_at.
+    """
+    source = f"{job.get('updated_at')}|{job.get('status')}|{job.get('segments') or ''}"
+    return '"' + hashlib.sha1(source.encode("utf-8")).hexdigest()[:16] + '"'
 
 
-def create_job_record(blob_name: str, file_size: int, file_type: str) -> Dict:
+def create_job_record(
+    blob_name: str,
+    file_size: int,
+    file_type: str,
+    status: str = "queued",
+    tenant: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    previews: Optional[str] = None,
+) -> Dict:
     """Create a new job tracking record.
 
     Args:
         blob_name: Name of the blob in uploads container
         file_size: Size of the uploaded file in bytes
         file_type: File extension (mp4, jpg, etc.)
+        status: Initial status (queued, awaiting_upload for direct uploads, or
+            uploading for chunked upload sessions)
+        tenant: Name of the API key identity that submitted the job
+        batch_id: Optional client-supplied ID grouping jobs (e.g. a gallery upload)
+        previews: Video previews requested with a direct upload ("poster,sprite")
 
     Returns:
         Dict with job information
@@ -44,18 +183,47 @@ def create_job_record(blob_name: str, file_size: int, file_type: str) -> Dict:
         "PartitionKey": "jobs",
         "RowKey": blob_name,
         "blob_name": blob_name,
-        "status": "queued",
+        "status": status,
         "file_size": file_size,
         "file_type": file_type,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "updated_at": datetime.now(timezone.utc).isoformat(),
     }
+    if tenant:
+        entity["tenant"] = tenant
+    if batch_id:
+        entity["batch_id"] = batch_id
+    if previews:
+        entity["previews_requested"] = previews
+    step_row_key = _step_row_key(blob_name)
+    if step_row_key:
+        entity["step_id"] = step_row_key.split("|", 1)[0]
+        # Indexed before the record exists, so query_jobs never misses it
+        table_client.upsert_entity({"PartitionKey": STEP_PARTITION, "RowKey": step_row_key, "blob_name": blob_name})
+
+    _invalidate_job(blob_name)
 
     try:
         table_client.create_entity(entity)
+        _cache_job(blob_name, entity)
         logging.info("Created job record for %s", blob_name)
     except ResourceExistsError:
-        logging.warning("Job record already exists for %s", blob_name)
+        existing = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+        if existing.get("status") in ("awaiting_upload", "committing"):
+            # Direct or chunked upload landed: fill in the real size and move the job on
+            table_client.update_entity(
+                {
+                    "PartitionKey": "jobs",
+                    "RowKey": blob_name,
+                    "status": status,
+                    "file_size": file_size,
+                    "updated_at": entity["updated_at"],
+                },
+                mode="merge",
+            )
+            logging.info("Activated direct-upload job record for %s", blob_name)
+        else:
+            logging.warning("Job record already exists for %s", blob_name)
 
     return entity
 
@@ -64,20 +232,43 @@ def update_job_status(
     blob_name: str,
     status: str,
     result: Optional[Dict] = None,
-    error_message: Optional[str] = None
-) -> None:
+    error_message: Optional[str] = None,
+    retry_count: Optional[int] = None,
+    owner: Optional[str] = None,
+) -> bool:
     """Update job status and metadata.
 
     Args:
         blob_name: Name of the blob
-        status: New status (queued, processing, completed, failed)
+        status: New status (awaiting_upload, uploading, committing, queued, processing,
+            completed, failed)
         result: Processing result dict (if completed)
         error_message: Error message (if failed)
+        retry_count: Retries used so far (when the job is re-dispatched)
+        owner: Owner token of the worker writing (as passed to claim_job). The
+            job is then only updated while no other worker holds it (its owner
+            is this one or empty), and the write is ETag-conditional, so a
+            worker whose lease was taken over cannot overwrite the new owner.
+
+    Returns:
+        False if the record does not exist or, with `owner`, another worker holds it
     """
     table_client = _get_table_client()
 
-    try:
-        entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+    for _ in range(CLAIM_ATTEMPTS):
+        try:
+            entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+        except ResourceNotFoundError:
+            logging.error("Job record not found for %s", blob_name)
+            return False
+
+        if owner is not None and entity.get("owner") not in (None, "", owner):
+            logging.warning(
+                "Not setting %s to %s: the job is held by %s, not %s", blob_name, status, entity.get("owner"), owner
+            )
+            return False
+
+        previous_expiry = entity.get("expires_at")
 
         entity["status"] = status
         entity["updated_at"] = datetime.now(timezone.utc).isoformat()
@@ -92,36 +283,484 @@ def update_job_status(
             entity["compression_ratio"] = result.get("compression_ratio", 0.0)
             entity["processing_time"] = result.get("processing_time", 0.0)
             entity["output_url"] = result.get("output_url", "")
-            entity["processed_blob_name"] = blob_name.replace("upload-", "processed-")
+            entity["output_expires_at"] = result.get("output_expires_at", "")
+            entity["processed_blob_name"] = result.get("processed_blob_name") or processed_blob_name(
+                blob_name, output_extension(entity.get("file_type", ""))
+            )
+            # Table Storage has no list type; renditions are stored as JSON
+            entity["renditions"] = json.dumps(result.get("renditions") or [entity["processed_blob_name"]])
+            if result.get("previews"):
+                entity["previews"] = json.dumps(result["previews"])
+            # Checkpoint segments are deleted once the joined video is stored
+            entity.pop("segments", None)
+
+        if retry_count is not None:
+            entity["retry_count"] = retry_count
 
         if status == "failed" and error_message:
             entity["error_message"] = error_message
             entity["failed_at"] = datetime.now(timezone.utc).isoformat()
 
-        table_client.update_entity(entity, mode="replace")
+        if status in ("completed", "failed"):
+            ttl_minutes = JOB_RECORD_TTL_MINUTES
+            if status == "failed" and entity.get("segments"):
+                # The manifest lives on the record; keep it as long as the
+                # checkpoint blobs so a late retry still resumes from them
+                ttl_minutes = max(ttl_minutes, SEGMENT_TTL_MINUTES)
+            expires_at = format_expiry(datetime.now(timezone.utc) + timedelta(minutes=ttl_minutes))
+            entity["expires_at"] = expires_at
+            # If the update below loses its ETag race, the sweep skips this stale row
+            table_client.upsert_entity({
+                "PartitionKey": EXPIRY_PARTITION,
+                "RowKey": _expiry_row_key(blob_name, expires_at),
+                "blob_name": blob_name,
+            })
+        else:
+            # Back in flight (retry, re-dispatch): the record must not expire mid-run
+            entity.pop("expires_at", None)
+
+        if owner is None:
+            table_client.update_entity(entity, mode="replace")
+        else:
+            try:
+                table_client.update_entity(
+                    entity,
+                    mode="replace",
+                    etag=entity.metadata["etag"],
+                    match_condition=MatchConditions.IfNotModified,
+                )
+            except ResourceModifiedError:
+                continue  # changed since the read (heartbeat, takeover); check the owner again
+        if previous_expiry != entity.get("expires_at"):
+            _drop_expiry_row(table_client, blob_name, previous_expiry)
+        _cache_job(blob_name, entity)
         logging.info("Updated job status for %s to %s", blob_name, status)
+        return True
 
-    except ResourceNotFoundError:
-        logging.error("Job record not found for %s", blob_name)
+    logging.warning("Not setting %s to %s: the record kept changing", blob_name, status)
+    return False
+
+
+def get_upload_session(blob_name: str, tenant: str, max_age: float = STATUS_CACHE_TTL) -> Dict:
+    """Job record of a chunked upload, checked to belong to `tenant`.
+
+    /api/upload/start creates the record (status "uploading") with the
+    caller's identity as tenant; chunk, progress and commit calls with any
+    other key see the same error as for an unknown upload.
+
+    Raises:
+        UploadNotFound: If there is no such upload or another tenant owns it
+    """
+    job = get_job_status(blob_name, max_age) if blob_name else None
+    if job is None or job.get("tenant") != tenant:
+        raise UploadNotFound(f"Unknown upload: {blob_name}")
+    return job
+
+
+def begin_upload_commit(blob_name: str) -> bool:
+    """Move a chunked upload to "committing" so that exactly one commit runs.
+
+    ETag-conditional like claim_job: of several concurrent commits of the
+    same upload one wins, the others get False. An upload whose commit
+    failed (status "failed") may be committed again, and so may one left
+    "committing" for UPLOAD_COMMIT_TIMEOUT by a caller that died.
+
+    Returns:
+        True if the caller should commit the staged blocks
+    """
+    table_client = _get_table_client()
+
+    for _ in range(CLAIM_ATTEMPTS):
+        try:
+            entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+        except ResourceNotFoundError:
+            return False
+
+        job = dict(entity)
+        status = job.get("status")
+        if status == "committing":
+            started = _parse_time(job.get("commit_started_at"))
+            if started and (datetime.now(timezone.utc) - started).total_seconds() < UPLOAD_COMMIT_TIMEOUT:
+                return False
+        elif status not in ("uploading", "failed"):
+            return False
+
+        previous_expiry = job.pop("expires_at", None)
+        now = datetime.now(timezone.utc).isoformat()
+        job.update({"status": "committing", "commit_started_at": now, "updated_at": now})
+        try:
+            table_client.update_entity(
+                job,
+                mode="replace",
+                etag=entity.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except ResourceModifiedError:
+            continue  # another commit changed the session first; re-read and decide again
+
+        _drop_expiry_row(table_client, blob_name, previous_expiry)
+        _cache_job(blob_name, job)
+        return True
+
+    return False
+
+
+def _parse_time(value) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def lease_expired(job: Dict, now: Optional[datetime] = None) -> bool:
+    """Whether a job's processing claim has lapsed (owner presumed dead)."""
+    now = now or datetime.now(timezone.utc)
+    lease_expires_at = _parse_time(job.get("lease_expires_at"))
+    if lease_expires_at is not None:
+        return lease_expires_at <= now
+
+    started = _parse_time(job.get("processing_started_at"))
+    return started is None or (now - started).total_seconds() >= CLAIM_TIMEOUT
+
+
+def claim_job(blob_name: str, owner: str) -> Tuple[bool, Optional[Dict]]:
+    """Take ownership of a job so that only one caller processes it.
+
+    The job entity is moved to "processing" with an ETag-conditional update,
+    so of several instances claiming at once exactly one succeeds. The claim
+    is a lease of LEASE_SECONDS that the owner keeps alive with renew_lease().
+    A job that is completed, or processing under another owner whose lease
+    has not expired, is not claimed.
+
+    Args:
+        blob_name: Name of the blob
+        owner: Unique token of the caller (stored on the record as `owner`)
+
+    Returns:
+        Tuple of (claimed, job dict as last read)
+
+    Raises:
+        JobRecordMissing: If the record does not exist. Nobody owns such a
+            job, and without a record the claim could not be renewed.
+    """
+    table_client = _get_table_client()
+
+    for _ in range(CLAIM_ATTEMPTS):
+        try:
+            entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+        except ResourceNotFoundError:
+            logging.error("Job record not found for %s", blob_name)
+            raise JobRecordMissing(blob_name) from None
+
+        job = dict(entity)
+        if job.get("status") == "completed":
+            return False, job
+        if (
+            job.get("status") == "processing"
+            and job.get("owner") != owner
+            and not lease_expired(job)
+        ):
+            return False, job
+
+        # A retried failed job stops expiring while it runs again
+        previous_expiry = job.pop("expires_at", None)
+        claimed_at = datetime.now(timezone.utc)
+        now = claimed_at.isoformat()
+        job.update({
+            "status": "processing",
+            "owner": owner,
+            "processing_started_at": now,
+            "updated_at": now,
+            "heartbeat_at": now,
+            "lease_expires_at": (claimed_at + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+        })
+        try:
+            table_client.update_entity(
+                job,
+                mode="replace",
+                etag=entity.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+        except ResourceModifiedError:
+            continue  # another caller changed the job first; re-read and decide again
+
+        _drop_expiry_row(table_client, blob_name, previous_expiry)
+        _cache_job(blob_name, job)
+        logging.info("Claimed job %s as %s", blob_name, owner)
+        return True, job
+
+    job = get_job_status(blob_name, max_age=0)
+    if job is None:
+        raise JobRecordMissing(blob_name)
+    return False, job
+
+
+def renew_lease(blob_name: str, owner: str) -> bool:
+    """Heartbeat: extend the owner's lease on a processing job.
+
+    Only heartbeat_at and lease_expires_at change (updated_at is left alone,
+    so status long-polls are not woken).
+
+    Returns:
+        False if the job is no longer processing under this owner (the lease
+        was lost to the reaper or another instance)
+    """
+    table_client = _get_table_client()
+
+    for _ in range(CLAIM_ATTEMPTS):
+        try:
+            entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
+        except ResourceNotFoundError:
+            return False
+        if entity.get("status") != "processing" or entity.get("owner") != owner:
+            return False
+
+        now = datetime.now(timezone.utc)
+        try:
+            table_client.update_entity(
+                {
+                    "PartitionKey": "jobs",
+                    "RowKey": blob_name,
+                    "heartbeat_at": now.isoformat(),
+                    "lease_expires_at": (now + timedelta(seconds=LEASE_SECONDS)).isoformat(),
+                },
+                mode="merge",
+                etag=entity.metadata["etag"],
+                match_condition=MatchConditions.IfNotModified,
+            )
+            return True
+        except ResourceModifiedError:
+            continue
+
+    return False
+
+
+def find_expired_leases(now: Optional[datetime] = None) -> List[Dict]:
+    """Processing jobs whose owner stopped heartbeating (entities, with their ETag metadata)."""
+    now = now or datetime.now(timezone.utc)
+    entities = _get_table_client().query_entities(
+        "PartitionKey eq 'jobs' and status eq 'processing' and "
+        "(lease_expires_at lt @now or processing_started_at lt @legacy_cutoff)",
+        parameters={
+            "now": now.isoformat(),
+            "legacy_cutoff": (now - timedelta(seconds=CLAIM_TIMEOUT)).isoformat(),
+        },
+    )
+    # A long encode can be older than the legacy cutoff and still hold a live lease
+    return [entity for entity in entities if lease_expired(entity, now)]
+
+
+def release_expired_lease(job: Dict, error: str) -> Optional[Dict]:
+    """Take an expired job back from its dead owner and mark it queued.
+
+    Conditional on the ETag the job was read with (an entity from
+    find_expired_leases), so when several reapers find the same job only
+    one re-dispatches it.
+
+    Returns:
+        The job as it was before release, or None if it changed meanwhile
+    """
+    table_client = _get_table_client()
+    now = datetime.now(timezone.utc).isoformat()
+    try:
+        table_client.update_entity(
+            {
+                "PartitionKey": "jobs",
+                "RowKey": job["RowKey"],
+                "status": "queued",
+                "owner": "",
+                "lease_expires_at": "",
+                "last_error": error,
+                "retry_count": int(job.get("retry_count") or 0) + 1,
+                "updated_at": now,
+            },
+            mode="merge",
+            etag=job.metadata["etag"],
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except (ResourceModifiedError, ResourceNotFoundError):
+        return None
+
+    _invalidate_job(job["RowKey"])
+    logging.warning("Released expired lease of %s (owner %s)", job["RowKey"], job.get("owner"))
+    return job
 
 
-def get_job_status(blob_name: str) -> Optional[Dict]:
+def save_segment_manifest(blob_name: str, manifest: Dict) -> None:
+    """Record which segments of a long video are encoded and stored (checkpoint)."""
+    _get_table_client().update_entity(
+        {"PartitionKey": "jobs", "RowKey": blob_name, "segments": json.dumps(manifest)},
+        mode="merge",
+    )
+    _invalidate_job(blob_name)
+
+
+def get_job_status(blob_name: str, max_age: float = STATUS_CACHE_TTL) -> Optional[Dict]:
     """Get job status and metadata.
 
+    Reads are served from the in-process cache when it is younger than
+    max_age seconds. Status changes made by this instance update the cache
+    immediately; changes made by other instances show up within max_age.
+
     Args:
         blob_name: Name of the blob
+        max_age: Maximum cache age in seconds (0 forces a Table Storage read)
 
     Returns:
         Dict with job information or None if not found
     """
+    cached = _status_cache.get(blob_name)
+    if cached and time.monotonic() - cached[0] < max_age:
+        return dict(cached[1]) if cached[1] is not None else None
+
     table_client = _get_table_client()
 
     try:
         entity = table_client.get_entity(partition_key="jobs", row_key=blob_name)
-        return dict(entity)
+        job = dict(entity)
     except ResourceNotFoundError:
         logging.warning("Job record not found for %s", blob_name)
-        return None
+        job = None
+
+    _cache_job(blob_name, job)
+    return job
+
+
+def wait_for_job_change(blob_name: str, etag: str, timeout: float, poll_interval: float = 5.0) -> Optional[Dict]:
+    """Long-poll until the job's ETag differs from etag or timeout expires.
+
+    Local status transitions wake the wait immediately; changes made by other
+    instances are picked up by re-reading every poll_interval seconds.
+
+    Returns:
+        The latest job dict (unchanged if the timeout expired), or None
+    """
+    deadline = time.monotonic() + timeout
+    job = get_job_status(blob_name)
+    last_read = time.monotonic()
+
+    while job is not None and job_etag(job) == etag:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        with _status_changed:
+            _status_changed.wait(min(remaining, poll_interval))
+            cached = _status_cache.get(blob_name)
+
+        if cached is not None:
+            # Woken by a local change (possibly to another job): check the cache first
+            job = dict(cached[1]) if cached[1] is not None else None
+
+        if job is not None and job_etag(job) == etag and time.monotonic() - last_read >= poll_interval:
+            job = get_job_status(blob_name, max_age=0)
+            last_read = time.monotonic()
+
+    return job
+
+
+def wait_for_job_result(blob_name: str, timeout: float, poll_interval: float = 2.0) -> Optional[Dict]:
+    """Wait until a job is completed or failed, or timeout expires.
+
+    Returns:
+        The latest job dict (still unfinished if the timeout expired), or None
+    """
+    deadline = time.monotonic() + timeout
+    job = get_job_status(blob_name, max_age=0)
+
+    while job is not None and job.get("status") not in FINISHED_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        job = wait_for_job_change(blob_name, job_etag(job), remaining, poll_interval)
+
+    return job
+
+
+def job_result(job: Dict) -> Dict:
+    """Processing result of a completed job, rebuilt from its record."""
+    return {
+        "status": "success",
+        "original_size": job.get("original_size", 0),
+        "compressed_size": job.get("compressed_size", 0),
+        "compression_ratio": job.get("compression_ratio", 0.0),
+        "processing_time": job.get("processing_time", 0.0),
+        "output_url": job.get("output_url", ""),
+        "output_expires_at": job.get("output_expires_at"),
+        "processed_blob_name": job.get("processed_blob_name"),
+        "renditions": job_output_blobs(job),
+        "previews": job_previews(job),
+    }
+
+
+def get_job_statuses(blob_names: List[str]) -> Dict[str, Optional[Dict]]:
+    """Get the status of many jobs at once.
+
+    Cached entries are answered locally; the rest are fetched with parallel
+    point reads.
+
+    Args:
+        blob_names: Blob names to look up
+
+    Returns:
+        Dict of blob_name -> job dict (None if not found), in request order
+    """
+    results: Dict[str, Optional[Dict]] = {name: None for name in blob_names}
+    missing = []
+
+    now = time.monotonic()
+    for name in results:
+        cached = _status_cache.get(name)
+        if cached and now - cached[0] < STATUS_CACHE_TTL:
+            results[name] = dict(cached[1]) if cached[1] is not None else None
+        else:
+            missing.append(name)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(BULK_READ_WORKERS, len(missing)))) as pool:
+            for name, job in zip(missing, pool.map(get_job_status, missing)):
+                results[name] = job
+
+    return results
+
+
+def query_jobs(step_id: Optional[str] = None, batch_id: Optional[str] = None) -> List[Dict]:
+    """Find all jobs for a step ID or batch ID.
+
+    A step's jobs are listed from the step index (a RowKey range scan) and
+    read with parallel point reads; a batch's with a partition-scoped query.
+
+    Args:
+        step_id: SIMPI step ID (as extracted from the blob names)
+        batch_id: Client-supplied batch ID
+
+    Returns:
+        List of job dicts
+    """
+    table_client = _get_table_client()
+
+    if step_id:
+        rows = table_client.query_entities(
+            "PartitionKey eq @partition and RowKey ge @start and RowKey lt @end",
+            # '}' sorts right after '|'
+            parameters={"partition": STEP_PARTITION, "start": f"{step_id}|", "end": f"{step_id}}}"},
+            select=["blob_name"],
+        )
+        statuses = get_job_statuses([row["blob_name"] for row in rows])
+        # Index rows outlive records deleted without _drop_step_rows (e.g. by hand)
+        _drop_step_rows(table_client, [name for name, job in statuses.items() if job is None])
+        return [job for job in statuses.values() if job is not None]
+
+    if not batch_id:
+        raise ValueError("step_id or batch_id is required")
+
+    entities = table_client.query_entities(
+        "PartitionKey eq 'jobs' and batch_id eq @batch_id", parameters={"batch_id": batch_id}
+    )
+    jobs = [dict(entity) for entity in entities]
+    for job in jobs:
+        _cache_job(job["RowKey"], job)
+    return jobs
 
 
 def delete_job_record(blob_name: str) -> None:
@@ -134,11 +773,156 @@ def delete_job_record(blob_name: str) -> None:
 
     try:
         table_client.delete_entity(partition_key="jobs", row_key=blob_name)
+        _drop_step_rows(table_client, [blob_name])
+        _cache_job(blob_name, None)
         logging.info("Deleted job record for %s", blob_name)
     except ResourceNotFoundError:
         logging.warning("Job record not found for deletion: %s", blob_name)
 
 
+def _delete_rows(table_client: "TableClient", partition_key: str, row_keys: List[str]) -> int:
+    """Delete rows of one partition in entity group transactions (100 per batch).
+
+    Rows that are already gone are skipped.
+    """
+    deleted = 0
+    for start in range(0, len(row_keys), 100):
+        batch = row_keys[start:start + 100]
+        try:
+            table_client.submit_transaction(
+                [("delete", {"PartitionKey": partition_key, "RowKey": key}) for key in batch]
+            )
+            deleted += len(batch)
+        except Exception as exc:
+            # One missing entity fails the whole transaction; fall back to single deletes
+            logging.info("Batch delete of %d rows failed (%s), deleting one by one", len(batch), str(exc))
+            for key in batch:
+                try:
+                    table_client.delete_entity(partition_key=partition_key, row_key=key)
+                    deleted += 1
+                except ResourceNotFoundError:
+                    pass
+    return deleted
+
+
+def delete_job_records(blob_names: List[str]) -> int:
+    """Delete many job records in entity group transactions.
+
+    Returns:
+        Number of records deleted
+    """
+    table_client = _get_table_client()
+    deleted = _delete_rows(table_client, "jobs", blob_names)
+    _drop_step_rows(table_client, blob_names)
+    for name in blob_names:
+        _cache_job(name, None)
+
+    logging.info("Deleted %d job records", deleted)
+    return deleted
+
+
+def expire_job_records(now: Optional[datetime] = None, page_size: int = 100) -> int:
+    """Delete job records whose expires_at has passed, with their index rows.
+
+    Reads only the expired slice of the expiry index, one page at a time.
+    An index row only deletes its record if the record still carries the
+    same expires_at (a retried job has a newer one, or none while it runs),
+    and the delete is conditional on the ETag it was checked with.
+
+    Returns:
+        Number of job records deleted
+    """
+    table_client = _get_table_client()
+    expired = table_client.query_entities(
+        "PartitionKey eq @partition and RowKey lt @cutoff",
+        parameters={"partition": EXPIRY_PARTITION, "cutoff": format_expiry(now or datetime.now(timezone.utc))},
+        select=["RowKey", "blob_name"],
+        results_per_page=page_size,
+    )
+
+    removed = 0
+    for page in expired.by_page():
+        rows = list(page)
+        for row in rows:
+            if _expire_job_record(table_client, row["blob_name"], row["RowKey"].split("|", 1)[0]):
+                removed += 1
+        if rows:
+            _delete_rows(table_client, EXPIRY_PARTITION, [row["RowKey"] for row in rows])
+
+    if removed:
+        logging.info("Expired %d job records", removed)
+    return removed
+
+
+def _expire_job_record(table_client: "TableClient", blob_name: str, expires_at: str) -> bool:
+    """Delete a job record if its expires_at is still `expires_at`."""
+    try:
+        record = table_client.get_entity(partition_key="jobs", row_key=blob_name, select=["expires_at"])
+    except ResourceNotFoundError:
+        return False
+    if record.get("expires_at") != expires_at:
+        # Stale index row: the job was retried or finished again since
+        return False
+
+    try:
+        table_client.delete_entity(
+            partition_key="jobs",
+            row_key=blob_name,
+            etag=record.metadata["etag"],
+            match_condition=MatchConditions.IfNotModified,
+        )
+    except (ResourceModifiedError, ResourceNotFoundError):
+        return False
+    _drop_step_rows(table_client, [blob_name])
+    _cache_job(blob_name, None)
+    return True
+
+
+def job_output_blobs(job: Dict) -> List[str]:
+    """Names of all blobs in the 'processed' container that belong to a job."""
+    names: List[str] = []
+    try:
+        names = [name for name in json.loads(job.get("renditions") or "[]") if name]
+    except (TypeError, ValueError):
+        logging.warning("Invalid renditions on job %s", job.get("blob_name"))
+
+    processed = job.get("processed_blob_name")
+    if processed and processed not in names:
+        names.append(processed)
+
+    if not names and job.get("blob_name"):
+        # Records written before the processed name was persisted
+        names.append(processed_blob_name(job["blob_name"], output_extension(job.get("file_type", ""))))
+
+    # Segment checkpoints of an unfinished long video
+    names.extend(manifest_segment_blobs(job.get("blob_name", ""), job.get("segments")))
+
+    return names
+
+
+def job_previews(job: Dict) -> Dict[str, Dict]:
+    """Preview outputs of a job: kind -> {"blob_name", "url"}."""
+    try:
+        return json.loads(job.get("previews") or "{}")
+    except (TypeError, ValueError):
+        logging.warning("Invalid previews on job %s", job.get("blob_name"))
+        return {}
+
+
+def get_referenced_output_blobs() -> Set[str]:
+    """All 'processed' blob names still referenced by a job record."""
+    table_client = _get_table_client()
+    entities = table_client.query_entities(
+        "PartitionKey eq 'jobs'",
+        select=["blob_name", "file_type", "processed_blob_name", "renditions", "segments"],
+    )
+
+    referenced: Set[str] = set()
+    for entity in entities:
+        referenced.update(job_output_blobs(dict(entity)))
+    return referenced
+
+
 def get_old_completed_jobs(minutes_old: int = 10) -> list:
     """Get completed jobs older than specified minutes.
 
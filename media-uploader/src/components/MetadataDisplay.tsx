@@ -102,7 +102,7 @@ export default function MetadataDisplay({
   // Handle immediate processing result
   useEffect(() => {
     if (processingResult) {
-      const processedBlobName = blobName.replace('upload-', 'processed-');
+      const processedBlobName = blobName.replace(/^upload-/, 'processed-');
       setMetadata({
         original: {
           name: blobName,
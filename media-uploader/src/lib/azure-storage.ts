@@ -27,6 +27,18 @@ export const generateSasToken = async (blobName: string, containerName: string =
   return sasToken;
 };
 
+// Collision-free, sharded blob name; mirrors processing/naming.py:
+// upload-<shard>-<12 hex ms timestamp><10 random hex>.<ext>
+export const generateUploadBlobName = (fileExtension: string, stepId?: string): string => {
+  const random = Array.from(crypto.getRandomValues(new Uint8Array(5)))
+    .map((byte) => byte.toString(16).padStart(2, '0'))
+    .join('');
+  const blobId = Date.now().toString(16).padStart(12, '0') + random;
+  const shard = random.slice(0, 2);
+  const step = stepId ? `step-${stepId}-` : '';
+  return `upload-${shard}-${step}${blobId}.${fileExtension}`;
+};
+
 // Upload file to Azure Blob Storage
 export const uploadFile = async (file: File, containerName: string = 'uploads'): Promise<string> => {
   const blobServiceClient = getBlobServiceClient();
@@ -36,9 +48,8 @@ export const uploadFile = async (file: File, containerName: string = 'uploads'):
   await containerClient.createIfNotExists();
   
   // Generate unique blob name
-  const timestamp = Date.now();
-  const fileExtension = file.name.split('.').pop();
-  const blobName = `upload-${timestamp}.${fileExtension}`;
+  const fileExtension = (file.name.split('.').pop() || 'unknown').toLowerCase();
+  const blobName = generateUploadBlobName(fileExtension);
   
   const blockBlobClient = containerClient.getBlockBlobClient(blobName);
   
@@ -97,7 +108,7 @@ export const listFiles = async (containerName: string = 'uploads') => {
 
 // Check if processed file exists
 export const checkProcessedFile = async (originalBlobName: string) => {
-  // 1) Preferred pattern: "processed-<timestamp>.<ext>"
+  // 1) Preferred pattern: "processed-<shard>-<id>.<ext>"
   const processedName = originalBlobName.replace(/^upload-/, 'processed-');
   // Also try a WebP variant in case the image was converted (e.g., GIF -> WebP)
   const processedWebp = processedName.replace(/\.[^/.]+$/, '.webp');
@@ -1,24 +1,8 @@
-import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Tuple
 
-from azure.storage.blob import (
-    BlobServiceClient,
-    BlobSasPermissions,
-    generate_blob_sas,
-)
-
-
-def _parse_connection_string(connection_string: str) -> dict:
-    """Parse Azure Storage connection string into a dictionary."""
-    parts = connection_string.split(";")
-    kv_pairs = [p for p in parts if p]
-    result: dict = {}
-    for pair in kv_pairs:
-        if "=" in pair:
-            key, value = pair.split("=", 1)
-            result[key] = value
-    return result
+# The storage backend, blob SDK and signer are imported on first use so that
+# importing the package (e.g. for /api/health) does not pay for them at cold start.
 
 
 def _get_account_info_from_connection_string(connection_string: str) -> Tuple[str, str]:
@@ -26,6 +10,8 @@ def _get_account_info_from_connection_string(connection_string: str) -> Tuple[st
 
     Raises a ValueError if either value is missing.
     """
+    from processing.signing import _parse_connection_string
+
     parsed = _parse_connection_string(connection_string)
     account_name = parsed.get("AccountName")
     account_key = parsed.get("AccountKey")
@@ -34,36 +20,29 @@ def _get_account_info_from_connection_string(connection_string: str) -> Tuple[st
     return account_name, account_key
 
 
-def _get_blob_service_client() -> BlobServiceClient:
-    connection_string = os.environ["AzureWebJobsStorage"]
-    return BlobServiceClient.from_connection_string(connection_string)
-
-
 def generate_processed_blob_sas_url(blob_name: str, expiry_minutes: int = 60) -> str:
     """Generate a time-limited SAS URL for a blob in the 'processed' container.
 
-    This uses the Azure Function's `AzureWebJobsStorage` connection string so that
-    no public access is required on the storage account or container.
+    This uses the Azure Function's `AzureWebJobsStorage` credentials so that
+    no public access is required on the storage account or container. Signed
+    URLs are cached per blob and re-signed shortly before they expire.
     """
-    connection_string = os.environ["AzureWebJobsStorage"]
-    account_name, account_key = _get_account_info_from_connection_string(connection_string)
-
-    blob_service_client = _get_blob_service_client()
-    blob_client = blob_service_client.get_blob_client(container="processed", blob=blob_name)
+    from processing.storage import PROCESSED_CONTAINER, get_storage
 
-    expires_on = datetime.utcnow() + timedelta(minutes=expiry_minutes)
-    permissions = BlobSasPermissions(read=True)
+    url, _ = get_storage().sign_url(PROCESSED_CONTAINER, blob_name, "r", expiry_minutes)
+    return url
 
-    sas = generate_blob_sas(
-        account_name=account_name,
-        container_name="processed",
-        blob_name=blob_name,
-        account_key=account_key,
-        permission=permissions,
-        expiry=expires_on,
-    )
 
-    return f"{blob_client.url}?{sas}"
+def generate_upload_blob_sas_url(blob_name: str, expiry_minutes: int = 15) -> Tuple[str, datetime]:
+    """Generate a short-lived, write-only SAS URL for one blob in 'uploads'.
 
+    The token is scoped to a single blob name and only allows create/write, so
+    clients can PUT their file straight into storage without being able to read
+    or overwrite anything else.
 
+    Returns:
+        Tuple of (url, expires_on)
+    """
+    from processing.storage import UPLOADS_CONTAINER, get_storage
 
+    return get_storage().sign_url(UPLOADS_CONTAINER, blob_name, "cw", expiry_minutes, cache=False)
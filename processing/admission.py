@@ -0,0 +1,183 @@
+"""Pre-decode admission control for uploaded media.
+
+Inspects only the image header (or the ffprobe stream info for videos) and
+decides whether a job is accepted, downgraded to a cheaper processing path,
+or rejected before any pixel data is decoded. Each assessment carries an
+estimated cost in encode-seconds that schedulers can use for ordering.
+"""
+
+import logging
+from typing import BinaryIO, Dict, Optional
+
+from processing.config import get_admission_config
+from processing.mediainfo import frame_rate
+
+
+ACCEPT = "accept"
+DOWNGRADE = "downgrade"
+REJECT = "reject"
+
+
+def _pil_image():
+    """Import Pillow on first use, keeping it out of the function app cold start."""
+    from PIL import Image
+
+    # Keep Pillow's own decompression-bomb guard in line with the configured budget
+    Image.MAX_IMAGE_PIXELS = get_admission_config()["max_image_pixels"]
+    return Image
+
+
+class AdmissionRejected(ValueError):
+    """Raised when a job exceeds the configured pixel/frame budget."""
+
+    def __init__(self, assessment: Dict):
+        super().__init__(assessment.get("reason") or "Media exceeds processing budget")
+        self.assessment = assessment
+
+
+def _decide(pixels_or_budget: float, reject_limit: float, downgrade_limit: float) -> str:
+    if pixels_or_budget > reject_limit:
+        return REJECT
+    if pixels_or_budget > downgrade_limit:
+        return DOWNGRADE
+    return ACCEPT
+
+
+def assess_image(stream: BinaryIO, config: Optional[Dict] = None) -> Dict:
+    """Assess an image from its header without decoding pixel data.
+
+    Args:
+        stream: Seekable binary stream positioned at the start of the image
+        config: Admission config from get_admission_config()
+
+    Returns:
+        Assessment dict with width, height, pixels, action, reason and
+        estimated_cost_seconds. The stream is rewound before returning.
+    """
+    config = config or get_admission_config()
+    Image = _pil_image()
+    position = stream.tell()
+
+    try:
+        # Image.open only parses the header; pixel data is decoded lazily
+        with Image.open(stream) as header:
+            width, height = header.size
+            image_format = header.format
+    except Image.DecompressionBombError as exc:
+        return {
+            "media_type": "image",
+            "action": REJECT,
+            "reason": f"Image rejected by decoder bomb check: {exc}",
+            "estimated_cost_seconds": 0.0,
+        }
+    finally:
+        stream.seek(position)
+
+    pixels = width * height
+    action = _decide(pixels, config["max_image_pixels"], config["downgrade_image_pixels"])
+
+    reason = None
+    if action == REJECT:
+        reason = (
+            f"Image too large: {width}x{height} ({pixels} pixels) exceeds "
+            f"limit of {config['max_image_pixels']} pixels"
+        )
+
+    return {
+        "media_type": "image",
+        "format": image_format,
+        "width": width,
+        "height": height,
+        "pixels": pixels,
+        "action": action,
+        "reason": reason,
+        "estimated_cost_seconds": pixels / config["image_pixels_per_second"],
+    }
+
+
+def assess_video(video_info: Optional[Dict], config: Optional[Dict] = None) -> Dict:
+    """Assess a video from its probed stream info.
+
+    Args:
+        video_info: Stream dict from ffprobe (width, height, duration, nb_frames,
+            avg_frame_rate). None if probing failed.
+        config: Admission config from get_admission_config()
+
+    Returns:
+        Assessment dict with width, height, duration, frames, action, reason
+        and estimated_cost_seconds.
+    """
+    config = config or get_admission_config()
+
+    if not video_info:
+        # Without probe data there is nothing to budget against; let ffmpeg
+        # (and its own timeout) decide.
+        return {
+            "media_type": "video",
+            "action": ACCEPT,
+            "reason": None,
+            "estimated_cost_seconds": 0.0,
+        }
+
+    try:
+        width = int(video_info.get("width") or 0)
+        height = int(video_info.get("height") or 0)
+        duration = float(video_info.get("duration") or 0.0)
+        frames = int(video_info.get("nb_frames") or 0)
+    except (ValueError, TypeError):
+        width = height = frames = 0
+        duration = 0.0
+
+    if not frames and duration:
+        frames = int(duration * frame_rate(video_info))
+
+    pixels_per_frame = width * height
+    total_pixels = pixels_per_frame * frames
+
+    action = _decide(total_pixels, float("inf"), config["downgrade_video_pixels"])
+    reason = None
+    if pixels_per_frame > config["max_video_pixels_per_frame"]:
+        action = REJECT
+        reason = (
+            f"Video resolution too large: {width}x{height} exceeds "
+            f"limit of {config['max_video_pixels_per_frame']} pixels per frame"
+        )
+    elif duration > config["max_video_duration"]:
+        action = REJECT
+        reason = f"Video too long: {duration:.0f}s exceeds limit of {config['max_video_duration']:.0f}s"
+    elif frames > config["max_video_frames"]:
+        action = REJECT
+        reason = f"Video has too many frames: {frames} exceeds limit of {config['max_video_frames']}"
+
+    assessment = {
+        "media_type": "video",
+        "width": width,
+        "height": height,
+        "duration": duration,
+        "frames": frames,
+        "pixels": total_pixels,
+        "action": action,
+        "reason": reason,
+        "estimated_cost_seconds": total_pixels / config["video_pixels_per_second"],
+    }
+
+    if action == DOWNGRADE:
+        assessment["downgrade_profile"] = config["downgrade_video_profile"]
+
+    return assessment
+
+
+def enforce(assessment: Dict) -> Dict:
+    """Raise AdmissionRejected for rejected assessments, log downgrades."""
+    if assessment["action"] == REJECT:
+        logging.warning("Admission rejected: %s", assessment.get("reason"))
+        raise AdmissionRejected(assessment)
+
+    if assessment["action"] == DOWNGRADE:
+        logging.info(
+            "Admission downgraded %s job (estimated cost %.1fs)",
+            assessment.get("media_type"),
+            assessment.get("estimated_cost_seconds", 0.0),
+        )
+
+    return assessment
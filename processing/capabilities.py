@@ -0,0 +1,187 @@
+"""Media toolchain capability probe.
+
+Run once per instance (from /api/warmup or the first-request prewarm): records
+the ffmpeg/ffprobe versions, the available encoders and filters, runs a tiny
+synthetic encode through each candidate H.264 encoder, and round-trips a small
+image through each Pillow codec. Besides the capability map shown in
+/api/health, this loads the ffmpeg binary and its shared libraries before the
+first real video job needs them.
+"""
+
+import io
+import logging
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+# H.264 encoders in order of preference, with the options each one accepts
+H264_ENCODERS: Dict[str, Dict] = {
+    "libx264": {"preset": True, "crf": True, "two_pass": True},
+    "libopenh264": {"preset": False, "crf": False, "two_pass": False},
+}
+
+# Filters the processing pipeline relies on; reported individually
+FILTERS_OF_INTEREST = ["scale", "fps", "select", "thumbnail", "tile", "split", "palettegen", "paletteuse"]
+
+PILLOW_CODECS = ["JPEG", "PNG", "WEBP", "GIF", "BMP"]
+
+PROBE_TIMEOUT = 30
+
+_capabilities: Optional[Dict] = None
+_lock = threading.Lock()
+
+
+def _run(cmd: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+
+
+def _version(binary: str) -> Optional[str]:
+    try:
+        result = _run([binary, "-hide_banner", "-version"])
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0 or not result.stdout:
+        return None
+    # "ffmpeg version 5.1.6-0+deb12u1 Copyright ..." -> "5.1.6-0+deb12u1"
+    words = result.stdout.split()
+    return words[2] if len(words) > 2 and words[1] == "version" else result.stdout.splitlines()[0]
+
+
+def _list_encoders() -> List[str]:
+    result = _run(["ffmpeg", "-hide_banner", "-encoders"])
+    encoders = []
+    in_table = False
+    for line in result.stdout.splitlines():
+        if line.strip().startswith("------"):
+            in_table = True
+            continue
+        parts = line.split()
+        if in_table and len(parts) >= 2:
+            encoders.append(parts[1])
+    return encoders
+
+
+def _list_filters() -> List[str]:
+    result = _run(["ffmpeg", "-hide_banner", "-filters"])
+    # Rows look like " TSC scale             V->V       Scale the input video size ..."
+    return [
+        parts[1]
+        for parts in (line.split() for line in result.stdout.splitlines())
+        if len(parts) >= 3 and "->" in parts[2]
+    ]
+
+
+def _test_encode(encoder: str) -> Dict:
+    """Encode half a second of a 64x64 test pattern; return ok and timing."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", "testsrc=size=64x64:rate=10",
+        "-t", "0.5", "-c:v", encoder, "-pix_fmt", "yuv420p",
+        "-f", "null", "-",
+    ]
+    start = time.perf_counter()
+    try:
+        result = _run(cmd)
+    except (OSError, subprocess.SubprocessError) as exc:
+        return {"ok": False, "error": str(exc)}
+
+    entry = {"ok": result.returncode == 0, "seconds": round(time.perf_counter() - start, 3)}
+    if result.returncode != 0:
+        entry["error"] = result.stderr.strip()[-300:]
+    return entry
+
+
+def _probe_pillow() -> Dict[str, bool]:
+    """Encode and decode a tiny image through each Pillow codec."""
+    from PIL import Image
+
+    codecs = {}
+    sample = Image.new("RGB", (8, 8), (200, 100, 50))
+    for codec in PILLOW_CODECS:
+        try:
+            buffer = io.BytesIO()
+            sample.save(buffer, format=codec)
+            buffer.seek(0)
+            with Image.open(buffer) as decoded:
+                decoded.load()
+            codecs[codec] = True
+        except Exception as exc:
+            logging.warning("Pillow codec %s unavailable: %s", codec, str(exc))
+            codecs[codec] = False
+    return codecs
+
+
+def _probe() -> Dict:
+    start = time.perf_counter()
+    capabilities: Dict = {
+        "ffmpeg_version": _version("ffmpeg"),
+        "ffprobe_version": _version("ffprobe"),
+        "encoders": [],
+        "filters": {},
+        "filter_count": 0,
+        "test_encodes": {},
+        "h264_encoder": None,
+    }
+
+    if capabilities["ffmpeg_version"]:
+        try:
+            encoders = _list_encoders()
+            capabilities["encoders"] = sorted(name for name in encoders if name in H264_ENCODERS or "264" in name)
+            filters = set(_list_filters())
+            capabilities["filters"] = {name: name in filters for name in FILTERS_OF_INTEREST}
+            capabilities["filter_count"] = len(filters)
+            for name in H264_ENCODERS:
+                if name in encoders:
+                    capabilities["test_encodes"][name] = _test_encode(name)
+        except (OSError, subprocess.SubprocessError) as exc:
+            logging.error("ffmpeg capability probe failed: %s", str(exc))
+
+        capabilities["h264_encoder"] = next(
+            (name for name, result in capabilities["test_encodes"].items() if result["ok"]), None
+        )
+    else:
+        logging.error("ffmpeg is not available; video processing will fail")
+
+    try:
+        capabilities["pillow_codecs"] = _probe_pillow()
+    except ImportError as exc:
+        capabilities["pillow_codecs"] = {}
+        logging.error("Pillow is not available: %s", str(exc))
+
+    capabilities["probe_seconds"] = round(time.perf_counter() - start, 3)
+    logging.info(
+        "Media capabilities: ffmpeg %s, H.264 encoder %s, Pillow codecs %s",
+        capabilities["ffmpeg_version"], capabilities["h264_encoder"], capabilities["pillow_codecs"],
+    )
+    return capabilities
+
+
+def probe_capabilities(force: bool = False) -> Dict:
+    """Probe once per process and return the cached capability map."""
+    global _capabilities
+
+    if _capabilities is not None and not force:
+        return _capabilities
+    with _lock:
+        if _capabilities is None or force:
+            _capabilities = _probe()
+        return _capabilities
+
+
+def get_capabilities() -> Dict:
+    """Cached capability map without probing (for cheap health checks)."""
+    return _capabilities if _capabilities is not None else {"probed": False}
+
+
+def select_h264_encoder() -> str:
+    """Best H.264 encoder that passed the synthetic encode.
+
+    Raises:
+        RuntimeError: If ffmpeg is missing or no H.264 encoder works
+    """
+    encoder = probe_capabilities()["h264_encoder"]
+    if encoder is None:
+        raise RuntimeError(f"No working H.264 encoder (tried {', '.join(H264_ENCODERS)}); check the ffmpeg build")
+    return encoder
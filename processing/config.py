@@ -4,6 +4,9 @@ import os
 from typing import Dict, Any
 
 
+# Previews rendered by default, e.g. VIDEO_PREVIEWS=poster,sprite
+_DEFAULT_PREVIEWS = {kind.strip().lower() for kind in os.getenv("VIDEO_PREVIEWS", "").split(",")}
+
 # Default encoding profile for standard compression
 DEFAULT_VIDEO_CONFIG = {
     # Quality settings
@@ -12,6 +15,20 @@ DEFAULT_VIDEO_CONFIG = {
     "max_bitrate": "1200k",  # Maximum bitrate for VBR
     "buffer_size": "2400k",  # Buffer size (2x max_bitrate recommended)
 
+    # Rate control (see processing/ratecontrol.py):
+    #   abr        - target_bitrate, capped at max_bitrate
+    #   capped_crf - constant quality at crf, capped at max_bitrate
+    #   two_pass   - two-pass ABR sized to target_file_size_mb
+    #   auto       - sampled-frame complexity pre-scan picks a capped CRF per clip
+    "rate_control": os.getenv("VIDEO_RATE_CONTROL", "abr"),
+    "crf": int(os.getenv("VIDEO_CRF", "23")),
+    "auto_crf_min": 20,  # used for the most complex clips
+    "auto_crf_max": 30,  # used for static content (screen recordings, slides)
+    "target_file_size_mb": float(os.getenv("VIDEO_TARGET_SIZE_MB", "0")),  # 0 = target_bitrate x duration
+    "min_bitrate": "200k",  # floor for two-pass bitrates
+    "complexity_samples": 3,  # clips sampled by the auto pre-scan
+    "complexity_sample_seconds": 2.0,
+
     # Resolution settings
     "max_width": 1280,
     "max_height": 720,
@@ -23,11 +40,27 @@ DEFAULT_VIDEO_CONFIG = {
     # Processing limits
     "max_processing_time": int(os.getenv("MAX_PROCESSING_TIME", "300")),  # 5 minutes default
 
+    # Long videos are encoded in checkpointed segments that retries resume (see processing/segments.py)
+    "segment_min_duration": float(os.getenv("VIDEO_SEGMENT_MIN_DURATION", "300")),  # seconds; 0 disables
+    "segment_seconds": float(os.getenv("VIDEO_SEGMENT_SECONDS", "60")),
+
     # Audio handling
     "remove_audio": True,  # Remove audio track
 
     # Streaming optimization
     "enable_faststart": True,  # Enable streaming (moov atom at beginning)
+
+    # Previews rendered from the main encode's decode (see processing/previews.py)
+    "poster": "poster" in _DEFAULT_PREVIEWS,  # WebP poster frame
+    "poster_position": 0.1,  # fraction of the duration
+    "sprite": "sprite" in _DEFAULT_PREVIEWS,  # WebP thumbnail sprite + VTT index
+    "sprite_frames": 20,
+    "sprite_columns": 5,
+    "sprite_thumb_width": 160,
+    "preview": "preview" in _DEFAULT_PREVIEWS,  # animated GIF loop
+    "preview_seconds": 3.0,
+    "preview_width": 320,
+    "preview_fps": 10,
 }
 
 
@@ -38,6 +71,9 @@ HIGH_QUALITY_CONFIG = {
     "target_bitrate": "1200k",
     "max_bitrate": "2000k",
     "buffer_size": "4000k",
+    "crf": 21,
+    "auto_crf_min": 18,
+    "auto_crf_max": 27,
 }
 
 
@@ -48,6 +84,10 @@ FAST_CONFIG = {
     "target_bitrate": "600k",
     "max_bitrate": "900k",
     "buffer_size": "1800k",
+    "crf": 26,
+    "auto_crf_min": 23,
+    "auto_crf_max": 32,
+    "complexity_samples": 2,
     "skip_reencoding_if_optimal": True,
 }
 
@@ -98,3 +138,31 @@ def get_video_config(profile: str = "default", **overrides: Any) -> Dict[str, An
     base_config.update(overrides)
 
     return base_config
+
+
+# Admission control limits, checked against the image header / ffprobe output
+# before any pixel data is decoded.
+ADMISSION_CONFIG = {
+    # Images: reject above max_image_pixels, downgrade (draft decode, cheaper
+    # WebP method) above downgrade_image_pixels.
+    "max_image_pixels": int(os.getenv("MAX_IMAGE_PIXELS", str(100_000_000))),  # 100 MP
+    "downgrade_image_pixels": int(os.getenv("DOWNGRADE_IMAGE_PIXELS", str(24_000_000))),  # 24 MP
+
+    # Videos: per-frame resolution, duration and total pixel budget
+    "max_video_pixels_per_frame": int(os.getenv("MAX_VIDEO_PIXELS_PER_FRAME", str(3840 * 2160))),  # 4K
+    "max_video_duration": float(os.getenv("MAX_VIDEO_DURATION", "1800")),  # 30 minutes
+    "max_video_frames": int(os.getenv("MAX_VIDEO_FRAMES", str(30 * 60 * 60))),  # 30 min @ 60 fps
+    "downgrade_video_pixels": int(os.getenv("DOWNGRADE_VIDEO_PIXELS", str(1920 * 1080 * 30 * 300))),  # 5 min of 1080p30
+    "downgrade_video_profile": os.getenv("DOWNGRADE_VIDEO_PROFILE", "fast"),
+
+    # Throughput estimates used to turn pixel counts into encode-seconds
+    "image_pixels_per_second": float(os.getenv("IMAGE_PIXELS_PER_SECOND", str(40_000_000))),
+    "video_pixels_per_second": float(os.getenv("VIDEO_PIXELS_PER_SECOND", str(60_000_000))),
+}
+
+
+def get_admission_config(**overrides: Any) -> Dict[str, Any]:
+    """Get admission control limits with optional overrides."""
+    config = ADMISSION_CONFIG.copy()
+    config.update(overrides)
+    return config
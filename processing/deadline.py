@@ -0,0 +1,197 @@
+"""Per-request deadlines and cancellable ffmpeg/ffprobe runs.
+
+A Deadline is created where a request enters (the HTTP handler, queue or
+event trigger) and travels with the job dict as job["deadline"] through
+download, probe, encode and upload. Stages call check() between steps, and
+external processes run through run_process(), which polls the deadline while
+the process works. Once the deadline passes or is cancelled, the whole
+process group is killed (SIGTERM, then SIGKILL after KILL_GRACE_SECONDS).
+
+Deadlines are cancelled explicitly when the work is no longer wanted, for
+example when the job's lease is lost to another worker. That cancel raises
+LeaseLost instead of DeadlineExceeded, so callers leave the job record to
+its new owner rather than marking it failed. Python HTTP
+functions get no disconnect signal, so a client that hangs up is covered by
+REQUEST_TIMEOUT. That defaults to the 230 s the Azure front end waits
+before dropping the request.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Tuple, Type
+
+if TYPE_CHECKING:
+    from processing.ffmpeg_log import FFmpegLog
+
+
+# Seconds an HTTP request may spend in total (Azure's front end gives up at 230)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "230"))
+# Seconds a queued/event-driven job may take
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))
+# How often a running process checks its deadline
+POLL_INTERVAL = 0.5
+# Seconds between SIGTERM and SIGKILL
+KILL_GRACE_SECONDS = 3.0
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's deadline passed, or its work was cancelled."""
+
+    def __init__(self, stage: str, reason: str):
+        self.stage = stage
+        self.reason = reason
+        super().__init__(f"{reason} during {stage}")
+
+
+class LeaseLost(DeadlineExceeded):
+    """The work was cancelled because another worker took over the job.
+
+    Unlike a timeout, the job is not this worker's to fail: its record
+    belongs to the new owner and must not be written.
+    """
+
+
+class Deadline:
+    """Point in time (monotonic) by which a request's work must be done.
+
+    child() derives a tighter deadline for one stage; cancelling a parent
+    cancels its children too.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["Deadline"] = None):
+        expires_at = time.monotonic() + seconds if seconds is not None else None
+        if parent is not None and parent.expires_at is not None:
+            expires_at = parent.expires_at if expires_at is None else min(expires_at, parent.expires_at)
+        self.expires_at = expires_at
+        self.parent = parent
+        self._cancelled = threading.Event()
+        self._reason: Optional[str] = None
+        self._error: Type[DeadlineExceeded] = DeadlineExceeded
+
+    def child(self, seconds: Optional[float]) -> "Deadline":
+        return Deadline(seconds, parent=self)
+
+    def cancel(self, reason: str = "Cancelled", error: Type[DeadlineExceeded] = DeadlineExceeded) -> None:
+        """Stop the work; check() and run_process() then raise `error`."""
+        if not self._cancelled.is_set():
+            self._reason = reason
+            self._error = error
+            self._cancelled.set()
+            logging.warning("Deadline cancelled: %s", reason)
+
+    def _cancellation(self) -> Optional[Tuple[str, Type[DeadlineExceeded]]]:
+        if self._cancelled.is_set():
+            return self._reason, self._error
+        return self.parent._cancellation() if self.parent is not None else None
+
+    @property
+    def cancel_reason(self) -> Optional[str]:
+        cancellation = self._cancellation()
+        return cancellation[0] if cancellation else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None without a time limit."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for a blocking call: remaining time, optionally capped."""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(cap, remaining)
+
+    @property
+    def expired(self) -> bool:
+        return self.cancel_reason is not None or self.remaining() == 0.0
+
+    def check(self, stage: str) -> None:
+        """Raise DeadlineExceeded (or the cancel's error) if the work should stop before `stage`."""
+        cancellation = self._cancellation()
+        if cancellation is not None:
+            reason, error = cancellation
+            raise error(stage, reason)
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(stage, "Deadline exceeded")
+
+
+def _kill_group(process: subprocess.Popen) -> None:
+    """SIGTERM the process group, SIGKILL it if still alive after the grace period."""
+    for sig, wait in ((signal.SIGTERM, KILL_GRACE_SECONDS), (signal.SIGKILL, None)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(timeout=wait)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_process(
+    cmd: List[str],
+    deadline: Optional[Deadline],
+    stage: str,
+    timeout: Optional[float] = None,
+    text: bool = True,
+    log: Optional["FFmpegLog"] = None,
+) -> subprocess.CompletedProcess:
+    """Run a command like subprocess.run(capture_output=True), but cancellable.
+
+    The command gets its own process group (so helper processes die with
+    it) and is killed once `timeout` or the deadline passes, or the deadline
+    is cancelled.
+
+    With `log`, stdout is discarded and stderr streams into the job's
+    FFmpegLog instead of being buffered; the result's stderr is the log's
+    tail.
+
+    Raises:
+        DeadlineExceeded: The deadline passed or was cancelled (process killed);
+            LeaseLost if it was cancelled because the job's lease was lost
+        subprocess.TimeoutExpired: `timeout` passed first (process killed)
+    """
+    deadline = (deadline or Deadline()).child(timeout)
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.DEVNULL if log is not None else subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=text or log is not None,
+        start_new_session=True,
+    )
+    reader = log.capture(process.stderr, stage) if log is not None else None
+
+    def collect(wait: Optional[float]):
+        if reader is None:
+            # communicate() may be retried after a timeout without losing output
+            return process.communicate(timeout=wait)
+        process.wait(timeout=wait)
+        reader.join()
+        log.finish(process.returncode)
+        return None, log.tail()
+
+    try:
+        while True:
+            try:
+                stdout, stderr = collect(deadline.timeout(POLL_INTERVAL))
+                return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                if not deadline.expired:
+                    continue
+                logging.warning("Killing %s (pid %d) during %s", cmd[0], process.pid, stage)
+                _kill_group(process)
+                collect(None)
+                if deadline.parent is not None and deadline.parent.expired:
+                    deadline.parent.check(stage)
+                raise subprocess.TimeoutExpired(cmd, timeout)
+    except BaseException:
+        # Also covers KeyboardInterrupt/SystemExit: never leave ffmpeg running
+        if process.poll() is None:
+            _kill_group(process)
+        raise
@@ -0,0 +1,138 @@
+"""Bounded capture of ffmpeg's stderr and one summary log event per job.
+
+ffmpeg's stderr for a long encode is mostly progress lines. Logging all of
+it (and holding it in memory until the process exits) made encode logs the
+largest Application Insights cost. A job instead creates one FFmpegLog and
+passes it to every run_process() call:
+
+- stderr is read line by line while ffmpeg runs. Progress lines
+  ("frame= ... fps= ... speed=1.8x") update the stats of the current run and
+  are not kept; other lines go into a ring buffer of RING_LINES lines.
+- emit(), called on leaving a `with FFmpegLog(...)` block, logs a single
+  "FFmpeg summary" line with JSON (per-run stage, return code, frames, fps,
+  speed, final size, seconds). The stderr tail is included only when a run
+  failed.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import IO, Dict, List, Optional
+
+
+# Non-progress stderr lines kept per job
+RING_LINES = int(os.getenv("FFMPEG_LOG_LINES", "100"))
+# Characters of stderr attached to a failure
+TAIL_CHARS = 2000
+
+_FIELD = re.compile(r"(\w+)=\s*(\S+)")
+
+
+def _number(value: str) -> Optional[float]:
+    match = re.match(r"[\d.]+", value)
+    try:
+        return float(match.group()) if match else None
+    except ValueError:
+        return None
+
+
+def parse_progress(line: str) -> Optional[Dict]:
+    """Stats from an ffmpeg progress line, or None for any other line."""
+    fields = dict(_FIELD.findall(line))
+    if "time" not in fields or not ("frame" in fields or "size" in fields):
+        return None
+
+    stats: Dict = {"time": fields["time"]}
+    for key in ("frame", "fps", "speed", "bitrate"):
+        if key in fields:
+            stats[key] = _number(fields[key])
+    if "size" in fields:
+        # "1024kB" / "1024KiB"; "N/A" for outputs without a size (e.g. null)
+        stats["size_kb"] = _number(fields["size"])
+    return stats
+
+
+class FFmpegLog:
+    """stderr ring buffer and per-run stats for all ffmpeg runs of one job."""
+
+    def __init__(self, name: str, max_lines: int = RING_LINES):
+        self.name = name
+        self.runs: List[Dict] = []
+        self.dropped = 0
+        self._lines: deque = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+
+    def feed(self, line: str, run: Dict) -> None:
+        line = line.rstrip()
+        if not line:
+            return
+        stats = parse_progress(line)
+        with self._lock:
+            if stats is not None:
+                run["progress"] = stats
+                return
+            if len(self._lines) == self._lines.maxlen:
+                self.dropped += 1
+            self._lines.append(f"[{run['stage']}] {line}")
+
+    def capture(self, stream: IO, stage: str) -> threading.Thread:
+        """Start reading a process's stderr (text mode) in a thread."""
+        run = {"stage": stage, "started": time.monotonic()}
+        with self._lock:
+            self.runs.append(run)
+
+        def read() -> None:
+            # Text mode translates ffmpeg's \r-separated progress updates to lines
+            for line in stream:
+                self.feed(line, run)
+            stream.close()
+
+        thread = threading.Thread(target=read, name=f"ffmpeg-log-{stage}", daemon=True)
+        thread.start()
+        return thread
+
+    def finish(self, returncode: Optional[int]) -> None:
+        """Record the exit of the latest run."""
+        with self._lock:
+            run = self.runs[-1]
+            run["returncode"] = returncode
+            run["seconds"] = round(time.monotonic() - run.pop("started"), 2)
+
+    def tail(self, chars: int = TAIL_CHARS) -> str:
+        with self._lock:
+            return "\n".join(self._lines)[-chars:]
+
+    @property
+    def failed(self) -> bool:
+        return any(run.get("returncode") not in (0, None) for run in self.runs)
+
+    def summary(self) -> Dict:
+        with self._lock:
+            summary: Dict = {
+                "job": self.name,
+                "runs": [
+                    {key: value for key, value in run.items() if key != "started"}
+                    for run in self.runs
+                ],
+                "stderr_lines_dropped": self.dropped,
+            }
+        if self.failed:
+            summary["stderr_tail"] = self.tail()
+        return summary
+
+    def emit(self) -> None:
+        """Log the job's single summary event (WARNING if a run failed)."""
+        if not self.runs:
+            return
+        level = logging.WARNING if self.failed else logging.INFO
+        logging.log(level, "FFmpeg summary: %s", json.dumps(self.summary(), default=str))
+
+    def __enter__(self) -> "FFmpegLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.emit()
@@ -1,61 +1,164 @@
 import io
 import os
 import time
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
 from PIL import Image
-from azure.storage.blob import BlobServiceClient, ContentSettings
-from azure.core.exceptions import ResourceExistsError
-from processing import generate_processed_blob_sas_url
+from processing.admission import DOWNGRADE, assess_image, enforce
+from processing.deadline import Deadline
+from processing.naming import processed_blob_name
+from processing.previews import upload_outputs
+from processing.retention import EXPIRY_TAG, expiry_tags
+from processing.scheduler import ENCODE_QUEUE_TIMEOUT, PRIORITY_INTERACTIVE, encode_slot
+from processing.storage import UPLOADS_CONTAINER, get_storage
 
 
-def process_image(blob_name: str, job: Dict) -> Dict:
-    """Process image compression and upload to 'processed' container."""
-    start_time = time.time()
+# Width ladder for responsive variants ("srcset" request), e.g. 320,640,1024,2048
+SRCSET_WIDTHS = sorted({int(w) for w in os.getenv("IMAGE_SRCSET_WIDTHS", "320,640,1024,2048").split(",") if w.strip().isdigit()})
+# Produce the variants for every image, not only when requested
+SRCSET_DEFAULT = os.getenv("IMAGE_SRCSET", "false").lower() == "true"
+
+
+def parse_variant_request(value: Optional[str]) -> List[int]:
+    """Variant widths for a request field: "srcset" for the default ladder, or explicit widths ("320,640")."""
+    tokens = [token.strip().lower() for token in (value or "").split(",")]
+    widths = {int(token) for token in tokens if token.isdigit() and 0 < int(token) <= 2048}
+    if "srcset" in tokens or (not widths and SRCSET_DEFAULT):
+        widths.update(SRCSET_WIDTHS)
+    return sorted(widths)
+
+
+def _variant_ladder(image: Image.Image, widths: List[int]) -> List[Image.Image]:
+    """Downscaled copies of `image` for each width below its own, largest first.
+
+    Each level is resized from the one above it, so a step only reads that
+    level's pixels instead of the full-size image.
+    """
+    levels = []
+    current = image
+    for width in sorted(set(widths), reverse=True):
+        if width >= current.width:
+            # Served by the larger image itself
+            continue
+        height = max(1, round(current.height * width / current.width))
+        current = current.resize((width, height), Image.Resampling.LANCZOS)
+        levels.append(current)
+    return levels
 
-    blob_service = BlobServiceClient.from_connection_string(
-        os.environ["AzureWebJobsStorage"]
-    )
 
-    original_blob = blob_service.get_blob_client(
-        container="uploads", blob=blob_name
-    ).download_blob()
+def _encode_webp(image: Image.Image, save_kwargs: Dict) -> bytes:
+    output_buffer = io.BytesIO()
+    image.save(output_buffer, format="WebP", **save_kwargs)
+    return output_buffer.getvalue()
+
+
+def _compress_image(
+    image_stream: io.BytesIO, downgraded: bool, widths: Optional[List[int]] = None
+) -> Tuple[bytes, str, List[Dict]]:
+    """Decode, resize and re-encode an image as WebP, plus optional width variants.
+
+    The image is decoded once; the variants are downsampled from it level by
+    level and all outputs are encoded in parallel.
 
-    image_data = original_blob.readall()
-    original_image = Image.open(io.BytesIO(image_data))
+    Returns:
+        Tuple of (compressed bytes, output format, variants with width,
+        height and data, smallest first)
+    """
+    original_image = Image.open(image_stream)
 
     # Always convert to WebP for optimal web compression
     output_format = "WebP"
     save_kwargs = {"quality": 80, "method": 6}  # method 6 = best compression
 
     max_dimension = 2048
+    if downgraded:
+        # JPEG can decode directly at 1/2, 1/4 or 1/8 scale; other formats
+        # ignore the draft request. Trade a little compression for speed.
+        original_image.draft("RGB", (max_dimension, max_dimension))
+        save_kwargs["method"] = 4
+
+    # Convert before resizing: Pillow resizes palette images with nearest
+    # neighbour only, which would leave the downscaled output and variants blocky
+    if original_image.mode == 'P':
+        # Preserve transparency if present (RGB is smaller otherwise)
+        original_image = original_image.convert('RGBA' if 'transparency' in original_image.info else 'RGB')
+    elif original_image.mode not in ('RGB', 'RGBA', 'LA'):
+        original_image = original_image.convert('RGB')
+
     if max(original_image.size) > max_dimension:
         original_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
 
-    # Convert RGBA to RGB if needed (WebP supports both, but RGB is smaller)
-    if original_image.mode in ('RGBA', 'LA', 'P'):
-        # Preserve transparency if present
-        if original_image.mode == 'P' and 'transparency' in original_image.info:
-            original_image = original_image.convert('RGBA')
-    elif original_image.mode != 'RGB':
-        original_image = original_image.convert('RGB')
+    images = [original_image] + _variant_ladder(original_image, widths or [])
+    with ThreadPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as pool:
+        encoded = list(pool.map(lambda image: _encode_webp(image, save_kwargs), images))
 
-    output_buffer = io.BytesIO()
-    original_image.save(output_buffer, format=output_format, **save_kwargs)
-    compressed_data = output_buffer.getvalue()
-
-    # Change extension to .webp
-    output_blob_name = blob_name.replace('upload-', 'processed-').rsplit('.', 1)[0] + '.webp'
-    # Ensure 'processed' container exists
-    try:
-        blob_service.get_container_client("processed").create_container()
-    except ResourceExistsError:
-        pass
-    blob_service.get_blob_client(container="processed", blob=output_blob_name).upload_blob(
-        compressed_data,
-        overwrite=True,
-        content_settings=ContentSettings(content_type='image/webp')
-    )
+    variants = [
+        {"width": image.width, "height": image.height, "data": data}
+        for image, data in zip(images[1:], encoded[1:])
+    ]
+    return encoded[0], output_format, variants[::-1]
+
+
+def process_image(blob_name: str, job: Dict) -> Dict:
+    """Process image compression and upload to 'processed' container.
+
+    job["deadline"] (optional) is checked before each stage. With
+    job["variant_widths"] (parse_variant_request), downscaled variants are
+    uploaded alongside and returned as a srcset list.
+    """
+    start_time = time.time()
+
+    storage = get_storage()
+    deadline = job.get("deadline") or Deadline()
+
+    deadline.check("download")
+    image_data = storage.read(UPLOADS_CONTAINER, blob_name)
+    image_stream = io.BytesIO(image_data)
+
+    # Reject/downgrade oversized images from the header alone, before decoding
+    assessment = enforce(assess_image(image_stream))
+    downgraded = assessment["action"] == DOWNGRADE
+
+    deadline.check("encode")
+    widths = job.get("variant_widths") or []
+    cost = assessment["estimated_cost_seconds"]
+    # Variant encodes add cost in proportion to their pixels relative to the 2048 px output
+    cost *= 1 + sum((width / 2048) ** 2 for width in widths if width < 2048)
+    with encode_slot(job, cost, PRIORITY_INTERACTIVE, deadline.timeout(ENCODE_QUEUE_TIMEOUT)) as queue_wait:
+        compressed_data, output_format, variants = _compress_image(image_stream, downgraded, widths)
+
+    deadline.check("upload")
+    # Same name in the 'processed' container, with a .webp extension;
+    # variants add the width ("<name>.w640.webp"). All upload in parallel.
+    output_blob_name = processed_blob_name(blob_name, "webp")
+    for variant in variants:
+        variant["kind"] = f"w{variant['width']}"
+        variant["blob_name"] = processed_blob_name(blob_name, f"w{variant['width']}.webp")
+    tags = expiry_tags()
+    uploaded = upload_outputs(storage, [
+        {"kind": "image", "data": compressed_data, "blob_name": output_blob_name, "content_type": "image/webp"},
+        *({**variant, "content_type": "image/webp"} for variant in variants),
+    ], tags)
+
+    # Variants are stored like video previews: kind -> blob_name/url (+ dimensions)
+    previews = {
+        variant["kind"]: {
+            **uploaded[variant["kind"]],
+            "width": variant["width"],
+            "height": variant["height"],
+            "size": len(variant["data"]),
+        }
+        for variant in variants
+    }
+    srcset = list(previews.values())
+    if variants:
+        # The full-size output is the widest candidate (open() only reads the header)
+        with Image.open(io.BytesIO(compressed_data)) as output_image:
+            srcset.append({
+                **uploaded["image"], "width": output_image.width, "height": output_image.height,
+                "size": len(compressed_data),
+            })
 
     return {
         "status": "success",
@@ -63,9 +166,20 @@ def process_image(blob_name: str, job: Dict) -> Dict:
         "compressed_size": len(compressed_data),
         "compression_ratio": len(compressed_data) / float(len(image_data) or 1),
         # Provide SAS URL for secure, time-limited access
-        "output_url": generate_processed_blob_sas_url(output_blob_name),
+        "output_url": uploaded["image"]["url"],
+        "processed_blob_name": output_blob_name,
+        # When the expiry sweep deletes the outputs
+        "output_expires_at": tags[EXPIRY_TAG],
+        # Every blob written to the 'processed' container for this job
+        "renditions": [output_blob_name] + [variant["blob_name"] for variant in variants],
+        # Width variants: kind ("w640") -> blob_name/url/width/height/size
+        "previews": previews,
+        # Smallest to largest, for <img srcset="url 320w, ...">
+        "srcset": srcset,
         "processing_time": time.time() - start_time,
         "format": output_format,
+        "admission": assessment,
+        "queue_wait": queue_wait,
     }
 
 
@@ -0,0 +1,229 @@
+"""Chunked, resumable ingestion into the 'uploads' container.
+
+Clients stage fixed-size chunks as uncommitted blocks on the target blob and
+commit the block list once all chunks are in. Azure keeps uncommitted blocks
+for seven days (the local backend until they are committed), so a client that
+loses its connection asks for the staged block list and re-sends only what is
+missing. Only one chunk is ever held in memory per request and the size limit
+is enforced as blocks arrive.
+
+The upload session itself (who started it, whether it is being committed)
+is the job record; see tracking.get_upload_session and begin_upload_commit.
+"""
+
+import logging
+import os
+import re
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from processing import naming
+from processing.storage import UPLOADS_CONTAINER, get_storage
+
+
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(4 * 1024 * 1024)))  # 4MB
+MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", str(8 * 1024 * 1024)))  # 8MB
+MAX_BLOCKS = 50000  # Azure block blob limit
+
+VIDEO_EXTENSIONS = ["mp4", "mov", "avi", "webm", "flv", "wmv"]
+IMAGE_EXTENSIONS = ["jpg", "jpeg", "png", "gif", "bmp", "webp"]
+ALLOWED_EXTENSIONS = VIDEO_EXTENSIONS + IMAGE_EXTENSIONS
+
+STEP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class InvalidUpload(ValueError):
+    """Raised for malformed chunked upload requests."""
+
+
+class UploadNotFound(InvalidUpload):
+    """Raised for an upload that does not exist or belongs to another API key."""
+
+
+class UploadTooLarge(ValueError):
+    """Raised when staged data would exceed the upload size limit."""
+
+
+def get_extension(filename: str) -> str:
+    return filename.lower().split(".")[-1] if "." in filename else "unknown"
+
+
+def output_extension(file_extension: str) -> str:
+    """Extension of the processed output: videos become MP4, images WebP."""
+    return "mp4" if file_extension in VIDEO_EXTENSIONS else "webp"
+
+
+def _parse_block_index(value) -> int:
+    try:
+        index = int(value)
+    except (TypeError, ValueError):
+        raise InvalidUpload(f"Invalid block_id: {value}")
+    if index < 0 or index >= MAX_BLOCKS:
+        raise InvalidUpload(f"block_id must be between 0 and {MAX_BLOCKS - 1}")
+    return index
+
+
+def _validate_upload_blob_name(blob_name: str) -> str:
+    if not blob_name or not blob_name.startswith(naming.UPLOAD_PREFIX) or "/" in blob_name:
+        raise InvalidUpload(f"Invalid upload blob name: {blob_name}")
+    if get_extension(blob_name) not in ALLOWED_EXTENSIONS:
+        raise InvalidUpload(f"Unsupported file type: {get_extension(blob_name)}")
+    return blob_name
+
+
+def new_upload_blob_name(filename: str, step_id: Optional[str] = None) -> str:
+    """Validate the client filename and allocate an 'uploads' blob name for it.
+
+    Args:
+        filename: Original client filename (used for the extension)
+        step_id: Optional SIMPI step ID to embed in the name
+    """
+    file_extension = get_extension(filename)
+    if file_extension not in ALLOWED_EXTENSIONS:
+        raise InvalidUpload(
+            f"Unsupported file type: {file_extension}. Supported: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+    if step_id and not STEP_ID_PATTERN.match(step_id):
+        raise InvalidUpload("step_id may only contain letters, digits, '-' and '_' (max 64)")
+    return naming.new_upload_blob_name(file_extension, step_id)
+
+
+def start_chunked_upload(filename: str, step_id: Optional[str] = None) -> Dict:
+    """Allocate a blob name for a new chunked upload.
+
+    Args:
+        filename: Original client filename (used for the extension)
+        step_id: Optional SIMPI step ID to embed in the name
+
+    Returns:
+        Dict with blob_name, chunk_size, max_chunk_size and max_size
+    """
+    blob_name = new_upload_blob_name(filename, step_id)
+    logging.info("Started chunked upload: %s", blob_name)
+
+    return {
+        "blob_name": blob_name,
+        "chunk_size": CHUNK_SIZE,
+        "max_chunk_size": MAX_CHUNK_SIZE,
+        "max_size": MAX_UPLOAD_SIZE,
+    }
+
+
+def stage_chunk(blob_name: str, block_id, data: bytes) -> Dict:
+    """Stage one chunk as an uncommitted block.
+
+    Re-sending an already staged block_id replaces it, so retries are safe.
+
+    Args:
+        blob_name: Blob name returned by start_chunked_upload()
+        block_id: Zero-based chunk index
+        data: Chunk payload
+
+    Returns:
+        Dict with block_id, size and total staged bytes
+    """
+    index = _parse_block_index(block_id)
+    if not data:
+        raise InvalidUpload("Chunk body is empty")
+    if len(data) > MAX_CHUNK_SIZE:
+        raise UploadTooLarge(f"Chunk too large. Maximum chunk size is {MAX_CHUNK_SIZE} bytes.")
+
+    storage = get_storage()
+    staged = storage.staged_blocks(UPLOADS_CONTAINER, _validate_upload_blob_name(blob_name))
+    staged.pop(index, None)
+    total = sum(staged.values()) + len(data)
+    if total > MAX_UPLOAD_SIZE:
+        raise UploadTooLarge("File too large. Maximum size is 100MB.")
+
+    storage.stage_block(UPLOADS_CONTAINER, blob_name, index, data)
+
+    return {"blob_name": blob_name, "block_id": index, "size": len(data), "staged_size": total}
+
+
+def get_upload_progress(blob_name: str) -> Dict:
+    """List staged blocks so an interrupted client can resume.
+
+    Returns:
+        Dict with blob_name, staged blocks (block_id, size) and staged_size
+    """
+    staged = get_storage().staged_blocks(UPLOADS_CONTAINER, _validate_upload_blob_name(blob_name))
+    return {
+        "blob_name": blob_name,
+        "blocks": [{"block_id": index, "size": size} for index, size in sorted(staged.items())],
+        "staged_size": sum(staged.values()),
+    }
+
+
+def commit_chunked_upload(blob_name: str, block_ids: List) -> int:
+    """Commit staged blocks in the given order.
+
+    Args:
+        blob_name: Blob name returned by start_chunked_upload()
+        block_ids: Ordered chunk indexes making up the file
+
+    Returns:
+        Committed blob size in bytes
+    """
+    if not block_ids:
+        raise InvalidUpload("block_ids is required")
+
+    indexes = [_parse_block_index(block_id) for block_id in block_ids]
+    if len(set(indexes)) != len(indexes):
+        raise InvalidUpload("block_ids must not contain duplicates")
+
+    storage = get_storage()
+    staged = storage.staged_blocks(UPLOADS_CONTAINER, _validate_upload_blob_name(blob_name))
+
+    missing = [index for index in indexes if index not in staged]
+    if missing:
+        raise InvalidUpload(f"Blocks not staged: {missing}")
+
+    file_size = sum(staged[index] for index in indexes)
+    if file_size > MAX_UPLOAD_SIZE:
+        raise UploadTooLarge("File too large. Maximum size is 100MB.")
+
+    storage.commit_blocks(UPLOADS_CONTAINER, blob_name, indexes)
+    logging.info("Committed chunked upload %s (%d blocks, %d bytes)", blob_name, len(indexes), file_size)
+
+    return file_size
+
+
+def stage_stream(
+    blob_name: str,
+    stream: BinaryIO,
+    max_size: int = MAX_UPLOAD_SIZE,
+    on_first_chunk: Optional[Callable[[bytes], None]] = None,
+) -> int:
+    """Upload a stream as staged blocks, enforcing max_size as data arrives.
+
+    Args:
+        blob_name: Target blob in the 'uploads' container
+        stream: Readable binary stream
+        max_size: Maximum total size in bytes
+        on_first_chunk: Optional callback receiving the first chunk (e.g. for
+            header checks) before anything is staged
+
+    Returns:
+        Total bytes uploaded
+    """
+    storage = get_storage()
+    indexes: List[int] = []
+    total = 0
+
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+
+        total += len(chunk)
+        if total > max_size:
+            raise UploadTooLarge(f"File too large. Maximum size is {max_size // (1024 * 1024)}MB.")
+
+        if not indexes and on_first_chunk:
+            on_first_chunk(chunk)
+
+        storage.stage_block(UPLOADS_CONTAINER, blob_name, len(indexes), chunk)
+        indexes.append(len(indexes))
+
+    storage.commit_blocks(UPLOADS_CONTAINER, blob_name, indexes)
+    return total
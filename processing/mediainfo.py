@@ -0,0 +1,30 @@
+"""Helpers over ffprobe stream info shared by admission, rate control and previews."""
+
+from fractions import Fraction
+from typing import Dict, Tuple
+
+
+def frame_rate(video_info: Dict) -> float:
+    """Frames per second from avg_frame_rate (or r_frame_rate); 30 if unknown."""
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        value = video_info.get(key)
+        if not value:
+            continue
+        try:
+            rate = float(Fraction(value))
+        except (ValueError, ZeroDivisionError):
+            continue
+        if rate > 0:
+            return rate
+    return 30.0
+
+
+def output_dimensions(video_info: Dict, config: Dict) -> Tuple[int, int]:
+    """Even width/height of the encoded video after scaling into max_width x max_height."""
+    width = int(video_info.get("width") or 0)
+    height = int(video_info.get("height") or 0)
+    if not width or not height:
+        return config.get("max_width", 1280), config.get("max_height", 720)
+
+    scale = min(1.0, config.get("max_width", 1280) / width, config.get("max_height", 720) / height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
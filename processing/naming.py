@@ -0,0 +1,67 @@
+"""Blob naming for uploads and their processed outputs.
+
+Upload names look like
+
+    upload-<shard>-<id>.<ext>
+    upload-<shard>-step-<step_id>-<id>.<ext>
+
+where <id> is a 12-hex-digit millisecond timestamp followed by 10 random hex
+digits (sortable by creation time, unique across concurrent uploads) and
+<shard> is two hex digits taken from the random part. The shard spreads
+writes over 256 key ranges, so Azure Storage can split the container across
+partition servers instead of appending every upload to one hot range.
+
+Processed outputs keep the upload name with the "upload-" prefix swapped for
+"processed-" and the extension of the output format.
+"""
+
+import secrets
+import time
+from typing import Optional
+
+
+UPLOAD_PREFIX = "upload-"
+PROCESSED_PREFIX = "processed-"
+
+
+def new_blob_id() -> str:
+    """Time-sortable unique ID: 12 hex digits of epoch ms + 10 random hex digits."""
+    return f"{int(time.time() * 1000):012x}{secrets.token_hex(5)}"
+
+
+def new_upload_blob_name(file_extension: str, step_id: Optional[str] = None) -> str:
+    """Allocate a collision-free, sharded blob name in the 'uploads' container.
+
+    Args:
+        file_extension: Extension without the dot (mp4, png, ...)
+        step_id: Optional SIMPI step ID, kept recoverable by
+            extract_step_id_from_blob_name()
+
+    Returns:
+        Blob name such as upload-3f-0192a3b4c5d63f9e0a1b2c.png
+    """
+    blob_id = new_blob_id()
+    shard = blob_id[12:14]
+    if step_id:
+        return f"{UPLOAD_PREFIX}{shard}-step-{step_id}-{blob_id}.{file_extension}"
+    return f"{UPLOAD_PREFIX}{shard}-{blob_id}.{file_extension}"
+
+
+def processed_blob_name(blob_name: str, extension: Optional[str] = None) -> str:
+    """Name of the processed output for an upload blob.
+
+    Args:
+        blob_name: Name in the 'uploads' container
+        extension: Output extension (webp, mp4, ...); keeps the original if None
+
+    Returns:
+        Name in the 'processed' container
+    """
+    name = blob_name
+    if name.startswith(UPLOAD_PREFIX):
+        name = PROCESSED_PREFIX + name[len(UPLOAD_PREFIX):]
+
+    if extension:
+        name = name.rsplit(".", 1)[0] + "." + extension
+
+    return name
@@ -0,0 +1,241 @@
+"""Poster frame, thumbnail sprite and preview loop for processed videos.
+
+The previews are extra outputs of the main ffmpeg encode: the scaled video is
+split inside one filter graph and each branch feeds its own output, so the
+input is decoded once no matter how many previews are requested.
+
+- poster:  one frame at `poster_position` of the duration, stored as WebP
+- sprite:  `sprite_frames` evenly spaced thumbnails tiled into one WebP, plus
+           a WebVTT index whose cues point at each tile with #xywh= fragments
+- preview: a `preview_seconds` animated GIF loop (palettegen/paletteuse)
+
+ffmpeg writes the still images as PNG (always built in); Pillow converts them
+to WebP like the image pipeline does.
+"""
+
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from processing import generate_processed_blob_sas_url
+from processing.mediainfo import output_dimensions
+from processing.naming import processed_blob_name
+from processing.retention import expiry_tags
+from processing.storage import PROCESSED_CONTAINER, StorageBackend
+
+
+PREVIEW_KINDS = ("poster", "sprite", "preview")
+
+WEBP_QUALITY = 80
+
+
+def parse_preview_request(value: Optional[str]) -> Dict[str, bool]:
+    """Config overrides for a "poster,sprite,preview" request field."""
+    requested = {kind.strip().lower() for kind in (value or "").split(",")}
+    return {kind: True for kind in PREVIEW_KINDS if kind in requested}
+
+
+def _timestamp(seconds: float) -> str:
+    """WebVTT cue timestamp (HH:MM:SS.mmm)."""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def plan_previews(config: Dict, video_info: Optional[Dict], workdir: str) -> List[Dict]:
+    """Preview outputs enabled in config, with their filter chains.
+
+    Each output has a kind, the path ffmpeg writes, the filter applied to its
+    branch of the split and the ffmpeg output options.
+    """
+    video_info = video_info or {}
+    duration = float(video_info.get("duration") or 0.0)
+    width, height = output_dimensions(video_info, config)
+    outputs: List[Dict] = []
+
+    if config.get("poster"):
+        position = duration * float(config.get("poster_position", 0.1))
+        outputs.append({
+            "kind": "poster",
+            "path": os.path.join(workdir, "poster.png"),
+            "filter": f"trim=start={position:.3f},setpts=PTS-STARTPTS",
+            "args": ["-frames:v", "1", "-c:v", "png"],
+        })
+
+    if config.get("sprite"):
+        frames = max(1, int(config.get("sprite_frames", 20)))
+        columns = max(1, min(frames, int(config.get("sprite_columns", 5))))
+        rows = math.ceil(frames / columns)
+        thumb_width = int(config.get("sprite_thumb_width", 160)) // 2 * 2
+        thumb_height = max(2, int(thumb_width * height / width) // 2 * 2)
+        interval = duration / frames if duration > 0 else 1.0
+        outputs.append({
+            "kind": "sprite",
+            "path": os.path.join(workdir, "sprite.png"),
+            "filter": f"fps=1/{interval:.4f},scale={thumb_width}:{thumb_height},tile={columns}x{rows}",
+            "args": ["-frames:v", "1", "-c:v", "png"],
+            "cues": [
+                {
+                    "start": index * interval,
+                    "end": (index + 1) * interval,
+                    "x": (index % columns) * thumb_width,
+                    "y": (index // columns) * thumb_height,
+                    "w": thumb_width,
+                    "h": thumb_height,
+                }
+                for index in range(frames)
+            ],
+        })
+
+    if config.get("preview"):
+        seconds = float(config.get("preview_seconds", 3.0))
+        start = min(duration * 0.1, max(0.0, duration - seconds))
+        outputs.append({
+            "kind": "preview",
+            "path": os.path.join(workdir, "preview.gif"),
+            "filter": (
+                f"trim=start={start:.3f}:duration={seconds:.3f},setpts=PTS-STARTPTS,"
+                f"fps={config.get('preview_fps', 10)},scale={config.get('preview_width', 320)}:-2,"
+                "split[preview_a][preview_b];[preview_a]palettegen=stats_mode=diff[preview_palette];"
+                "[preview_b][preview_palette]paletteuse=dither=bayer"
+            ),
+            "args": ["-loop", "0"],
+        })
+
+    return outputs
+
+
+def filter_graph(main_filter: Optional[str], outputs: List[Dict]) -> Tuple[str, str]:
+    """Filter graph feeding the main output and every preview from one decode.
+
+    Args:
+        main_filter: Scale filter of the main encode, or None for stream copy
+        outputs: Preview outputs from plan_previews()
+
+    Returns:
+        Tuple of (-filter_complex value, -map value for the main output)
+    """
+    labels = [f"{output['kind']}_in" for output in outputs]
+    if main_filter:
+        labels.insert(0, "main")
+        head = f"[0:v]{main_filter},split={len(labels)}"
+    else:
+        head = f"[0:v]split={len(labels)}"
+
+    chains = [head + "".join(f"[{label}]" for label in labels)]
+    chains.extend(f"[{output['kind']}_in]{output['filter']}[{output['kind']}]" for output in outputs)
+    return ";".join(chains), "[main]" if main_filter else "0:v"
+
+
+def output_args(outputs: List[Dict]) -> List[str]:
+    """ffmpeg options and paths for the preview outputs (after the main output)."""
+    args: List[str] = []
+    for output in outputs:
+        args.extend(["-map", f"[{output['kind']}]", *output["args"], output["path"]])
+    return args
+
+
+def _to_webp(png_path: str) -> str:
+    from PIL import Image
+
+    webp_path = png_path.rsplit(".", 1)[0] + ".webp"
+    with Image.open(png_path) as image:
+        image.save(webp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+    return webp_path
+
+
+def finalize_previews(outputs: List[Dict], blob_name: str) -> List[Dict]:
+    """Convert the ffmpeg outputs into the files to upload.
+
+    Args:
+        outputs: Preview outputs from plan_previews(), already written by ffmpeg
+        blob_name: Upload blob name the previews belong to
+
+    Returns:
+        List of dicts with kind, path, blob_name and content_type
+    """
+    files: List[Dict] = []
+    for output in outputs:
+        kind = output["kind"]
+        if not os.path.exists(output["path"]) or not os.path.getsize(output["path"]):
+            logging.warning("ffmpeg produced no %s output; skipping it", kind)
+            continue
+
+        if kind == "preview":
+            files.append({
+                "kind": kind,
+                "path": output["path"],
+                "blob_name": processed_blob_name(blob_name, "preview.gif"),
+                "content_type": "image/gif",
+            })
+            continue
+
+        image_blob = processed_blob_name(blob_name, f"{kind}.webp")
+        files.append({
+            "kind": kind,
+            "path": _to_webp(output["path"]),
+            "blob_name": image_blob,
+            "content_type": "image/webp",
+        })
+
+        if kind == "sprite":
+            # The container is private, so cues carry the sprite's signed URL;
+            # a relative name would resolve to an unsigned URL (403)
+            sprite_url = generate_processed_blob_sas_url(image_blob)
+            vtt_path = output["path"].rsplit(".", 1)[0] + ".vtt"
+            with open(vtt_path, "w", encoding="utf-8") as fh:
+                fh.write("WEBVTT\n")
+                for cue in output["cues"]:
+                    fh.write(
+                        f"\n{_timestamp(cue['start'])} --> {_timestamp(cue['end'])}\n"
+                        f"{sprite_url}#xywh={cue['x']},{cue['y']},{cue['w']},{cue['h']}\n"
+                    )
+            files.append({
+                "kind": "sprite_vtt",
+                "path": vtt_path,
+                "blob_name": processed_blob_name(blob_name, "sprite.vtt"),
+                "content_type": "text/vtt",
+            })
+
+    return files
+
+
+def upload_outputs(
+    storage: StorageBackend, files: List[Dict], tags: Optional[Dict[str, str]] = None
+) -> Dict[str, Dict]:
+    """Upload files to the 'processed' container in parallel.
+
+    Args:
+        storage: Backend from get_storage()
+        files: Dicts with kind, path (or data bytes), blob_name and optional content_type
+        tags: Blob index tags for every file (default: expiry_tags())
+
+    Returns:
+        Dict of kind -> {"blob_name", "url"} (SAS URL)
+    """
+    tags = tags or expiry_tags()
+
+    def upload(file: Dict) -> None:
+        if "data" in file:
+            storage.write(
+                PROCESSED_CONTAINER, file["blob_name"], file["data"],
+                content_type=file.get("content_type"), tags=tags,
+            )
+            return
+        storage.write_file(
+            PROCESSED_CONTAINER, file["blob_name"], file["path"],
+            content_type=file.get("content_type"), tags=tags,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, len(files))) as pool:
+        # list() re-raises the first upload error
+        list(pool.map(upload, files))
+
+    return {
+        file["kind"]: {"blob_name": file["blob_name"], "url": generate_processed_blob_sas_url(file["blob_name"])}
+        for file in files
+    }
@@ -0,0 +1,189 @@
+"""Rate-control planning for H.264 encodes.
+
+A plan is chosen per clip from the profile's `rate_control` mode:
+
+- abr:        fixed target_bitrate/max_bitrate (the original behaviour)
+- capped_crf: constant quality at `crf`, with max_bitrate as a VBV cap so
+              high-motion peaks cannot blow up the file
+- two_pass:   two-pass ABR at the bitrate that lands on target_file_size_mb
+              for the clip's duration
+- auto:       encodes a few short sampled clips at a probe CRF and uses the
+              resulting bits per pixel as a complexity measure; static content
+              (screen recordings, slides) gets a high CRF, high motion a low
+              one, both capped at max_bitrate
+
+Modes the selected encoder cannot do (CRF and two-pass need libx264) fall back
+to abr; the plan records both the requested and the effective mode.
+"""
+
+import logging
+import math
+import subprocess
+from typing import Dict, List, Optional
+
+from processing.capabilities import H264_ENCODERS
+from processing.deadline import Deadline, run_process
+from processing.mediainfo import frame_rate, output_dimensions
+
+
+RATE_CONTROL_MODES = ("abr", "capped_crf", "two_pass", "auto")
+
+# CRF used to encode the sampled clips in the auto pre-scan
+PROBE_CRF = 23
+# Bits per pixel at PROBE_CRF mapped to auto_crf_max / auto_crf_min
+LOW_COMPLEXITY_BPP = 0.01
+HIGH_COMPLEXITY_BPP = 0.15
+# Share of the target size left for container overhead in two-pass sizing
+CONTAINER_OVERHEAD = 0.03
+
+
+def parse_kbps(value) -> int:
+    """Bitrate strings like "800k", "1.2M" or 800000 as kbit/s."""
+    text = str(value).strip().lower()
+    if text.endswith("k"):
+        return int(float(text[:-1]))
+    if text.endswith("m"):
+        return int(float(text[:-1]) * 1000)
+    return int(float(text) / 1000)
+
+
+def measure_complexity(
+    input_path: str,
+    video_info: Dict,
+    config: Dict,
+    scale_filter: str,
+    deadline: Optional[Deadline] = None,
+    timeout: float = 60,
+) -> Optional[float]:
+    """Average bits per pixel of sampled clips encoded at PROBE_CRF.
+
+    Samples `complexity_samples` clips of `complexity_sample_seconds`, spread
+    evenly over the video, scaled to the output resolution and encoded with
+    libx264 ultrafast to a raw H.264 stream whose size is measured.
+
+    Returns:
+        Bits per output pixel, or None if the pre-scan failed
+    """
+    duration = float(video_info.get("duration") or 0.0)
+    samples = max(1, int(config.get("complexity_samples", 3)))
+    sample_seconds = float(config.get("complexity_sample_seconds", 2.0))
+
+    if duration <= samples * sample_seconds:
+        positions = [0.0]
+        sample_seconds = min(duration, samples * sample_seconds) or sample_seconds
+    else:
+        positions = [duration * (i + 1) / (samples + 1) - sample_seconds / 2 for i in range(samples)]
+
+    width, height = output_dimensions(video_info, config)
+    fps = frame_rate(video_info)
+
+    total_bits = 0
+    total_pixels = 0.0
+    for position in positions:
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-ss", f"{max(0.0, position):.2f}", "-t", f"{sample_seconds:.2f}",
+            "-i", input_path,
+            "-an", "-vf", scale_filter,
+            "-c:v", "libx264", "-preset", "ultrafast", "-crf", str(PROBE_CRF),
+            "-pix_fmt", "yuv420p",
+            "-f", "h264", "-",
+        ]
+        try:
+            result = run_process(cmd, deadline, "complexity pre-scan", timeout=timeout, text=False)
+        except (OSError, subprocess.SubprocessError) as exc:
+            logging.warning("Complexity pre-scan failed: %s", str(exc))
+            return None
+        if result.returncode != 0 or not result.stdout:
+            logging.warning("Complexity pre-scan failed: %s", result.stderr.decode(errors="replace")[-300:])
+            return None
+
+        total_bits += len(result.stdout) * 8
+        total_pixels += sample_seconds * fps * width * height
+
+    return total_bits / total_pixels if total_pixels else None
+
+
+def crf_for_complexity(bits_per_pixel: float, config: Dict) -> int:
+    """Map pre-scan bits per pixel onto the profile's auto CRF range (log scale)."""
+    crf_min = int(config.get("auto_crf_min", 20))
+    crf_max = int(config.get("auto_crf_max", 30))
+
+    bpp = min(max(bits_per_pixel, LOW_COMPLEXITY_BPP), HIGH_COMPLEXITY_BPP)
+    position = math.log(bpp / LOW_COMPLEXITY_BPP) / math.log(HIGH_COMPLEXITY_BPP / LOW_COMPLEXITY_BPP)
+    return int(round(crf_max - position * (crf_max - crf_min)))
+
+
+def _two_pass_bitrate(video_info: Dict, config: Dict) -> int:
+    """kbit/s that makes the clip land on target_file_size_mb."""
+    target_kbps = parse_kbps(config.get("target_bitrate", "800k"))
+    size_mb = float(config.get("target_file_size_mb") or 0)
+    duration = float(video_info.get("duration") or 0.0)
+    if size_mb <= 0 or duration <= 0:
+        return target_kbps
+
+    kbps = int(size_mb * 8 * 1024 * (1 - CONTAINER_OVERHEAD) / duration)
+    floor = parse_kbps(config.get("min_bitrate", "200k"))
+    ceiling = parse_kbps(config.get("max_bitrate", "1200k"))
+    return max(floor, min(ceiling, kbps))
+
+
+def plan_rate_control(
+    input_path: str,
+    video_info: Optional[Dict],
+    config: Dict,
+    encoder: str,
+    scale_filter: str,
+    deadline: Optional[Deadline] = None,
+) -> Dict:
+    """Choose the rate-control settings for one clip.
+
+    The auto pre-scan runs within `deadline` and is killed with it.
+
+    Returns:
+        Plan dict with mode, requested_mode and passes, plus crf,
+        bitrate_kbps and complexity_bpp where they apply
+    """
+    requested = config.get("rate_control", "abr")
+    if requested not in RATE_CONTROL_MODES:
+        logging.warning("Unknown rate_control %r, using abr", requested)
+        requested = "abr"
+
+    features = H264_ENCODERS.get(encoder, {})
+    video_info = video_info or {}
+    plan: Dict = {"mode": requested, "requested_mode": requested, "passes": 1}
+
+    if requested in ("capped_crf", "auto") and not features.get("crf"):
+        logging.info("%s does not support CRF; falling back to abr", encoder)
+        plan["mode"] = "abr"
+    elif requested == "two_pass" and not features.get("two_pass"):
+        logging.info("%s does not support two-pass; falling back to abr", encoder)
+        plan["mode"] = "abr"
+
+    if plan["mode"] == "capped_crf":
+        plan["crf"] = int(config.get("crf", 23))
+    elif plan["mode"] == "auto":
+        complexity = measure_complexity(input_path, video_info, config, scale_filter, deadline)
+        plan["complexity_bpp"] = round(complexity, 4) if complexity is not None else None
+        plan["crf"] = crf_for_complexity(complexity, config) if complexity is not None else int(config.get("crf", 23))
+    elif plan["mode"] == "two_pass":
+        plan["bitrate_kbps"] = _two_pass_bitrate(video_info, config)
+        plan["passes"] = 2
+
+    logging.info("Rate control plan: %s", plan)
+    return plan
+
+
+def rate_control_args(plan: Dict, config: Dict) -> List[str]:
+    """ffmpeg video rate-control options for a plan."""
+    max_bitrate = config.get("max_bitrate", "1200k")
+    buffer_size = config.get("buffer_size", "2400k")
+
+    if plan["mode"] in ("capped_crf", "auto"):
+        return ["-crf", str(plan["crf"]), "-maxrate", max_bitrate, "-bufsize", buffer_size]
+
+    if plan["mode"] == "two_pass":
+        kbps = plan["bitrate_kbps"]
+        return ["-b:v", f"{kbps}k", "-maxrate", f"{int(kbps * 1.5)}k", "-bufsize", f"{kbps * 3}k"]
+
+    return ["-b:v", config.get("target_bitrate", "800k"), "-maxrate", max_bitrate, "-bufsize", buffer_size]
@@ -0,0 +1,103 @@
+"""Expiry of processed outputs and reconciliation of leaked blobs.
+
+Outputs are written with an `expires_at` blob index tag. The expiry sweep asks
+storage for blobs whose tag is in the past (find_blobs_by_tags, page by page,
+on Azure) and deletes them with Blob Batch requests (up to 256 deletes per
+call), so its cost follows the number of expired blobs rather than the number
+of jobs.
+
+The reconciliation sweep lists the whole 'processed' container and removes
+blobs that no job record references any more, which cleans up outputs leaked
+before outputs were tagged.
+"""
+
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from processing.storage import DELETE_BATCH_SIZE, PROCESSED_CONTAINER, get_storage
+
+
+EXPIRY_TAG = "expires_at"
+# Lifetime of processed outputs after they are written
+OUTPUT_TTL_MINUTES = int(os.getenv("OUTPUT_TTL_MINUTES", "10"))
+# Unreferenced outputs younger than this are left alone (jobs still finishing)
+ORPHAN_MIN_AGE_MINUTES = int(os.getenv("ORPHAN_MIN_AGE_MINUTES", "60"))
+
+
+def format_expiry(moment: datetime) -> str:
+    """UTC timestamp that sorts lexicographically, valid as a tag value and RowKey."""
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def minutes_until_expiry(expires_at: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """Minutes before an expires_at tag value passes (0 once it has), or None without one."""
+    if not expires_at:
+        return None
+    moment = datetime.strptime(expires_at, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+    return max(0.0, (moment - (now or datetime.now(timezone.utc))).total_seconds() / 60)
+
+
+def expiry_tags(ttl_minutes: int = OUTPUT_TTL_MINUTES) -> Dict[str, str]:
+    """Blob index tags for an output that should be deleted after ttl_minutes."""
+    return {EXPIRY_TAG: format_expiry(datetime.now(timezone.utc) + timedelta(minutes=ttl_minutes))}
+
+
+def delete_processed_blobs(blob_names: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Delete blobs from the 'processed' container in batches.
+
+    Blobs that no longer exist count as deleted.
+
+    Returns:
+        Tuple of (deleted, failed) blob names
+    """
+    return get_storage().delete_batch(PROCESSED_CONTAINER, blob_names)
+
+
+def sweep_expired_outputs(now: Optional[datetime] = None, page_size: int = DELETE_BATCH_SIZE) -> int:
+    """Delete outputs whose expires_at tag has passed.
+
+    Each page of find_blobs_by_tags results becomes one batch delete.
+
+    Returns:
+        Number of blobs removed
+    """
+    cutoff = format_expiry(now or datetime.now(timezone.utc))
+    expired = get_storage().find_by_tag_before(PROCESSED_CONTAINER, EXPIRY_TAG, cutoff, page_size)
+
+    removed = 0
+    for page in expired:
+        deleted, failed = delete_processed_blobs(page)
+        removed += len(deleted)
+        if failed:
+            logging.warning("%d expired outputs could not be deleted; retrying next sweep", len(failed))
+
+    return removed
+
+
+def find_orphaned_outputs(referenced: Set[str], min_age_minutes: int = ORPHAN_MIN_AGE_MINUTES) -> List[str]:
+    """List 'processed' blobs older than min_age_minutes that no job references.
+
+    Args:
+        referenced: Output names still referenced by job records
+        min_age_minutes: Grace period for jobs that are still being recorded
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=min_age_minutes)
+
+    return [
+        name
+        for name, last_modified in get_storage().list_blobs(PROCESSED_CONTAINER)
+        if name not in referenced and last_modified and last_modified < cutoff
+    ]
+
+
+def reconcile_orphaned_outputs(referenced: Set[str], min_age_minutes: int = ORPHAN_MIN_AGE_MINUTES) -> int:
+    """Delete leaked outputs. Returns the number of blobs removed."""
+    orphans = find_orphaned_outputs(referenced, min_age_minutes)
+    if not orphans:
+        return 0
+
+    deleted, failed = delete_processed_blobs(orphans)
+    logging.info("Reconciliation removed %d orphaned outputs (%d failed)", len(deleted), len(failed))
+    return len(deleted)
@@ -0,0 +1,150 @@
+"""Fair-share scheduling of encode slots between tenants.
+
+A fixed number of encode slots (ENCODE_SLOTS) is shared by all jobs on the
+instance. Waiting jobs are ordered by priority class first (interactive image
+work before batch video work), then by weighted fair queuing between tenants:
+each job gets a virtual finish time of
+
+    max(virtual clock, tenant's last finish) + estimated cost / tenant weight
+
+so a tenant that queues many expensive jobs only delays itself, while other
+tenants' jobs interleave in proportion to their weights.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+ENCODE_SLOTS = int(os.getenv("ENCODE_SLOTS", str(max(1, (os.cpu_count() or 2) // 2))))
+ENCODE_QUEUE_TIMEOUT = float(os.getenv("ENCODE_QUEUE_TIMEOUT", "120"))
+
+
+class SchedulerTimeout(RuntimeError):
+    """Raised when a job waited longer than the queue timeout for a slot."""
+
+
+class FairScheduler:
+    """Weighted fair queue with priority classes over a fixed pool of slots."""
+
+    def __init__(self, slots: int = ENCODE_SLOTS):
+        self.slots = slots
+        self._available = slots
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[int, float, int]] = []  # (priority, finish tag, ticket)
+        self._tickets = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._start_tags: Dict[int, float] = {}
+
+    def acquire(
+        self,
+        tenant: str,
+        cost: float = 1.0,
+        weight: float = 1.0,
+        priority: int = PRIORITY_BATCH,
+        timeout: Optional[float] = ENCODE_QUEUE_TIMEOUT,
+    ) -> float:
+        """Block until this job holds a slot.
+
+        Args:
+            tenant: Identity name the job is charged to
+            cost: Estimated encode-seconds (from admission control)
+            weight: Tenant share; higher weight gets proportionally more slots
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+            timeout: Seconds to wait before raising SchedulerTimeout
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        queued_at = time.monotonic()
+
+        with self._condition:
+            start_tag = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+            finish_tag = start_tag + max(cost, 0.001) / max(weight, 0.001)
+            self._last_finish[tenant] = finish_tag
+
+            ticket = next(self._tickets)
+            entry = (priority, finish_tag, ticket)
+            self._start_tags[ticket] = start_tag
+            heapq.heappush(self._queue, entry)
+
+            deadline = None if timeout is None else queued_at + timeout
+            while not (self._available > 0 and self._queue[0] == entry):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    del self._start_tags[ticket]
+                    self._condition.notify_all()
+                    raise SchedulerTimeout(
+                        f"No encode slot available within {timeout:.0f}s ({len(self._queue)} jobs queued)"
+                    )
+                self._condition.wait(remaining)
+
+            heapq.heappop(self._queue)
+            self._available -= 1
+            self._virtual_time = max(self._virtual_time, self._start_tags.pop(ticket))
+            self._condition.notify_all()
+
+        return time.monotonic() - queued_at
+
+    def release(self) -> None:
+        with self._condition:
+            self._available += 1
+            if not self._queue:
+                # Idle: forget history so returning tenants start on equal terms
+                self._last_finish.clear()
+            self._condition.notify_all()
+
+    def snapshot(self) -> Dict:
+        """Current slot usage and queue depth, for health/metrics."""
+        with self._condition:
+            return {
+                "slots": self.slots,
+                "available": self._available,
+                "queued": len(self._queue),
+            }
+
+
+_scheduler = FairScheduler()
+
+
+def get_scheduler() -> FairScheduler:
+    return _scheduler
+
+
+@contextmanager
+def encode_slot(
+    job: Dict,
+    cost: float,
+    priority: int,
+    timeout: Optional[float] = ENCODE_QUEUE_TIMEOUT,
+) -> Iterator[float]:
+    """Hold an encode slot for the duration of the block.
+
+    Args:
+        job: Job dict; "tenant" and "weight" select the fair-share bucket
+        cost: Estimated encode-seconds
+        priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH
+        timeout: Seconds to wait for the slot (capped by the request's deadline)
+
+    Yields:
+        Seconds the job waited for its slot
+    """
+    tenant = job.get("tenant") or "anonymous"
+    waited = _scheduler.acquire(tenant, cost, float(job.get("weight") or 1.0), priority, timeout)
+    if waited > 1.0:
+        logging.info("Job for %s waited %.1fs for an encode slot", tenant, waited)
+    try:
+        yield waited
+    finally:
+        _scheduler.release()
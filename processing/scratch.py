@@ -0,0 +1,218 @@
+"""Scratch space for processing temp files: volume choice, reservations, reaping.
+
+Every job that needs local files gets one directory from scratch_dir(),
+sized up front from the input size and the expected output:
+
+- Jobs up to SCRATCH_TMPFS_MAX_MB go to the memory-backed volume
+  (SCRATCH_TMPFS_DIR, /dev/shm by default), larger ones to the disk volume
+  (SCRATCH_DISK_DIR, the system temp dir by default). If the preferred volume
+  is short of space the job falls back to the other one.
+- A reservation is accepted only if the volume's free space minus the
+  not-yet-written part of all other reservations still leaves
+  SCRATCH_MIN_FREE_MB. Otherwise ScratchSpaceExhausted is raised before
+  anything is downloaded, and the endpoints answer 503 like a full scheduler.
+- Directories are named <pid>-<id> under a "media-scratch" root on each
+  volume. reap_orphans() removes those left behind by dead processes, and
+  any older than SCRATCH_MAX_AGE_SECONDS, at startup and every
+  SCRATCH_REAP_INTERVAL_SECONDS (a per-instance background worker, because
+  each instance has its own disks).
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+from processing.scheduler import SchedulerTimeout
+
+
+MIB = 1024 * 1024
+
+TMPFS_DIR = os.getenv("SCRATCH_TMPFS_DIR", "/dev/shm")
+DISK_DIR = os.getenv("SCRATCH_DISK_DIR", "") or tempfile.gettempdir()
+# Jobs expected to need at most this much go to tmpfs
+TMPFS_MAX_BYTES = int(float(os.getenv("SCRATCH_TMPFS_MAX_MB", "256")) * MIB)
+# Free space every volume keeps after all reservations
+MIN_FREE_BYTES = int(float(os.getenv("SCRATCH_MIN_FREE_MB", "512")) * MIB)
+# Directories older than this are reaped even if their process is alive
+MAX_AGE_SECONDS = float(os.getenv("SCRATCH_MAX_AGE_SECONDS", "7200"))
+REAP_INTERVAL_SECONDS = float(os.getenv("SCRATCH_REAP_INTERVAL_SECONDS", "600"))
+
+ROOT_NAME = "media-scratch"
+
+
+class ScratchSpaceExhausted(SchedulerTimeout):
+    """No scratch volume has room for the job; retry later.
+
+    A SchedulerTimeout so that every endpoint answers it as "instance busy".
+    """
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchManager:
+    """Reservations and reaping over the scratch volumes of this instance."""
+
+    def __init__(self, volumes: Dict[str, str]):
+        # kind ("tmpfs"/"disk") -> scratch root on that volume
+        self._roots = {
+            kind: os.path.join(path, ROOT_NAME)
+            for kind, path in volumes.items()
+            if path and os.path.isdir(path) and os.access(path, os.W_OK)
+        }
+        self._lock = threading.Lock()
+        # path -> (kind, reserved bytes) of directories in use by this process
+        self._active: Dict[str, Tuple[str, int]] = {}
+        self._reaped = 0
+
+    def _outstanding(self, kind: str) -> int:
+        """Reserved bytes not written yet by jobs on volume `kind`."""
+        return sum(
+            max(0, reserved - _dir_size(path))
+            for path, (active_kind, reserved) in self._active.items()
+            if active_kind == kind
+        )
+
+    def _available(self, kind: str) -> int:
+        usage = shutil.disk_usage(os.path.dirname(self._roots[kind]))
+        return usage.free - self._outstanding(kind) - MIN_FREE_BYTES
+
+    def reserve(self, expected_bytes: int, label: str = "") -> str:
+        """Create a job directory on the best volume with room for `expected_bytes`.
+
+        Raises:
+            ScratchSpaceExhausted: If no volume can hold the reservation
+        """
+        order = ["tmpfs", "disk"] if expected_bytes <= TMPFS_MAX_BYTES else ["disk", "tmpfs"]
+        with self._lock:
+            for kind in order:
+                if kind not in self._roots or self._available(kind) < expected_bytes:
+                    continue
+                root = self._roots[kind]
+                os.makedirs(root, exist_ok=True)
+                path = os.path.join(root, f"{os.getpid()}-{uuid.uuid4().hex[:12]}")
+                os.mkdir(path)
+                self._active[path] = (kind, expected_bytes)
+                logging.info(
+                    "Reserved %.1f MB of %s scratch for %s: %s", expected_bytes / MIB, kind, label or "job", path
+                )
+                return path
+
+        raise ScratchSpaceExhausted(
+            f"No scratch volume has {expected_bytes / MIB:.0f} MB free for {label or 'the job'}"
+        )
+
+    def release(self, path: str) -> None:
+        """Delete a job directory and drop its reservation."""
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._active.pop(path, None)
+
+    def reap_orphans(self) -> int:
+        """Remove job directories of dead processes and ones past MAX_AGE_SECONDS.
+
+        Returns:
+            Number of directories removed
+        """
+        now = time.time()
+        removed = 0
+        for root in self._roots.values():
+            try:
+                entries = os.listdir(root)
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                path = os.path.join(root, entry)
+                try:
+                    pid = int(entry.split("-", 1)[0])
+                    age = now - os.stat(path).st_mtime
+                except (ValueError, OSError):
+                    continue
+                with self._lock:
+                    in_use = path in self._active
+                if pid == os.getpid() and in_use and age < MAX_AGE_SECONDS:
+                    continue
+                if pid != os.getpid() and _pid_alive(pid) and age < MAX_AGE_SECONDS:
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                with self._lock:
+                    self._active.pop(path, None)
+                removed += 1
+                logging.warning("Reaped orphaned scratch directory %s (pid %d, %.0fs old)", path, pid, age)
+
+        with self._lock:
+            self._reaped += removed
+        return removed
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            volumes = {}
+            for kind, root in self._roots.items():
+                usage = shutil.disk_usage(os.path.dirname(root))
+                outstanding = self._outstanding(kind)
+                volumes[kind] = {
+                    "path": os.path.dirname(root),
+                    "total_mb": round(usage.total / MIB),
+                    "free_mb": round(usage.free / MIB),
+                    "reserved_mb": round(outstanding / MIB),
+                    "headroom_mb": round(max(0, usage.free - outstanding - MIN_FREE_BYTES) / MIB),
+                    "active_jobs": sum(1 for active_kind, _ in self._active.values() if active_kind == kind),
+                }
+            return {"volumes": volumes, "reaped": self._reaped}
+
+
+_manager = ScratchManager({"tmpfs": TMPFS_DIR, "disk": DISK_DIR})
+
+
+def get_scratch_manager() -> ScratchManager:
+    return _manager
+
+
+@contextmanager
+def scratch_dir(expected_bytes: int, label: str = "") -> Iterator[str]:
+    """Reserved job directory, deleted with everything in it on exit.
+
+    Raises:
+        ScratchSpaceExhausted: If no volume can hold the reservation
+    """
+    path = _manager.reserve(expected_bytes, label)
+    try:
+        yield path
+    finally:
+        _manager.release(path)
+
+
+def run_reaper(stop: Optional[threading.Event] = None) -> None:
+    """Background worker: reap at startup, then every REAP_INTERVAL_SECONDS."""
+    stop = stop or threading.Event()
+    while True:
+        try:
+            _manager.reap_orphans()
+        except Exception as exc:
+            logging.warning("Scratch reaping failed: %s", str(exc))
+        if stop.wait(REAP_INTERVAL_SECONDS):
+            return
@@ -0,0 +1,183 @@
+"""Checkpointed segment encoding for long videos.
+
+Videos of at least `segment_min_duration` seconds are encoded as independent
+`segment_seconds` chunks (input seeking, so each chunk decodes only its own
+range) and joined with the concat demuxer without re-encoding. After each
+chunk is encoded it is uploaded to the 'processed' container and recorded in a
+manifest on the job record. A retry (handle_processing_error re-dispatch,
+client retry after a timeout) then encodes only the missing chunks and
+downloads the others. The manifest also stores the rate-control plan, so the
+auto pre-scan is not repeated and every chunk uses the same settings.
+
+The manifest is keyed by the input size and the encode settings. After any
+change it is ignored and the video is encoded from scratch. A failed job with
+a manifest keeps its record for SEGMENT_TTL_MINUTES, as long as the
+checkpoints; a checkpoint that is gone anyway is encoded again.
+
+Two-pass plans need statistics for the whole file and are not segmented.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from processing.deadline import Deadline, run_process
+from processing.ffmpeg_log import FFmpegLog
+from processing.naming import processed_blob_name
+from processing.retention import expiry_tags
+from processing.storage import PROCESSED_CONTAINER, BlobNotFound, StorageBackend
+
+
+# Checkpoints outlive the retry backoff (2/4/8 minutes) by a wide margin
+SEGMENT_TTL_MINUTES = int(os.getenv("VIDEO_SEGMENT_TTL_MINUTES", "1440"))
+
+# Config keys that change the encoded bitstream; a manifest written under
+# different values is not reused
+_ENCODE_KEYS = (
+    "preset", "target_bitrate", "max_bitrate", "buffer_size", "rate_control", "crf",
+    "max_width", "max_height", "remove_audio", "segment_seconds",
+)
+
+
+def segment_blob_name(blob_name: str, index: int) -> str:
+    """'processed' blob holding checkpointed segment `index` of an upload."""
+    return processed_blob_name(blob_name, f"seg{index:04d}.mp4")
+
+
+def manifest_segment_blobs(blob_name: str, raw_manifest: Optional[str]) -> List[str]:
+    """Checkpoint blobs listed in a job record's segment manifest (JSON)."""
+    try:
+        manifest = json.loads(raw_manifest or "{}")
+    except (TypeError, ValueError):
+        return []
+    return [segment_blob_name(blob_name, index) for index in manifest.get("done", [])]
+
+
+def plan_segments(video_info: Optional[Dict], config: Dict) -> List[Tuple[float, float]]:
+    """(start, duration) of each segment, or [] if the video is too short to split."""
+    duration = float((video_info or {}).get("duration") or 0.0)
+    length = float(config.get("segment_seconds", 60))
+    if length <= 0 or duration < float(config.get("segment_min_duration", 300)):
+        return []
+
+    count = math.ceil(duration / length)
+    return [(index * length, min(length, duration - index * length)) for index in range(count)]
+
+
+def manifest_key(config: Dict, file_size: int) -> str:
+    """Fingerprint of the input and encode settings a manifest was written for."""
+    source = json.dumps([file_size] + [config.get(key) for key in _ENCODE_KEYS], default=str)
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+def load_manifest(raw_manifest: Optional[str], key: str) -> Optional[Dict]:
+    """Manifest from the job record if it was written for the same key."""
+    try:
+        manifest = json.loads(raw_manifest or "null")
+    except (TypeError, ValueError):
+        return None
+    if not manifest or manifest.get("key") != key:
+        return None
+    return manifest
+
+
+def encode_segments(
+    storage: StorageBackend,
+    blob_name: str,
+    segments: List[Tuple[float, float]],
+    manifest: Dict,
+    build_cmd: Callable[[float, float, str], List[str]],
+    work_dir: str,
+    deadline: Deadline,
+    on_checkpoint: Optional[Callable[[Dict], None]] = None,
+    log: Optional[FFmpegLog] = None,
+) -> List[str]:
+    """Encode missing segments, checkpointing each; fetch the rest.
+
+    Args:
+        storage: Backend from get_storage()
+        blob_name: Upload blob name (checkpoint names derive from it)
+        segments: Output of plan_segments()
+        manifest: Dict with key, rate_plan and done (indexes); updated in place
+        build_cmd: (start, duration, output_path) -> ffmpeg command for one segment
+        work_dir: Scratch directory for segment files
+        deadline: Encode deadline; a kill keeps the segments finished so far
+        on_checkpoint: Called with the manifest after each segment is stored
+        log: The job's FFmpegLog (stderr is buffered in full without one)
+
+    Returns:
+        Local segment paths in order
+
+    Raises:
+        RuntimeError: If ffmpeg fails on a segment
+    """
+    done = set(manifest.setdefault("done", []))
+    manifest["count"] = len(segments)
+    paths = [os.path.join(work_dir, f"seg{index:04d}.mp4") for index in range(len(segments))]
+
+    if done:
+        logging.info("Resuming %s: %d of %d segments already encoded", blob_name, len(done), len(segments))
+
+    def encode(index: int) -> None:
+        start, duration = segments[index]
+        deadline.check(f"encode of segment {index}")
+        result = run_process(build_cmd(start, duration, paths[index]), deadline, f"encode of segment {index}", log=log)
+        if result.returncode != 0:
+            raise RuntimeError(f"FFmpeg failed on segment {index}: {result.stderr[-2000:]}")
+
+        storage.write_file(
+            PROCESSED_CONTAINER, segment_blob_name(blob_name, index), paths[index],
+            content_type="video/mp4", tags=expiry_tags(SEGMENT_TTL_MINUTES),
+        )
+        done.add(index)
+        manifest["done"] = sorted(done)
+        if on_checkpoint:
+            on_checkpoint(manifest)
+
+    for index in range(len(segments)):
+        if index not in done:
+            encode(index)
+
+    for index, path in enumerate(paths):
+        if not os.path.exists(path):
+            deadline.check("segment download")
+            try:
+                with open(path, "wb") as fh:
+                    storage.download_to(PROCESSED_CONTAINER, segment_blob_name(blob_name, index), fh)
+            except BlobNotFound:
+                # The checkpoint expired (or was swept) before this retry
+                logging.warning("Checkpoint %d of %s is gone; encoding it again", index, blob_name)
+                os.unlink(path)
+                encode(index)
+
+    return paths
+
+
+def concat_segments(
+    paths: List[str], output_path: str, config: Dict, deadline: Deadline, log: Optional[FFmpegLog] = None
+) -> None:
+    """Join encoded segments into one MP4 without re-encoding."""
+    list_path = os.path.join(os.path.dirname(paths[0]), "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as fh:
+        fh.writelines(f"file '{path}'\n" for path in paths)
+
+    cmd = ["ffmpeg", "-hide_banner", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+    if config.get("enable_faststart", True):
+        cmd.extend(["-movflags", "+faststart"])
+    cmd.extend(["-y", output_path])
+
+    result = run_process(cmd, deadline, "segment concat", log=log)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg concat failed: {result.stderr[-2000:]}")
+
+
+def delete_segments(storage: StorageBackend, blob_name: str, count: int) -> None:
+    """Remove checkpoint blobs once the joined video is stored."""
+    deleted, failed = storage.delete_batch(
+        PROCESSED_CONTAINER, [segment_blob_name(blob_name, index) for index in range(count)]
+    )
+    if failed:
+        logging.warning("%d segment checkpoints of %s could not be deleted; they expire by tag", len(failed), blob_name)
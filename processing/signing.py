@@ -0,0 +1,251 @@
+"""Cached SAS URL signing for blob storage.
+
+`BlobUrlSigner` parses the storage credentials once, builds blob URLs from the
+account endpoint without constructing SDK clients, and reuses signed URLs
+until shortly before they expire. The storage backend drops a blob's cached
+URLs when it deletes or rewrites the blob (forget_urls), so a reprocessed
+output is handed out with a freshly signed URL. Accounts without a shared key
+sign with a user delegation key obtained through Azure AD, which is cached and
+refreshed ahead of its own expiry.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple, Union
+from urllib.parse import quote
+
+from azure.storage.blob import (
+    BlobSasPermissions,
+    BlobServiceClient,
+    UserDelegationKey,
+    generate_blob_sas,
+)
+
+
+# Re-sign once less than this much lifetime is left on a cached URL
+REFRESH_MARGIN_SECONDS = int(os.getenv("SAS_REFRESH_MARGIN_SECONDS", "300"))
+# Cached URLs kept per process (oldest evicted first)
+MAX_CACHED_URLS = int(os.getenv("SAS_CACHE_SIZE", "10000"))
+# Lifetime requested for user delegation keys (Azure allows up to 7 days)
+DELEGATION_KEY_HOURS = int(os.getenv("SAS_DELEGATION_KEY_HOURS", "24"))
+
+
+def _parse_connection_string(connection_string: str) -> dict:
+    """Parse Azure Storage connection string into a dictionary."""
+    parts = connection_string.split(";")
+    kv_pairs = [p for p in parts if p]
+    result: dict = {}
+    for pair in kv_pairs:
+        if "=" in pair:
+            key, value = pair.split("=", 1)
+            result[key] = value
+    return result
+
+
+def _account_url_from_settings(settings: dict) -> Optional[str]:
+    if settings.get("BlobEndpoint"):
+        return settings["BlobEndpoint"].rstrip("/")
+
+    account_name = settings.get("AccountName")
+    if not account_name:
+        return None
+
+    protocol = settings.get("DefaultEndpointsProtocol", "https")
+    suffix = settings.get("EndpointSuffix", "core.windows.net")
+    return f"{protocol}://{account_name}.blob.{suffix}"
+
+
+class BlobUrlSigner:
+    """Signs blob-scoped SAS URLs with cached credentials and results.
+
+    Args:
+        account_url: Blob endpoint, e.g. https://account.blob.core.windows.net
+        account_name: Storage account name
+        account_key: Shared key. If omitted, user delegation keys are used and
+            token_credential must be provided.
+        token_credential: Azure AD credential used to fetch user delegation keys
+    """
+
+    def __init__(
+        self,
+        account_url: str,
+        account_name: str,
+        account_key: Optional[str] = None,
+        token_credential=None,
+    ):
+        if not account_key and token_credential is None:
+            raise ValueError("Either an account key or a token credential is required")
+
+        self.account_url = account_url.rstrip("/")
+        self.account_name = account_name
+        self._account_key = account_key
+        self._token_credential = token_credential
+
+        self._lock = threading.Lock()
+        self._key_lock = threading.Lock()
+        self._urls: "OrderedDict[Tuple[str, str, str, int], Tuple[str, datetime]]" = OrderedDict()
+        self._delegation_key: Optional[UserDelegationKey] = None
+        self._delegation_key_expiry: Optional[datetime] = None
+
+    @classmethod
+    def from_connection_string(cls, connection_string: str, token_credential=None) -> "BlobUrlSigner":
+        """Build a signer from a storage connection string.
+
+        Raises a ValueError if the account name is missing, or if there is
+        neither an AccountKey nor a token credential.
+        """
+        settings = _parse_connection_string(connection_string)
+        account_name = settings.get("AccountName")
+        account_url = _account_url_from_settings(settings)
+        if not account_name or not account_url:
+            raise ValueError("Connection string must include AccountName")
+
+        account_key = settings.get("AccountKey")
+        if not account_key and token_credential is None:
+            raise ValueError("Connection string must include AccountName and AccountKey")
+
+        return cls(account_url, account_name, account_key, token_credential)
+
+    def blob_url(self, container_name: str, blob_name: str) -> str:
+        """Unsigned URL of a blob, encoded the same way as BlobClient.url."""
+        return f"{self.account_url}/{container_name}/{quote(blob_name, safe='~/')}"
+
+    def sign(
+        self,
+        container_name: str,
+        blob_name: str,
+        permission: Union[str, BlobSasPermissions] = "r",
+        expiry_minutes: int = 60,
+        cache: bool = True,
+    ) -> Tuple[str, datetime]:
+        """Return a SAS URL for a blob, reusing a cached one when still fresh.
+
+        Args:
+            container_name: Container holding the blob
+            blob_name: Blob name
+            permission: SAS permission string or BlobSasPermissions
+            expiry_minutes: Lifetime of newly signed URLs
+            cache: Set False for one-off URLs (e.g. freshly allocated upload names)
+
+        Returns:
+            Tuple of (url, expires_on) with expires_on as naive UTC
+        """
+        permission = str(permission)
+        key = (container_name, blob_name, permission, expiry_minutes)
+        now = datetime.utcnow()
+        margin = timedelta(seconds=min(REFRESH_MARGIN_SECONDS, expiry_minutes * 30))
+
+        if cache:
+            with self._lock:
+                cached = self._urls.get(key)
+                if cached and cached[1] - margin > now:
+                    self._urls.move_to_end(key)
+                    return cached
+
+        expires_on = now + timedelta(minutes=expiry_minutes)
+        credential: Dict = {"account_key": self._account_key}
+        if not self._account_key:
+            credential = {"user_delegation_key": self._get_delegation_key(expires_on)}
+
+        sas = generate_blob_sas(
+            account_name=self.account_name,
+            container_name=container_name,
+            blob_name=blob_name,
+            permission=permission,
+            expiry=expires_on,
+            **credential,
+        )
+        signed = (f"{self.blob_url(container_name, blob_name)}?{sas}", expires_on)
+
+        if cache:
+            with self._lock:
+                self._urls[key] = signed
+                self._urls.move_to_end(key)
+                while len(self._urls) > MAX_CACHED_URLS:
+                    self._urls.popitem(last=False)
+
+        return signed
+
+    def invalidate(self, container_name: str, *blob_names: str) -> None:
+        """Drop cached URLs for blobs (e.g. after they were deleted or rewritten)."""
+        names = set(blob_names)
+        with self._lock:
+            for key in [k for k in self._urls if k[0] == container_name and k[1] in names]:
+                del self._urls[key]
+
+    def _get_delegation_key(self, valid_until: datetime) -> UserDelegationKey:
+        """Cached user delegation key that outlives valid_until."""
+        with self._key_lock:
+            if self._delegation_key and self._delegation_key_expiry > valid_until:
+                return self._delegation_key
+
+            start = datetime.utcnow() - timedelta(minutes=5)  # allow for clock skew
+            expiry = max(
+                datetime.utcnow() + timedelta(hours=DELEGATION_KEY_HOURS),
+                valid_until + timedelta(minutes=5),
+            )
+            service = BlobServiceClient(self.account_url, credential=self._token_credential)
+            self._delegation_key = service.get_user_delegation_key(start, expiry)
+            self._delegation_key_expiry = expiry
+            logging.info("Refreshed user delegation key (valid until %s)", expiry.isoformat())
+            return self._delegation_key
+
+
+_signer: Optional[BlobUrlSigner] = None
+_signer_source: Optional[str] = None
+_signer_lock = threading.Lock()
+
+
+def _get_token_credential():
+    try:
+        from azure.identity import DefaultAzureCredential
+    except ImportError:
+        raise ValueError(
+            "Storage connection string has no AccountKey; install azure-identity "
+            "to sign with user delegation keys"
+        )
+    return DefaultAzureCredential()
+
+
+def forget_urls(container_name: str, blob_names: Iterable[str]) -> None:
+    """Drop cached URLs of deleted or rewritten blobs from the process-wide signer.
+
+    Does nothing before the first URL was signed (no signer is created for it).
+    """
+    signer = _signer
+    if signer is not None:
+        signer.invalidate(container_name, *blob_names)
+
+
+def get_signer() -> BlobUrlSigner:
+    """Process-wide signer for the `AzureWebJobsStorage` account.
+
+    Uses the account key when the connection string has one. Otherwise (or for
+    identity-based `AzureWebJobsStorage__blobServiceUri` settings) it signs
+    with user delegation keys via azure-identity.
+    """
+    global _signer, _signer_source
+
+    connection_string = os.environ.get("AzureWebJobsStorage", "")
+    blob_service_uri = os.environ.get("AzureWebJobsStorage__blobServiceUri", "")
+    source = connection_string or blob_service_uri
+
+    with _signer_lock:
+        if _signer is not None and _signer_source == source:
+            return _signer
+
+        if connection_string:
+            settings = _parse_connection_string(connection_string)
+            credential = None if settings.get("AccountKey") else _get_token_credential()
+            signer = BlobUrlSigner.from_connection_string(connection_string, credential)
+        elif blob_service_uri:
+            account_name = blob_service_uri.split("//", 1)[-1].split(".", 1)[0]
+            signer = BlobUrlSigner(blob_service_uri, account_name, token_credential=_get_token_credential())
+        else:
+            raise KeyError("AzureWebJobsStorage")
+
+        _signer, _signer_source = signer, source
+        return signer
@@ -0,0 +1,580 @@
+"""Storage backends for uploads and processed outputs.
+
+Everything that reads or writes media goes through `get_storage()`, which
+returns the backend selected by STORAGE_BACKEND:
+
+- azure: Azure Blob Storage via the `AzureWebJobsStorage` connection string,
+  with whole-object transfers sized and parallelised by processing/transfer.py
+- local: a directory tree under LOCAL_STORAGE_ROOT (e.g. an NFS mount next to
+  an on-prem compressor, or a scratch directory for tests and benchmarks).
+  Copies use os.sendfile and ranged reads use mmap, so file data is not
+  copied through Python buffers.
+
+Container names come from UPLOADS_CONTAINER / PROCESSED_CONTAINER. Blob names
+are the same for both backends. Chunked uploads address blocks by a zero-based
+index; the Azure backend encodes it into a block ID.
+"""
+
+import base64
+import json
+import logging
+import mmap
+import os
+import secrets
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobServiceClient
+
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "azure")
+UPLOADS_CONTAINER = os.getenv("UPLOADS_CONTAINER", "uploads")
+PROCESSED_CONTAINER = os.getenv("PROCESSED_CONTAINER", "processed")
+
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "/var/lib/media-storage")
+# Base URL the local tree is served from (e.g. by a reverse proxy); file:// if unset
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "")
+
+# Blob Batch API limit
+DELETE_BATCH_SIZE = 256
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class BlobNotFound(LookupError):
+    """Raised when a blob does not exist."""
+
+
+class SignedWriteUnsupported(ValueError):
+    """Raised when a backend cannot issue a URL clients can write to."""
+
+
+class StorageBackend(ABC):
+    """Operations the processors and HTTP handlers need from storage."""
+
+    name = ""
+
+    @abstractmethod
+    def ensure_container(self, container: str) -> None:
+        """Create a container if it does not exist."""
+
+    @abstractmethod
+    def size(self, container: str, name: str) -> int:
+        """Blob size in bytes. Raises BlobNotFound."""
+
+    @abstractmethod
+    def read(self, container: str, name: str) -> bytes:
+        """Whole blob (bytes or bytearray). Raises BlobNotFound."""
+
+    @abstractmethod
+    def read_stream(self, container: str, name: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """Blob contents in chunks. Raises BlobNotFound."""
+
+    @abstractmethod
+    def read_range(self, container: str, name: str, offset: int, length: int) -> bytes:
+        """`length` bytes starting at `offset` (fewer at the end). Raises BlobNotFound."""
+
+    @abstractmethod
+    def download_to(self, container: str, name: str, fileobj: BinaryIO) -> int:
+        """Copy a blob into an open file. Returns bytes written. Raises BlobNotFound."""
+
+    @abstractmethod
+    def write(
+        self,
+        container: str,
+        name: str,
+        data: Union[bytes, BinaryIO],
+        content_type: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Create or replace a blob from bytes or a readable stream."""
+
+    def write_file(
+        self,
+        container: str,
+        name: str,
+        path: str,
+        content_type: Optional[str] = None,
+        tags: Optional[Dict[str, str]] = None,
+    ) -> None:
+        """Create or replace a blob from a local file."""
+        with open(path, "rb") as fh:
+            self.write(container, name, fh, content_type=content_type, tags=tags)
+
+    @abstractmethod
+    def stage_block(self, container: str, name: str, index: int, data: bytes) -> None:
+        """Stage one uncommitted block; re-staging an index replaces it."""
+
+    @abstractmethod
+    def staged_blocks(self, container: str, name: str) -> Dict[int, int]:
+        """Map of block index -> size of uncommitted blocks (empty if none)."""
+
+    @abstractmethod
+    def commit_blocks(self, container: str, name: str, indexes: List[int]) -> None:
+        """Assemble the blob from staged blocks in the given order."""
+
+    @abstractmethod
+    def delete(self, container: str, name: str) -> None:
+        """Delete a blob; missing blobs are ignored."""
+
+    @abstractmethod
+    def delete_batch(self, container: str, names: Iterable[str]) -> Tuple[List[str], List[str]]:
+        """Delete many blobs. Missing blobs count as deleted.
+
+        Returns:
+            Tuple of (deleted, failed) blob names
+        """
+
+    @abstractmethod
+    def list_blobs(self, container: str) -> Iterator[Tuple[str, Optional[datetime]]]:
+        """(name, last_modified) of every blob in a container."""
+
+    @abstractmethod
+    def find_by_tag_before(
+        self, container: str, tag: str, value: str, page_size: int = DELETE_BATCH_SIZE
+    ) -> Iterator[List[str]]:
+        """Pages of blob names whose `tag` sorts before `value`."""
+
+    @abstractmethod
+    def sign_url(
+        self,
+        container: str,
+        name: str,
+        permission: str = "r",
+        expiry_minutes: int = 60,
+        cache: bool = True,
+    ) -> Tuple[str, datetime]:
+        """Time-limited URL for a blob.
+
+        Returns:
+            Tuple of (url, expires_on) with expires_on as naive UTC
+
+        Raises:
+            SignedWriteUnsupported: If `permission` grants writes and the
+                backend has no URL clients can PUT to
+        """
+
+
+def _encode_block_id(index: int) -> str:
+    # Azure requires all block IDs of a blob to be base64 strings of equal length
+    return base64.b64encode(f"{index:06d}".encode()).decode()
+
+
+def _decode_block_id(block_id: str) -> Optional[int]:
+    try:
+        return int(base64.b64decode(block_id).decode())
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class AzureBlobStorage(StorageBackend):
+    """Azure Blob Storage; the blob SDK is imported when the backend is created."""
+
+    name = "azure"
+
+    def __init__(self, connection_string: Optional[str] = None):
+        from azure.storage.blob import BlobServiceClient
+
+        self.service: "BlobServiceClient" = BlobServiceClient.from_connection_string(
+            connection_string or os.environ["AzureWebJobsStorage"]
+        )
+        self._containers: set = set()
+
+    def _blob(self, container: str, name: str):
+        return self.service.get_blob_client(container=container, blob=name)
+
+    @staticmethod
+    def _forget_urls(container: str, names: Iterable[str]) -> None:
+        """Drop cached SAS URLs of blobs this backend just deleted or rewrote."""
+        from processing.signing import forget_urls
+
+        forget_urls(container, names)
+
+    @contextmanager
+    def _not_found(self, container: str, name: str):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            yield
+        except ResourceNotFoundError:
+            raise BlobNotFound(f"{container}/{name}")
+
+    def ensure_container(self, container: str) -> None:
+        from azure.core.exceptions import ResourceExistsError
+
+        if container in self._containers:
+            return
+        try:
+            self.service.get_container_client(container).create_container()
+        except ResourceExistsError:
+            pass
+        self._containers.add(container)
+
+    def size(self, container: str, name: str) -> int:
+        with self._not_found(container, name):
+            return self._blob(container, name).get_blob_properties().size
+
+    def read(self, container: str, name: str) -> bytes:
+        from processing.transfer import download_bytes
+
+        with self._not_found(container, name):
+            return download_bytes(self._blob(container, name))
+
+    def read_stream(self, container: str, name: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        with self._not_found(container, name):
+            downloader = self._blob(container, name).download_blob()
+        return downloader.chunks()
+
+    def read_range(self, container: str, name: str, offset: int, length: int) -> bytes:
+        with self._not_found(container, name):
+            return self._blob(container, name).download_blob(offset=offset, length=length).readall()
+
+    def download_to(self, container: str, name: str, fileobj: BinaryIO) -> int:
+        from processing.transfer import download_to_file
+
+        with self._not_found(container, name):
+            return download_to_file(self._blob(container, name), fileobj)
+
+    def write(self, container, name, data, content_type=None, tags=None) -> None:
+        from azure.storage.blob import ContentSettings
+
+        from processing.transfer import MAX_CONCURRENCY, upload_bytes
+
+        self.ensure_container(container)
+        settings = ContentSettings(content_type=content_type) if content_type else None
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            upload_bytes(self._blob(container, name), data, settings, tags)
+        else:
+            # Unknown length: let the SDK stage blocks as the stream is read
+            self._blob(container, name).upload_blob(
+                data, overwrite=True, max_concurrency=MAX_CONCURRENCY, content_settings=settings, tags=tags
+            )
+        self._forget_urls(container, [name])
+
+    def write_file(self, container, name, path, content_type=None, tags=None) -> None:
+        from azure.storage.blob import ContentSettings
+
+        from processing.transfer import upload_file
+
+        self.ensure_container(container)
+        settings = ContentSettings(content_type=content_type) if content_type else None
+        upload_file(self._blob(container, name), path, settings, tags)
+        self._forget_urls(container, [name])
+
+    def stage_block(self, container: str, name: str, index: int, data: bytes) -> None:
+        self._blob(container, name).stage_block(_encode_block_id(index), data, length=len(data))
+
+    def staged_blocks(self, container: str, name: str) -> Dict[int, int]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            _, uncommitted = self._blob(container, name).get_block_list("uncommitted")
+        except ResourceNotFoundError:
+            return {}
+
+        blocks: Dict[int, int] = {}
+        for block in uncommitted:
+            index = _decode_block_id(block.id)
+            if index is not None:
+                blocks[index] = block.size
+        return blocks
+
+    def commit_blocks(self, container: str, name: str, indexes: List[int]) -> None:
+        self._blob(container, name).commit_block_list([_encode_block_id(index) for index in indexes])
+        self._forget_urls(container, [name])
+
+    def delete(self, container: str, name: str) -> None:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            self._blob(container, name).delete_blob()
+        except ResourceNotFoundError:
+            pass
+        self._forget_urls(container, [name])
+
+    def delete_batch(self, container: str, names: Iterable[str]) -> Tuple[List[str], List[str]]:
+        names = list(dict.fromkeys(name for name in names if name))
+        container_client = self.service.get_container_client(container)
+
+        deleted: List[str] = []
+        failed: List[str] = []
+        for start in range(0, len(names), DELETE_BATCH_SIZE):
+            batch = names[start:start + DELETE_BATCH_SIZE]
+            try:
+                responses = list(container_client.delete_blobs(*batch, raise_on_any_failure=False))
+            except Exception as exc:
+                logging.warning("Batch delete of %d blobs from %s failed: %s", len(batch), container, str(exc))
+                failed.extend(batch)
+                continue
+
+            for name, response in zip(batch, responses):
+                if response.status_code in (202, 404):
+                    deleted.append(name)
+                else:
+                    logging.warning("Failed to delete %s/%s: HTTP %s", container, name, response.status_code)
+                    failed.append(name)
+
+        self._forget_urls(container, deleted)
+        return deleted, failed
+
+    def list_blobs(self, container: str) -> Iterator[Tuple[str, Optional[datetime]]]:
+        for blob in self.service.get_container_client(container).list_blobs():
+            yield blob.name, blob.last_modified
+
+    def find_by_tag_before(self, container, tag, value, page_size=DELETE_BATCH_SIZE) -> Iterator[List[str]]:
+        matches = self.service.get_container_client(container).find_blobs_by_tags(
+            f"\"{tag}\" < '{value}'", results_per_page=page_size
+        )
+        for page in matches.by_page():
+            yield [blob.name for blob in page]
+
+    def sign_url(self, container, name, permission="r", expiry_minutes=60, cache=True) -> Tuple[str, datetime]:
+        from processing.signing import get_signer
+
+        return get_signer().sign(container, name, permission, expiry_minutes, cache=cache)
+
+
+class LocalFileStorage(StorageBackend):
+    """Containers are directories under `root`; blobs are files.
+
+    Content type and tags live in a JSON sidecar under <container>/.meta and
+    staged blocks under <container>/.blocks/<name>/. Writes go to a temporary
+    file that is renamed into place, so readers never see partial blobs.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT, base_url: str = LOCAL_STORAGE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = (base_url or Path(self.root).as_uri()).rstrip("/")
+        self._lock = threading.Lock()
+
+    def _path(self, container: str, name: str, area: str = "") -> str:
+        base = os.path.join(self.root, container, area) if area else os.path.join(self.root, container)
+        path = os.path.normpath(os.path.join(base, name))
+        if not path.startswith(base + os.sep) or os.path.basename(name).startswith("."):
+            raise ValueError(f"Invalid blob name: {name}")
+        return path
+
+    def _existing(self, container: str, name: str) -> str:
+        path = self._path(container, name)
+        if not os.path.isfile(path):
+            raise BlobNotFound(f"{container}/{name}")
+        return path
+
+    def _replace(self, path: str, write) -> None:
+        """Run write(fileobj) against a temporary file, then move it to path."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{os.path.dirname(path)}/.{os.path.basename(path)}.{secrets.token_hex(4)}.tmp"
+        try:
+            with open(temp_path, "wb") as out:
+                write(out)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def _write_meta(self, container: str, name: str, content_type: Optional[str], tags: Optional[Dict]) -> None:
+        meta_path = self._path(container, name + ".json", ".meta")
+        if not content_type and not tags:
+            if os.path.exists(meta_path):
+                os.unlink(meta_path)
+            return
+        meta = json.dumps({"content_type": content_type, "tags": tags or {}}).encode()
+        self._replace(meta_path, lambda out: out.write(meta))
+
+    def _read_meta(self, container: str, name: str) -> Dict:
+        try:
+            with open(self._path(container, name + ".json", ".meta"), "rb") as fh:
+                return json.loads(fh.read())
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _sendfile(source: BinaryIO, out: BinaryIO, count: int) -> int:
+        """Copy count bytes between files in the kernel; falls back to a buffered copy."""
+        out.flush()
+        try:
+            in_fd, out_fd = source.fileno(), out.fileno()
+        except (AttributeError, OSError):
+            shutil.copyfileobj(source, out, READ_CHUNK_SIZE)
+            return count
+
+        offset = source.tell()
+        out_offset = out.tell()
+        sent = 0
+        try:
+            while sent < count:
+                written = os.sendfile(out_fd, in_fd, offset + sent, count - sent)
+                if written == 0:
+                    break
+                sent += written
+        except OSError:
+            # sendfile between these file types is unsupported (e.g. some FUSE mounts)
+            source.seek(offset + sent)
+            shutil.copyfileobj(source, out, READ_CHUNK_SIZE)
+            sent = count
+        out.seek(out_offset + sent)
+        return sent
+
+    def ensure_container(self, container: str) -> None:
+        os.makedirs(os.path.join(self.root, container), exist_ok=True)
+
+    def size(self, container: str, name: str) -> int:
+        return os.path.getsize(self._existing(container, name))
+
+    def read(self, container: str, name: str) -> bytes:
+        with open(self._existing(container, name), "rb") as fh:
+            return fh.read()
+
+    def read_stream(self, container: str, name: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        path = self._existing(container, name)
+
+        def chunks() -> Iterator[bytes]:
+            with open(path, "rb") as fh:
+                while True:
+                    chunk = fh.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+    def read_range(self, container: str, name: str, offset: int, length: int) -> bytes:
+        path = self._existing(container, name)
+        size = os.path.getsize(path)
+        if offset >= size or length <= 0:
+            return b""
+        with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            return view[offset:offset + length]
+
+    def download_to(self, container: str, name: str, fileobj: BinaryIO) -> int:
+        path = self._existing(container, name)
+        with open(path, "rb") as source:
+            return self._sendfile(source, fileobj, os.path.getsize(path))
+
+    def write(self, container, name, data, content_type=None, tags=None) -> None:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._replace(self._path(container, name), lambda out: out.write(data))
+        else:
+            self._replace(self._path(container, name), lambda out: shutil.copyfileobj(data, out, READ_CHUNK_SIZE))
+        self._write_meta(container, name, content_type, tags)
+
+    def write_file(self, container, name, path, content_type=None, tags=None) -> None:
+        with open(path, "rb") as source:
+            size = os.path.getsize(path)
+            self._replace(self._path(container, name), lambda out: self._sendfile(source, out, size))
+        self._write_meta(container, name, content_type, tags)
+
+    def _blocks_dir(self, container: str, name: str) -> str:
+        return self._path(container, name, ".blocks")
+
+    def stage_block(self, container: str, name: str, index: int, data: bytes) -> None:
+        block_path = os.path.join(self._blocks_dir(container, name), f"{index:06d}")
+        self._replace(block_path, lambda out: out.write(data))
+
+    def staged_blocks(self, container: str, name: str) -> Dict[int, int]:
+        blocks_dir = self._blocks_dir(container, name)
+        if not os.path.isdir(blocks_dir):
+            return {}
+        return {
+            int(entry.name): entry.stat().st_size
+            for entry in os.scandir(blocks_dir)
+            if entry.is_file() and entry.name.isdigit()
+        }
+
+    def commit_blocks(self, container: str, name: str, indexes: List[int]) -> None:
+        blocks_dir = self._blocks_dir(container, name)
+
+        def assemble(out: BinaryIO) -> None:
+            for index in indexes:
+                block_path = os.path.join(blocks_dir, f"{index:06d}")
+                with open(block_path, "rb") as block:
+                    self._sendfile(block, out, os.path.getsize(block_path))
+
+        self._replace(self._path(container, name), assemble)
+        shutil.rmtree(blocks_dir, ignore_errors=True)
+
+    def delete(self, container: str, name: str) -> None:
+        for path in (self._path(container, name), self._path(container, name + ".json", ".meta")):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def delete_batch(self, container: str, names: Iterable[str]) -> Tuple[List[str], List[str]]:
+        deleted: List[str] = []
+        failed: List[str] = []
+        for name in dict.fromkeys(name for name in names if name):
+            try:
+                self.delete(container, name)
+                deleted.append(name)
+            except (OSError, ValueError) as exc:
+                logging.warning("Failed to delete %s/%s: %s", container, name, str(exc))
+                failed.append(name)
+        return deleted, failed
+
+    def list_blobs(self, container: str) -> Iterator[Tuple[str, Optional[datetime]]]:
+        base = os.path.join(self.root, container)
+        for directory, subdirs, files in os.walk(base):
+            # Skip .meta, .blocks and temporary files
+            subdirs[:] = [d for d in subdirs if not d.startswith(".")]
+            for filename in files:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(directory, filename)
+                modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+                yield os.path.relpath(path, base).replace(os.sep, "/"), modified
+
+    def find_by_tag_before(self, container, tag, value, page_size=DELETE_BATCH_SIZE) -> Iterator[List[str]]:
+        page: List[str] = []
+        for name, _ in self.list_blobs(container):
+            tag_value = self._read_meta(container, name).get("tags", {}).get(tag)
+            if tag_value is not None and tag_value < value:
+                page.append(name)
+                if len(page) >= page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def sign_url(self, container, name, permission="r", expiry_minutes=60, cache=True) -> Tuple[str, datetime]:
+        if set(permission) & set("acw"):
+            # The tree is served read-only (or not at all); nothing accepts a PUT
+            raise SignedWriteUnsupported(
+                "The local storage backend cannot issue upload URLs; "
+                "use POST /api/upload or the chunked upload endpoints"
+            )
+        # Not signed: the local tree is trusted (served by a proxy or read in place)
+        return (
+            f"{self.base_url}/{container}/{quote(name, safe='~/')}",
+            datetime.utcnow() + timedelta(minutes=expiry_minutes),
+        )
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+BACKENDS = {"azure": AzureBlobStorage, "local": LocalFileStorage}
+
+
+def get_storage() -> StorageBackend:
+    """Process-wide backend selected by STORAGE_BACKEND."""
+    global _storage
+
+    if _storage is not None:
+        return _storage
+    with _storage_lock:
+        if _storage is None:
+            backend = BACKENDS.get(STORAGE_BACKEND)
+            if backend is None:
+                raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r} (expected {', '.join(BACKENDS)})")
+            _storage = backend()
+            logging.info("Using %s storage backend", _storage.name)
+        return _storage
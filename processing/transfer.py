@@ -0,0 +1,293 @@
+"""Adaptive parallel ranged transfers for Azure Blob Storage.
+
+Block size and concurrency are picked per transfer from the object size and
+the per-connection throughput observed on earlier transfers:
+
+    concurrency = TRANSFER_TARGET_MBPS / observed MB/s per connection
+    block_size  = size / (concurrency * BLOCKS_PER_WORKER), within limits
+
+so a fast network gets few large blocks and a slow one more connections,
+up to TRANSFER_MAX_CONCURRENCY. Objects up to TRANSFER_SINGLE_SHOT_MB go in
+one request.
+
+Downloads fetch byte ranges in parallel and write each range straight to its
+final place: into a preallocated bytearray through a memoryview, or into a
+file with os.pwrite at the range offset (no shared file position, no join of
+partial buffers). Uploads stage blocks in parallel and commit the block list.
+Every transfer is logged with its MB/s and counted in `get_transfer_stats()`.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from azure.storage.blob import BlobClient, ContentSettings
+
+
+MIB = 1024 * 1024
+
+SINGLE_SHOT_SIZE = int(float(os.getenv("TRANSFER_SINGLE_SHOT_MB", "8")) * MIB)
+MAX_CONCURRENCY = int(os.getenv("TRANSFER_MAX_CONCURRENCY", "16"))
+# Aggregate throughput to aim for (roughly the instance's NIC share)
+TARGET_MBPS = float(os.getenv("TRANSFER_TARGET_MBPS", "400"))
+MIN_BLOCK_SIZE = 4 * MIB
+MAX_BLOCK_SIZE = 64 * MIB
+BLOCKS_PER_WORKER = 4
+# Per-connection MB/s assumed before anything has been measured
+DEFAULT_STREAM_MBPS = 25.0
+# Weight of the newest measurement in the moving average
+EWMA_ALPHA = 0.3
+
+DOWNLOAD = "download"
+UPLOAD = "upload"
+
+
+class TransferStats:
+    """Moving average of per-connection throughput, per direction."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stream_mbps: Dict[str, float] = {}
+        self._totals: Dict[str, Dict] = {}
+        self._last: Dict[str, Dict] = {}
+
+    def stream_mbps(self, direction: str) -> float:
+        with self._lock:
+            return self._stream_mbps.get(direction, DEFAULT_STREAM_MBPS)
+
+    def record(self, report: Dict) -> None:
+        direction = report["direction"]
+        per_stream = report["mb_per_s"] / max(1, report["concurrency"])
+        with self._lock:
+            if report["bytes"] >= SINGLE_SHOT_SIZE and per_stream > 0:
+                # Small objects are latency-bound; they would drag the estimate down
+                previous = self._stream_mbps.get(direction)
+                self._stream_mbps[direction] = (
+                    per_stream if previous is None else EWMA_ALPHA * per_stream + (1 - EWMA_ALPHA) * previous
+                )
+            totals = self._totals.setdefault(direction, {"transfers": 0, "bytes": 0, "seconds": 0.0})
+            totals["transfers"] += 1
+            totals["bytes"] += report["bytes"]
+            totals["seconds"] += report["seconds"]
+            self._last[direction] = report
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                direction: {
+                    **totals,
+                    "seconds": round(totals["seconds"], 3),
+                    "mb_per_s": round(totals["bytes"] / MIB / totals["seconds"], 1) if totals["seconds"] else None,
+                    "stream_mb_per_s": round(self._stream_mbps.get(direction, DEFAULT_STREAM_MBPS), 1),
+                    "last": self._last.get(direction),
+                }
+                for direction, totals in self._totals.items()
+            }
+
+
+_stats = TransferStats()
+
+
+def get_transfer_stats() -> TransferStats:
+    return _stats
+
+
+def plan_transfer(size: int, direction: str) -> Tuple[int, int]:
+    """Block size and concurrency for an object of `size` bytes.
+
+    Returns:
+        Tuple of (block_size, concurrency)
+    """
+    if size <= SINGLE_SHOT_SIZE:
+        return max(size, 1), 1
+
+    concurrency = math.ceil(TARGET_MBPS / max(_stats.stream_mbps(direction), 1.0))
+    concurrency = max(2, min(MAX_CONCURRENCY, concurrency))
+
+    block_size = size // (concurrency * BLOCKS_PER_WORKER)
+    block_size = max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, block_size))
+    block_size = math.ceil(block_size / MIB) * MIB
+
+    return block_size, max(1, min(concurrency, math.ceil(size / block_size)))
+
+
+def _ranges(size: int, block_size: int) -> List[Tuple[int, int]]:
+    return [(offset, min(block_size, size - offset)) for offset in range(0, size, block_size)]
+
+
+def _report(direction: str, size: int, started: float, block_size: int, concurrency: int, name: str) -> Dict:
+    seconds = max(time.perf_counter() - started, 1e-6)
+    report = {
+        "direction": direction,
+        "blob": name,
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "mb_per_s": round(size / MIB / seconds, 1),
+        "block_size": block_size,
+        "concurrency": concurrency,
+    }
+    _stats.record(report)
+    logging.info(
+        "Transfer %s %s: %.1f MB in %.2fs (%.1f MB/s, %d x %d MiB)",
+        direction, name, size / MIB, seconds, report["mb_per_s"], concurrency, block_size // MIB,
+    )
+    return report
+
+
+class _ViewWriter:
+    """Write-only stream over a slice of a preallocated buffer."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def write(self, data) -> int:
+        size = len(data)
+        self._view[self._position:self._position + size] = data
+        self._position += size
+        return size
+
+
+class _FileRangeWriter:
+    """Write-only stream that lands at a fixed file offset via os.pwrite."""
+
+    def __init__(self, fd: int, offset: int):
+        self._fd = fd
+        self._position = offset
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self._fd, view, self._position)
+            self._position += written
+            view = view[written:]
+        return len(data)
+
+
+def _parallel(function, ranges: List[Tuple[int, int]], concurrency: int) -> None:
+    if concurrency == 1:
+        for offset, length in ranges:
+            function(offset, length)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # list() re-raises the first worker error
+        list(pool.map(lambda item: function(*item), ranges))
+
+
+def download_bytes(blob_client: "BlobClient", size: Optional[int] = None) -> bytearray:
+    """Download a whole blob into one preallocated buffer (returned without copying)."""
+    if size is None:
+        size = blob_client.get_blob_properties().size
+    block_size, concurrency = plan_transfer(size, DOWNLOAD)
+    started = time.perf_counter()
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def fetch(offset: int, length: int) -> None:
+        blob_client.download_blob(offset=offset, length=length).readinto(_ViewWriter(view[offset:offset + length]))
+
+    if size:
+        _parallel(fetch, _ranges(size, block_size), concurrency)
+    _report(DOWNLOAD, size, started, block_size, concurrency, blob_client.blob_name)
+    return buffer
+
+
+def download_to_file(blob_client: "BlobClient", fileobj: BinaryIO, size: Optional[int] = None) -> int:
+    """Download a blob into an open file starting at its current position.
+
+    The file is extended to its final size first; each range is written at
+    its own offset, and the file position ends after the data.
+
+    Returns:
+        Bytes written
+    """
+    if size is None:
+        size = blob_client.get_blob_properties().size
+    block_size, concurrency = plan_transfer(size, DOWNLOAD)
+    started = time.perf_counter()
+
+    fileobj.flush()
+    fd = fileobj.fileno()
+    base = fileobj.tell()
+    os.ftruncate(fd, base + size)
+
+    def fetch(offset: int, length: int) -> None:
+        blob_client.download_blob(offset=offset, length=length).readinto(_FileRangeWriter(fd, base + offset))
+
+    if size:
+        _parallel(fetch, _ranges(size, block_size), concurrency)
+    fileobj.seek(base + size)
+    _report(DOWNLOAD, size, started, block_size, concurrency, blob_client.blob_name)
+    return size
+
+
+def _upload_blocks(
+    blob_client: "BlobClient",
+    size: int,
+    read_range,
+    content_settings: Optional["ContentSettings"],
+    tags: Optional[Dict[str, str]],
+) -> Dict:
+    from azure.storage.blob import BlobBlock
+
+    block_size, concurrency = plan_transfer(size, UPLOAD)
+    started = time.perf_counter()
+
+    if concurrency == 1:
+        blob_client.upload_blob(
+            read_range(0, size), overwrite=True, content_settings=content_settings, tags=tags
+        )
+        return _report(UPLOAD, size, started, block_size, concurrency, blob_client.blob_name)
+
+    ranges = _ranges(size, block_size)
+    # Unique per upload, so a concurrent writer's blocks never mix with ours
+    prefix = uuid.uuid4().hex[:16]
+    block_ids = [f"{prefix}-{index:06d}" for index in range(len(ranges))]
+
+    def stage(offset: int, length: int) -> None:
+        blob_client.stage_block(block_ids[offset // block_size], read_range(offset, length), length=length)
+
+    _parallel(stage, ranges, concurrency)
+    blob_client.commit_block_list(
+        [BlobBlock(block_id=block_id) for block_id in block_ids],
+        content_settings=content_settings,
+        tags=tags,
+    )
+    return _report(UPLOAD, size, started, block_size, concurrency, blob_client.blob_name)
+
+
+def upload_bytes(
+    blob_client: "BlobClient",
+    data: bytes,
+    content_settings: Optional["ContentSettings"] = None,
+    tags: Optional[Dict[str, str]] = None,
+) -> Dict:
+    """Upload bytes, staging blocks in parallel for large payloads."""
+    view = memoryview(data)
+    return _upload_blocks(
+        blob_client, len(data), lambda offset, length: bytes(view[offset:offset + length]), content_settings, tags
+    )
+
+
+def upload_file(
+    blob_client: "BlobClient",
+    path: str,
+    content_settings: Optional["ContentSettings"] = None,
+    tags: Optional[Dict[str, str]] = None,
+) -> Dict:
+    """Upload a local file; workers read their blocks with os.pread."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return _upload_blocks(
+            blob_client, os.fstat(fd).st_size, lambda offset, length: os.pread(fd, length, offset),
+            content_settings, tags,
+        )
+    finally:
+        os.close(fd)
@@ -1,33 +1,53 @@
 import json
 import logging
 import os
-import subprocess
-import tempfile
 import time
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 
-from azure.storage.blob import BlobServiceClient
-from azure.core.exceptions import ResourceExistsError
-from processing import generate_processed_blob_sas_url
+from processing.admission import DOWNGRADE, assess_video, enforce
+from processing.capabilities import H264_ENCODERS, select_h264_encoder
 from processing.config import get_video_config
-
-
-def _get_video_info(input_path: str) -> Optional[Dict]:
+from processing.deadline import Deadline, DeadlineExceeded, run_process
+from processing.ffmpeg_log import FFmpegLog
+from processing.naming import processed_blob_name
+from processing.previews import filter_graph, finalize_previews, output_args, plan_previews, upload_outputs
+from processing.ratecontrol import plan_rate_control, rate_control_args
+from processing.retention import EXPIRY_TAG, expiry_tags
+from processing.scheduler import ENCODE_QUEUE_TIMEOUT, PRIORITY_BATCH, encode_slot
+from processing.scratch import scratch_dir
+from processing.segments import (
+    concat_segments,
+    delete_segments,
+    encode_segments,
+    load_manifest,
+    manifest_key,
+    plan_segments,
+)
+from processing.storage import UPLOADS_CONTAINER, get_storage
+
+
+# Scratch reserved on top of the video files for poster, sprite and preview loop
+PREVIEW_SCRATCH_BYTES = 32 * 1024 * 1024
+
+
+def _get_video_info(input_path: str, deadline: Optional[Deadline] = None) -> Optional[Dict]:
     """Get video metadata using ffprobe.
 
     Returns:
-        Dict with codec_name, width, height, bit_rate, or None if failed
+        Dict with codec_name, width, height, bit_rate, nb_frames, avg_frame_rate
+        and duration (from the container if the stream lacks it), or None if failed
     """
     try:
         cmd = [
             "ffprobe",
             "-v", "error",
             "-select_streams", "v:0",
-            "-show_entries", "stream=codec_name,width,height,bit_rate",
+            "-show_entries",
+            "stream=codec_name,width,height,bit_rate,nb_frames,avg_frame_rate,r_frame_rate,duration:format=duration",
             "-of", "json",
             input_path,
         ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
+        result = run_process(cmd, deadline, "probe", timeout=10)
 
         if result.returncode != 0:
             logging.warning("ffprobe failed: %s", result.stderr)
@@ -37,13 +57,18 @@ def _get_video_info(input_path: str) -> Optional[Dict]:
         if not data.get("streams"):
             return None
 
-        return data["streams"][0]
+        info = data["streams"][0]
+        if not info.get("duration"):
+            info["duration"] = data.get("format", {}).get("duration")
+        return info
+    except DeadlineExceeded:
+        raise
     except Exception as exc:
         logging.warning("Failed to get video info: %s", str(exc))
         return None
 
 
-def _should_skip_reencoding(input_path: str, config: Dict) -> bool:
+def _should_skip_reencoding(input_path: str, config: Dict, video_info: Optional[Dict] = None) -> bool:
     """Check if video is already optimal and can skip re-encoding.
 
     A video is optimal if:
@@ -54,6 +79,7 @@ def _should_skip_reencoding(input_path: str, config: Dict) -> bool:
     Args:
         input_path: Path to input video
         config: Encoding configuration
+        video_info: Already probed stream info (probed again if omitted)
 
     Returns:
         True if re-encoding can be skipped
@@ -61,7 +87,8 @@ def _should_skip_reencoding(input_path: str, config: Dict) -> bool:
     if not config.get("skip_reencoding_if_optimal", False):
         return False
 
-    video_info = _get_video_info(input_path)
+    if video_info is None:
+        video_info = _get_video_info(input_path)
     if not video_info:
         # If we can't get info, better to re-encode to be safe
         return False
@@ -99,23 +126,48 @@ def _should_skip_reencoding(input_path: str, config: Dict) -> bool:
         return False
 
 
-def _build_ffmpeg_cmd(input_path: str, output_path: str, config: Dict, skip_reencoding: bool = False) -> list[str]:
-    """Build FFmpeg command for VBR H.264 compression (web-compatible MP4).
+def _scale_filter(config: Dict) -> str:
+    """Scale to max resolution, ensure dimensions divisible by 2 (H.264 requirement)."""
+    max_width = config.get("max_width", 1280)
+    max_height = config.get("max_height", 720)
+    return (
+        f"scale='min({max_width},iw)':'min({max_height},ih)':force_original_aspect_ratio=decrease,"
+        "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+    )
+
+
+def _build_ffmpeg_cmd(
+    input_path: str,
+    output_path: str,
+    config: Dict,
+    skip_reencoding: bool = False,
+    rate_plan: Optional[Dict] = None,
+    pass_number: Optional[int] = None,
+    passlog_prefix: Optional[str] = None,
+    previews: Optional[List[Dict]] = None,
+    segment: Optional[Tuple[float, float]] = None,
+) -> list[str]:
+    """Build FFmpeg command for H.264 compression (web-compatible MP4).
 
     Args:
         input_path: Input video file path
         output_path: Output video file path
         config: Encoding configuration from get_video_config()
         skip_reencoding: If True, use stream copy (fast, no re-encoding)
+        rate_plan: Plan from plan_rate_control(); defaults to ABR
+        pass_number: 1 or 2 for two-pass encodes (pass 1 writes no output)
+        passlog_prefix: Stats file prefix shared by both passes
+        previews: Outputs from plan_previews(), rendered from the same decode
+        segment: (start, duration) in seconds to encode only that range
 
     Returns:
         FFmpeg command as list of strings
     """
-    cmd: list[str] = [
-        "ffmpeg",
-        "-i",
-        input_path,
-    ]
+    cmd: list[str] = ["ffmpeg", "-hide_banner"]
+    if segment:
+        # Input seeking: only this range is decoded
+        cmd.extend(["-ss", f"{segment[0]:.3f}", "-t", f"{segment[1]:.3f}"])
+    cmd.extend(["-i", input_path])
 
     if skip_reencoding:
         # Stream copy - no re-encoding, just remux and apply faststart
@@ -124,20 +176,29 @@ def _build_ffmpeg_cmd(input_path: str, output_path: str, config: Dict, skip_reen
             "-c:v", "copy",  # Copy video stream without re-encoding
         ])
     else:
-        # Full re-encoding with configured parameters
-        max_width = config.get("max_width", 1280)
-        max_height = config.get("max_height", 720)
-
-        cmd.extend([
-            "-c:v", "libx264",  # H.264 codec (web-compatible)
-            "-b:v", config.get("target_bitrate", "800k"),
-            "-maxrate", config.get("max_bitrate", "1200k"),
-            "-bufsize", config.get("buffer_size", "2400k"),
-            "-preset", config.get("preset", "veryfast"),
-            "-vf",
-            # Scale to max resolution, ensure dimensions divisible by 2 (H.264 requirement)
-            f"scale='min({max_width},iw)':'min({max_height},ih)':force_original_aspect_ratio=decrease,scale=trunc(iw/2)*2:trunc(ih/2)*2",
-        ])
+        # Best H.264 encoder this ffmpeg build actually has (libx264 preferred)
+        encoder = select_h264_encoder()
+        cmd.extend(["-c:v", encoder])  # H.264 codec (web-compatible)
+        cmd.extend(rate_control_args(rate_plan or {"mode": "abr"}, config))
+        if H264_ENCODERS[encoder]["preset"]:
+            cmd.extend(["-preset", config.get("preset", "veryfast")])
+        if pass_number:
+            cmd.extend(["-pass", str(pass_number), "-passlogfile", passlog_prefix])
+        cmd.extend(["-pix_fmt", "yuv420p"])
+
+        if pass_number == 1:
+            # The first pass only collects statistics
+            cmd.extend(["-vf", _scale_filter(config), "-an", "-f", "null", "-y", os.devnull])
+            return cmd
+
+    if previews:
+        # One decode feeds the main output and every preview through split
+        graph, main_label = filter_graph(None if skip_reencoding else _scale_filter(config), previews)
+        cmd.extend(["-filter_complex", graph, "-map", main_label])
+        if not config.get("remove_audio", True):
+            cmd.extend(["-map", "0:a?"])
+    elif not skip_reencoding:
+        cmd.extend(["-vf", _scale_filter(config)])
 
     # Audio handling
     if config.get("remove_audio", True):
@@ -150,9 +211,18 @@ def _build_ffmpeg_cmd(input_path: str, output_path: str, config: Dict, skip_reen
     # Overwrite output
     cmd.extend(["-y", output_path])
 
+    if previews:
+        cmd.extend(output_args(previews))
+
     return cmd
 
 
+def _build_preview_cmd(video_path: str, previews: List[Dict]) -> list[str]:
+    """FFmpeg command rendering only the previews (from the joined segments)."""
+    graph, _ = filter_graph(None, previews)
+    return ["ffmpeg", "-hide_banner", "-y", "-i", video_path, "-filter_complex", graph, *output_args(previews)]
+
+
 def process_video(blob_name: str, job: Dict) -> Dict:
     """Process video compression with FFmpeg and upload to 'processed' container.
 
@@ -161,9 +231,15 @@ def process_video(blob_name: str, job: Dict) -> Dict:
         job: Job metadata dict, can include:
             - encoding_profile: Profile name (default, fast, high_quality, hd)
             - encoding_config: Dict of config overrides (preset, target_bitrate, etc.)
+            - deadline: Deadline of the request; ffmpeg is killed when it passes
+            - segment_manifest: Checkpoint manifest (JSON) from an earlier attempt
+            - on_checkpoint: Called with the manifest after each segment is stored
 
     Returns:
         Processing result dict with status, sizes, compression ratio, etc.
+
+    Raises:
+        DeadlineExceeded: The deadline passed or was cancelled (temp files are removed)
     """
     logging.info("=== VIDEO PROCESSING STARTED for %s ===", blob_name)
     start_time = time.time()
@@ -176,94 +252,154 @@ def process_video(blob_name: str, job: Dict) -> Dict:
     logging.info("Using encoding profile: %s (preset=%s, bitrate=%s)",
                  profile, config.get("preset"), config.get("target_bitrate"))
 
-    blob_service = BlobServiceClient.from_connection_string(
-        os.environ["AzureWebJobsStorage"]
-    )
+    storage = get_storage()
+    deadline = job.get("deadline") or Deadline()
 
     # Download original file
+    deadline.check("download")
     logging.info("Downloading original file from uploads container: %s", blob_name)
-    uploads_client = blob_service.get_blob_client(container="uploads", blob=blob_name)
-
-    with tempfile.NamedTemporaryFile(suffix=".mp4") as temp_input:
-        logging.info("Writing downloaded file to temp file (streaming): %s", temp_input.name)
-        downloader = uploads_client.download_blob(max_concurrency=4)
-        downloader.readinto(temp_input)
-        temp_input.flush()
-        logging.info("Downloaded file size: %s bytes", os.path.getsize(temp_input.name))
-
-        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as temp_output:
-            output_path = temp_output.name
-            logging.info("Created output temp file: %s", output_path)
-
-        try:
-            # Check if we can skip re-encoding
-            skip_reencoding = _should_skip_reencoding(temp_input.name, config)
-
-            # Build FFmpeg command
-            cmd = _build_ffmpeg_cmd(temp_input.name, output_path, config, skip_reencoding)
 
+    # Input, output, two-pass stats and previews share one reserved scratch
+    # directory: input + segments + joined output (each at most about the
+    # input size) plus room for previews
+    input_size = int(job.get("file_size") or 0) or storage.size(UPLOADS_CONTAINER, blob_name)
+    # ffmpeg's stderr goes to a bounded log, summarised once when the job ends
+    with scratch_dir(input_size * 3 + PREVIEW_SCRATCH_BYTES, blob_name) as work_dir, FFmpegLog(blob_name) as ffmpeg_log:
+        input_path = os.path.join(work_dir, "input.mp4")
+        output_path = os.path.join(work_dir, "output.mp4")
+        passlog_prefix = os.path.join(work_dir, "passlog")
+
+        logging.info("Writing downloaded file to scratch file (streaming): %s", input_path)
+        with open(input_path, "wb") as fh:
+            storage.download_to(UPLOADS_CONTAINER, blob_name, fh)
+        logging.info("Downloaded file size: %s bytes", os.path.getsize(input_path))
+
+        # Budget check on probed resolution/duration before decoding anything
+        deadline.check("probe")
+        video_info = _get_video_info(input_path, deadline)
+        assessment = enforce(assess_video(video_info))
+        if assessment["action"] == DOWNGRADE:
+            profile = assessment["downgrade_profile"]
+            config = get_video_config(profile, **config_overrides)
+            logging.info("Downgraded to encoding profile: %s", profile)
+
+        # Check if we can skip re-encoding
+        skip_reencoding = _should_skip_reencoding(input_path, config, video_info)
+
+        # Execute FFmpeg once a fair-share encode slot is free
+        encode_cost = 1.0 if skip_reencoding else assessment["estimated_cost_seconds"]
+        rate_plan = {"mode": "copy", "passes": 1}
+        segments = [] if skip_reencoding else plan_segments(video_info, config)
+        segment_stats = None
+        previews = plan_previews(config, video_info, work_dir)
+        with encode_slot(job, encode_cost, PRIORITY_BATCH, deadline.timeout(ENCODE_QUEUE_TIMEOUT)) as queue_wait:
+            # The encode budget starts once the slot is held, within the request's deadline
+            encode_deadline = deadline.child(config.get("max_processing_time", 300))
             if skip_reencoding:
-                logging.info("Running FFmpeg stream copy (fast): %s", " ".join(cmd))
+                cmds = [_build_ffmpeg_cmd(input_path, output_path, config, skip_reencoding, previews=previews)]
+                logging.debug("Running FFmpeg stream copy (fast): %s", " ".join(cmds[0]))
             else:
-                logging.info("Running FFmpeg H.264 compression: %s", " ".join(cmd))
-
-            # Execute FFmpeg
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=config.get("max_processing_time", 300)
-            )
-            logging.info("FFmpeg return code: %s", result.returncode)
-            logging.info("FFmpeg stdout: %s", result.stdout)
-            logging.info("FFmpeg stderr: %s", result.stderr)
-            if result.returncode != 0:
-                raise RuntimeError(f"FFmpeg failed: {result.stderr}")
-
-            # Upload compressed video with 'processed-' prefix in 'processed' container
-            # Always change extension to .mp4 since all videos are converted to H.264 MP4
-            output_blob_name = blob_name.replace('upload-', 'processed-').rsplit('.', 1)[0] + '.mp4'
-            logging.info("Uploading compressed video to processed container: %s", output_blob_name)
-            # Ensure 'processed' container exists
-            try:
-                blob_service.get_container_client("processed").create_container()
-            except ResourceExistsError:
-                pass
-            with open(output_path, "rb") as compressed_file:
-                blob_service.get_blob_client(
-                    container="processed", blob=output_blob_name
-                ).upload_blob(compressed_file, overwrite=True, max_concurrency=4)
-
-            original_size = int(job.get("file_size", 1)) or 1
-            compressed_size = os.path.getsize(output_path)
-            compression_ratio = compressed_size / float(original_size)
-            processing_time = time.time() - start_time
-
-            logging.info("Original size: %s, Compressed size: %s, Ratio: %s",
-                        original_size, compressed_size, compression_ratio)
-
-            result_dict = {
-                "status": "success",
-                "original_size": original_size,
-                "compressed_size": compressed_size,
-                "compression_ratio": compression_ratio,
-                # Provide SAS URL for secure, time-limited access
-                "output_url": generate_processed_blob_sas_url(output_blob_name),
-                "processing_time": processing_time,
-                # Encoding metadata
-                "encoding_profile": profile,
-                "encoding_preset": config.get("preset"),
-                "target_bitrate": config.get("target_bitrate"),
-                "skipped_reencoding": skip_reencoding,
-            }
-
-            logging.info("=== VIDEO PROCESSING COMPLETED SUCCESSFULLY for %s ===", blob_name)
-            logging.info("Processing time: %.2fs (skipped_reencoding=%s)", processing_time, skip_reencoding)
-            logging.info("Result: %s", result_dict)
-            return result_dict
-
-        finally:
-            if os.path.exists(output_path):
-                os.unlink(output_path)
+                key = manifest_key(config, os.path.getsize(input_path))
+                manifest = load_manifest(job.get("segment_manifest"), key) if segments else None
+                if manifest:
+                    # Resumed: keep the plan the finished segments were encoded with
+                    rate_plan = manifest["rate_plan"]
+                else:
+                    # The complexity pre-scan (auto mode) runs inside the slot: it encodes too
+                    rate_plan = plan_rate_control(
+                        input_path, video_info, config, select_h264_encoder(), _scale_filter(config),
+                        encode_deadline,
+                    )
+
+                if segments and rate_plan["passes"] == 1:
+                    manifest = manifest or {"key": key, "rate_plan": rate_plan, "done": []}
+                    segment_stats = {"count": len(segments), "reused": len(manifest["done"])}
+                    paths = encode_segments(
+                        storage, blob_name, segments, manifest,
+                        lambda start, duration, path: _build_ffmpeg_cmd(
+                            input_path, path, config, False, rate_plan, segment=(start, duration)
+                        ),
+                        work_dir, encode_deadline, job.get("on_checkpoint"), ffmpeg_log,
+                    )
+                    concat_segments(paths, output_path, config, encode_deadline, ffmpeg_log)
+                    # Previews come from the joined (already scaled) output
+                    cmds = [_build_preview_cmd(output_path, previews)] if previews else []
+                elif rate_plan["passes"] == 2:
+                    # Previews ride along with the second pass only
+                    cmds = [
+                        _build_ffmpeg_cmd(
+                            input_path, output_path, config, False, rate_plan, n, passlog_prefix,
+                            previews if n == 2 else None,
+                        )
+                        for n in (1, 2)
+                    ]
+                else:
+                    cmds = [_build_ffmpeg_cmd(input_path, output_path, config, False, rate_plan, previews=previews)]
+                for cmd in cmds:
+                    logging.debug("Running FFmpeg H.264 compression: %s", " ".join(cmd))
+
+            for n, cmd in enumerate(cmds, 1):
+                # Killed with its process group when the deadline passes or is cancelled
+                stage = "encode" if len(cmds) == 1 else f"encode {n}/{len(cmds)}"
+                result = run_process(cmd, encode_deadline, stage, log=ffmpeg_log)
+                if result.returncode != 0:
+                    raise RuntimeError(f"FFmpeg failed: {result.stderr}")
+
+        deadline.check("upload")
+        # Upload compressed video with 'processed-' prefix in 'processed' container
+        # Always change extension to .mp4 since all videos are converted to H.264 MP4
+        output_blob_name = processed_blob_name(blob_name, "mp4")
+        logging.info("Uploading compressed video to processed container: %s", output_blob_name)
+        # The video and its previews upload in parallel
+        preview_files = finalize_previews(previews, blob_name)
+        tags = expiry_tags()
+        uploaded = upload_outputs(storage, [
+            {"kind": "video", "path": output_path, "blob_name": output_blob_name, "content_type": "video/mp4"},
+            *preview_files,
+        ], tags)
+        preview_urls = {kind: entry for kind, entry in uploaded.items() if kind != "video"}
+        if segment_stats:
+            delete_segments(storage, blob_name, segment_stats["count"])
+
+        original_size = int(job.get("file_size", 1)) or 1
+        compressed_size = os.path.getsize(output_path)
+        compression_ratio = compressed_size / float(original_size)
+        processing_time = time.time() - start_time
+
+        logging.info("Original size: %s, Compressed size: %s, Ratio: %s",
+                    original_size, compressed_size, compression_ratio)
+
+        result_dict = {
+            "status": "success",
+            "original_size": original_size,
+            "compressed_size": compressed_size,
+            "compression_ratio": compression_ratio,
+            # Provide SAS URL for secure, time-limited access
+            "output_url": uploaded["video"]["url"],
+            "processed_blob_name": output_blob_name,
+            # When the expiry sweep deletes the outputs
+            "output_expires_at": tags[EXPIRY_TAG],
+            # Every blob written to the 'processed' container for this job
+            "renditions": [output_blob_name] + [entry["blob_name"] for entry in preview_urls.values()],
+            # Poster, sprite (+ VTT) and preview loop: kind -> blob_name/url
+            "previews": preview_urls,
+            "processing_time": processing_time,
+            # Encoding metadata
+            "encoding_profile": profile,
+            "encoding_preset": config.get("preset"),
+            "target_bitrate": config.get("target_bitrate"),
+            "skipped_reencoding": skip_reencoding,
+            "video_encoder": "copy" if skip_reencoding else select_h264_encoder(),
+            "rate_control": rate_plan,
+            # Checkpointed segments (long videos): count and how many a retry reused
+            "segments": segment_stats,
+            "admission": assessment,
+            "queue_wait": queue_wait,
+        }
+
+        logging.info("=== VIDEO PROCESSING COMPLETED SUCCESSFULLY for %s ===", blob_name)
+        logging.info("Processing time: %.2fs (skipped_reencoding=%s)", processing_time, skip_reencoding)
+        logging.debug("Result: %s", result_dict)
+        return result_dict
 
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Measure cold-start cost of the function app.
+
+Each run imports function_app in a fresh interpreter (what the Functions
+worker does on a cold start) and records the wall time, plus the slowest
+imports from `python -X importtime`. With --url it also times requests to a
+deployed /api/health endpoint, where the first request after a restart shows
+the cold start.
+
+Append results to a JSON-lines file with --output to track them over time:
+
+    python scripts/benchmark-cold-start.py --runs 10 --output cold-start.jsonl
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import sys, time; start = time.perf_counter(); import function_app; "
+    "print(time.perf_counter() - start, len(sys.modules))"
+)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_imports(runs: int) -> dict:
+    seconds = []
+    modules = 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            cwd=REPO_ROOT, env=_env(), capture_output=True, text=True, check=True,
+        ).stdout.split()
+        seconds.append(float(output[0]))
+        modules = int(output[1])
+
+    seconds.sort()
+    return {
+        "runs": runs,
+        "min_ms": round(seconds[0] * 1000, 1),
+        "median_ms": round(statistics.median(seconds) * 1000, 1),
+        "p95_ms": round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1000, 1),
+        "modules": modules,
+    }
+
+
+def slowest_imports(top: int) -> list:
+    """Top imports by self time from python -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import function_app"],
+        cwd=REPO_ROOT, env=_env(), capture_output=True, text=True, check=True,
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    rows.sort(key=lambda row: row["self_ms"], reverse=True)
+    return rows[:top]
+
+
+def measure_endpoint(url: str, requests: int) -> dict:
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=120) as response:
+            response.read()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "url": url,
+        "first_ms": round(timings[0] * 1000, 1),
+        "warm_median_ms": round(statistics.median(timings[1:]) * 1000, 1) if len(timings) > 1 else None,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh-interpreter imports to time")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to report")
+    parser.add_argument("--url", help="deployed health URL, e.g. https://<app>/api/health")
+    parser.add_argument("--requests", type=int, default=5, help="requests to send to --url")
+    parser.add_argument("--output", help="append the result as one JSON line to this file")
+    args = parser.parse_args()
+
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True,
+    ).stdout.strip() or "unknown"
+
+    result = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "import": measure_imports(args.runs),
+        "slowest_imports": slowest_imports(args.top),
+    }
+    if args.url:
+        result["endpoint"] = measure_endpoint(args.url, args.requests)
+
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(result) + "\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
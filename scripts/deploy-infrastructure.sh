@@ -45,6 +45,63 @@ az functionapp config appsettings set \
     "MAX_RETRY_ATTEMPTS=3" \
     "BLOB_ACCOUNT_NAME=mediablobazfct"
 
+# Direct-to-storage uploads: allow browser PUTs to the uploads container and
+# route BlobCreated events to the on_upload_blob_created function
+az storage cors add \
+  --services b \
+  --methods PUT OPTIONS \
+  --origins "*" \
+  --allowed-headers "x-ms-blob-type,x-ms-blob-content-type,content-type" \
+  --connection-string "$STORAGE_CONNECTION"
+
+STORAGE_ID=$(az storage account show \
+  --resource-group "$RESOURCE_GROUP" \
+  --name "$STORAGE_ACCOUNT" \
+  --query id --output tsv)
+FUNCTION_ID=$(az functionapp show \
+  --resource-group "$RESOURCE_GROUP" \
+  --name "$FUNCTION_APP" \
+  --query id --output tsv)
+
+az eventgrid event-subscription create \
+  --name uploads-blob-created \
+  --source-resource-id "$STORAGE_ID" \
+  --endpoint-type azurefunction \
+  --endpoint "$FUNCTION_ID/functions/on_upload_blob_created" \
+  --included-event-types Microsoft.Storage.BlobCreated \
+  --subject-begins-with /blobServices/default/containers/uploads/blobs/
+
+# Backstop for the expires_at tag sweep (expire_outputs timer): lifecycle
+# management runs daily, so it only catches what the sweep missed
+cat > /tmp/lifecycle-policy.json <<'POLICY'
+{
+  "rules": [
+    {
+      "enabled": true,
+      "name": "expire-processed-outputs",
+      "type": "Lifecycle",
+      "definition": {
+        "filters": {"blobTypes": ["blockBlob"], "prefixMatch": ["processed/processed-"]},
+        "actions": {"baseBlob": {"delete": {"daysAfterModificationGreaterThan": 1}}}
+      }
+    },
+    {
+      "enabled": true,
+      "name": "expire-stale-uploads",
+      "type": "Lifecycle",
+      "definition": {
+        "filters": {"blobTypes": ["blockBlob"], "prefixMatch": ["uploads/upload-"]},
+        "actions": {"baseBlob": {"delete": {"daysAfterModificationGreaterThan": 1}}}
+      }
+    }
+  ]
+}
+POLICY
+az storage account management-policy create \
+  --account-name "$STORAGE_ACCOUNT" \
+  --resource-group "$RESOURCE_GROUP" \
+  --policy @/tmp/lifecycle-policy.json
+
 echo "Infrastructure setup complete!"
 
 
@@ -0,0 +1,113 @@
+"""Import-time profiling for cold starts.
+
+Set STARTUP_PROFILE=1 and every module imported after `enable()` is timed
+(inclusive and self time, like `python -X importtime`, which the Functions
+host does not let us pass). The slowest imports are logged once the app has
+loaded and reported by /api/health.
+"""
+
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+
+ENABLED = os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+_process_start = time.time()
+_timings: Dict[str, Dict[str, float]] = {}
+_stack: List[List[float]] = []  # [start, time spent in nested imports]
+_finished_at: Optional[float] = None
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wraps a module loader and times exec_module."""
+
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Keep the real loader visible to code that inspects module.__loader__
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+
+        _stack.append([time.perf_counter(), 0.0])
+        try:
+            self._loader.exec_module(module)
+        finally:
+            start, nested = _stack.pop()
+            elapsed = time.perf_counter() - start
+            _timings[self._name] = {"cumulative": elapsed, "self": elapsed - nested}
+            if _stack:
+                _stack[-1][1] += elapsed
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Delegates to the other finders and wraps the loader they return."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, fullname)
+            return spec
+        return None
+
+
+_finder = _TimingFinder()
+
+
+def enable() -> None:
+    """Start timing imports if STARTUP_PROFILE is set. Call before heavy imports."""
+    if ENABLED and _finder not in sys.meta_path:
+        sys.meta_path.insert(0, _finder)
+
+
+def finish(top: int = 15) -> None:
+    """Stop timing and log the slowest imports."""
+    global _finished_at
+
+    if _finder not in sys.meta_path:
+        return
+    sys.meta_path.remove(_finder)
+    _finished_at = time.time()
+
+    report = summary(top)
+    logging.info("Startup profile: app loaded in %.3fs, %d modules imported", report["load_seconds"], report["modules"])
+    for entry in report["slowest"]:
+        logging.info(
+            "Startup profile: %-50s self %7.1fms  cumulative %7.1fms",
+            entry["module"], entry["self_ms"], entry["cumulative_ms"],
+        )
+
+
+def summary(top: int = 15) -> Dict:
+    """Import timings collected so far, slowest (by self time) first."""
+    slowest = sorted(_timings.items(), key=lambda item: item[1]["self"], reverse=True)[:top]
+    return {
+        "enabled": ENABLED,
+        "load_seconds": round((_finished_at or time.time()) - _process_start, 3),
+        "modules": len(_timings),
+        "slowest": [
+            {
+                "module": name,
+                "self_ms": round(timing["self"] * 1000, 1),
+                "cumulative_ms": round(timing["cumulative"] * 1000, 1),
+            }
+            for name, timing in slowest
+        ],
+    }
@@ -0,0 +1,179 @@
+"""In-memory stand-in for azure.data.tables.TableClient.
+
+Covers the calls integrations/ makes, with the Table Storage behaviour its
+concurrency relies on: every write gets a new ETag, and updates or deletes
+with match_condition=IfNotModified raise ResourceModifiedError once the
+ETag has moved on. Filters are comparisons joined by "and", against
+@parameters or quoted literals; a clause may be a parenthesised group of
+comparisons joined by "or".
+"""
+
+import itertools
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from unittest import mock
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+
+_CONDITION = re.compile(r"^\s*(\w+)\s+(eq|ne|lt|le|gt|ge)\s+(@\w+|'(?:[^']|'')*')\s*$")
+_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "lt": lambda a, b: a < b,
+    "le": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "ge": lambda a, b: a >= b,
+}
+
+
+class FakeEntity(dict):
+    """Entity as the SDK returns it: a dict with an ETag in .metadata."""
+
+    def __init__(self, data: Dict, etag: str):
+        super().__init__(data)
+        self.metadata = {"etag": etag}
+
+
+class _Pages:
+    def __init__(self, entities: List[FakeEntity], page_size: Optional[int]):
+        self._entities = entities
+        self._page_size = page_size or 1000
+
+    def __iter__(self) -> Iterator[FakeEntity]:
+        return iter(self._entities)
+
+    def by_page(self) -> Iterator[Iterator[FakeEntity]]:
+        for start in range(0, len(self._entities), self._page_size):
+            yield iter(self._entities[start:start + self._page_size])
+
+
+class FakeTableClient:
+    def __init__(self):
+        self.entities: Dict[Tuple[str, str], Dict] = {}
+        self._etags: Dict[Tuple[str, str], str] = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self.writes = 0
+
+    def _store(self, key: Tuple[str, str], data: Dict) -> None:
+        self.entities[key] = dict(data)
+        self._etags[key] = f'W/"{next(self._counter)}"'
+        self.writes += 1
+
+    def _check(self, key: Tuple[str, str], etag: Optional[str], match_condition) -> None:
+        if key not in self.entities:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        if match_condition == MatchConditions.IfNotModified and etag != self._etags[key]:
+            raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+
+    @staticmethod
+    def _key(entity: Dict) -> Tuple[str, str]:
+        return entity["PartitionKey"], entity["RowKey"]
+
+    def _entity(self, key: Tuple[str, str], select: Optional[List[str]] = None) -> FakeEntity:
+        data = self.entities[key]
+        if select:
+            data = {name: data[name] for name in select if name in data}
+        return FakeEntity(data, self._etags[key])
+
+    @staticmethod
+    def _compare(entity: Dict, condition: str, parameters: Dict) -> bool:
+        match = _CONDITION.match(condition)
+        if match is None:
+            raise ValueError(f"FakeTableClient cannot evaluate filter clause: {condition!r}")
+        field, operator, operand = match.groups()
+        if operand.startswith("@"):
+            value = parameters[operand[1:]]
+        else:
+            value = operand[1:-1].replace("''", "'")
+        return field in entity and _OPERATORS[operator](entity[field], value)
+
+    def _matches(self, entity: Dict, query_filter: str, parameters: Dict) -> bool:
+        for clause in query_filter.split(" and "):
+            clause = clause.strip()
+            if clause.startswith("(") and clause.endswith(")"):
+                if not any(self._compare(entity, part, parameters) for part in clause[1:-1].split(" or ")):
+                    return False
+            elif not self._compare(entity, clause, parameters):
+                return False
+        return True
+
+    def get_entity(self, partition_key: str, row_key: str, select: Optional[List[str]] = None, **kwargs) -> FakeEntity:
+        with self._lock:
+            key = (partition_key, row_key)
+            if key not in self.entities:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            return self._entity(key, select)
+
+    def create_entity(self, entity: Dict, **kwargs) -> None:
+        with self._lock:
+            key = self._key(entity)
+            if key in self.entities:
+                raise ResourceExistsError("The specified entity already exists.")
+            self._store(key, entity)
+
+    def update_entity(self, entity: Dict, mode: str = "merge", etag: Optional[str] = None,
+                      match_condition=None, **kwargs) -> None:
+        with self._lock:
+            key = self._key(entity)
+            self._check(key, etag, match_condition)
+            data = dict(self.entities[key]) if mode == "merge" else {}
+            data.update(entity)
+            self._store(key, data)
+
+    def upsert_entity(self, entity: Dict, mode: str = "merge", **kwargs) -> None:
+        with self._lock:
+            key = self._key(entity)
+            data = dict(self.entities.get(key, {})) if mode == "merge" else {}
+            data.update(entity)
+            self._store(key, data)
+
+    def delete_entity(self, partition_key: str, row_key: str, etag: Optional[str] = None,
+                      match_condition=None, **kwargs) -> None:
+        with self._lock:
+            key = (partition_key, row_key)
+            if key not in self.entities and match_condition is None:
+                return  # the SDK ignores unconditional deletes of missing entities
+            self._check(key, etag, match_condition)
+            del self.entities[key]
+            del self._etags[key]
+
+    def submit_transaction(self, operations: List[Tuple[str, Dict]], **kwargs) -> None:
+        with self._lock:
+            keys = [self._key(entity) for _, entity in operations]
+            if any(operation != "delete" for operation, _ in operations):
+                raise ValueError("FakeTableClient only supports delete transactions")
+            if any(key not in self.entities for key in keys):
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            for key in keys:
+                del self.entities[key]
+                del self._etags[key]
+
+    def query_entities(self, query_filter: str, parameters: Optional[Dict] = None,
+                       select: Optional[List[str]] = None, results_per_page: Optional[int] = None,
+                       **kwargs) -> _Pages:
+        with self._lock:
+            keys = sorted(
+                key for key, entity in self.entities.items()
+                if self._matches(entity, query_filter, parameters or {})
+            )
+            return _Pages([self._entity(key, select) for key in keys], results_per_page)
+
+    def rows(self, partition_key: str) -> List[str]:
+        """RowKeys of one partition, sorted."""
+        return sorted(row_key for pk, row_key in self.entities if pk == partition_key)
+
+
+def use_fake_table(test_case, module) -> FakeTableClient:
+    """Point `module`'s shared table client at a fresh fake for one test."""
+    table = FakeTableClient()
+    patcher = mock.patch.object(module, "_table_client", table)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    if hasattr(module, "_status_cache"):
+        module._status_cache.clear()
+        test_case.addCleanup(module._status_cache.clear)
+    return table
@@ -0,0 +1,83 @@
+import io
+import unittest
+
+from PIL import Image
+
+from processing.admission import ACCEPT, DOWNGRADE, REJECT, AdmissionRejected, assess_image, assess_video, enforce
+from processing.config import get_admission_config
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, "PNG")
+    buffer.seek(0)
+    return buffer
+
+
+class ImageAdmissionTest(unittest.TestCase):
+    config = get_admission_config(max_image_pixels=10_000, downgrade_image_pixels=2_500)
+
+    def test_budget_is_checked_from_the_header(self):
+        stream = png(40, 40)
+
+        assessment = assess_image(stream, self.config)
+
+        self.assertEqual((assessment["width"], assessment["height"], assessment["pixels"]), (40, 40, 1600))
+        self.assertEqual(assessment["action"], ACCEPT)
+        self.assertEqual(stream.tell(), 0)
+
+    def test_large_images_are_downgraded_then_rejected(self):
+        self.assertEqual(assess_image(png(60, 60), self.config)["action"], DOWNGRADE)
+
+        assessment = assess_image(png(200, 60), self.config)
+
+        self.assertEqual(assessment["action"], REJECT)
+        self.assertIn("200x60", assessment["reason"])
+        with self.assertRaises(AdmissionRejected) as caught:
+            enforce(assessment)
+        self.assertIs(caught.exception.assessment, assessment)
+
+
+class VideoAdmissionTest(unittest.TestCase):
+    config = get_admission_config(
+        max_video_pixels_per_frame=1920 * 1080,
+        max_video_duration=600,
+        max_video_frames=20_000,
+        downgrade_video_pixels=1280 * 720 * 3000,
+        downgrade_video_profile="fast",
+    )
+
+    def probe(self, width, height, duration, rate="30/1"):
+        return {"width": width, "height": height, "duration": str(duration), "avg_frame_rate": rate}
+
+    def test_frames_are_estimated_from_duration_and_rate(self):
+        assessment = assess_video(self.probe(1280, 720, 60), self.config)
+
+        self.assertEqual(assessment["frames"], 1800)
+        self.assertEqual(assessment["action"], ACCEPT)
+        self.assertAlmostEqual(
+            assessment["estimated_cost_seconds"], 1280 * 720 * 1800 / self.config["video_pixels_per_second"],
+        )
+
+    def test_expensive_videos_get_the_downgrade_profile(self):
+        assessment = assess_video(self.probe(1280, 720, 120), self.config)
+
+        self.assertEqual(assessment["action"], DOWNGRADE)
+        self.assertEqual(assessment["downgrade_profile"], "fast")
+
+    def test_limits_reject(self):
+        for probe, reason in (
+            (self.probe(3840, 2160, 10), "resolution"),
+            (self.probe(640, 360, 900), "too long"),
+            (self.probe(640, 360, 500, rate="60/1"), "too many frames"),
+        ):
+            assessment = assess_video(probe, self.config)
+            self.assertEqual(assessment["action"], REJECT)
+            self.assertIn(reason, assessment["reason"])
+
+    def test_unprobed_videos_are_left_to_ffmpeg(self):
+        self.assertEqual(assess_video(None, self.config)["action"], ACCEPT)
+
+
+if __name__ == "__main__":
+    unittest.main()
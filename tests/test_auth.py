@@ -0,0 +1,87 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import azure.functions as func
+
+from integrations import auth
+
+
+def request(api_key=None):
+    headers = {"X-Api-Key": api_key} if api_key else {}
+    return func.HttpRequest(method="GET", url="/api/status", headers=headers, body=b"")
+
+
+class KeyFileReloadTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "keys.json")
+        env = mock.patch.dict(os.environ, {
+            "COMPRESSION_API_KEYS": "", "COMPRESSION_API_KEY_DEV": "", "COMPRESSION_API_KEY_PROD": "",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        key_file = mock.patch.object(auth, "API_KEYS_FILE", self.path)
+        key_file.start()
+        self.addCleanup(key_file.stop)
+        self.authenticator = auth.ApiKeyAuthenticator(reload_seconds=3600)
+        patcher = mock.patch.object(auth, "_authenticator", self.authenticator)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, content):
+        with open(self.path, "w", encoding="utf-8") as fh:
+            fh.write(content)
+        self.authenticator.request_reload()
+
+    def test_rotated_key_is_picked_up(self):
+        self.write(json.dumps({"tenant-a": "old-key"}))
+        self.assertEqual(auth.authenticate_request(request("old-key"))[0].name, "tenant-a")
+
+        self.write(json.dumps({"tenant-a": "new-key"}))
+
+        self.assertIsNone(auth.authenticate_request(request("old-key"))[0])
+        self.assertEqual(auth.authenticate_request(request("new-key"))[0].name, "tenant-a")
+
+    def test_broken_reloads_keep_the_last_good_keys(self):
+        self.write(json.dumps({"tenant-a": "key-a"}))
+        self.assertEqual(auth.authenticate_request(request("key-a"))[0].name, "tenant-a")
+
+        for broken in ('{"tenant-a": ', '["key-a"]', "{}"):
+            with self.subTest(content=broken):
+                self.write(broken)
+                with self.assertLogs(level="ERROR"):
+                    identity, _ = auth.authenticate_request(request("key-a"))
+                self.assertEqual(identity.name, "tenant-a")
+                self.assertIsNone(auth.authenticate_request(request())[0])
+
+        os.unlink(self.path)
+        self.authenticator.request_reload()
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(auth.authenticate_request(request("key-a"))[0].name, "tenant-a")
+
+    def test_broken_key_file_from_the_start_fails_closed(self):
+        self.write('{"tenant-a": ')
+
+        with self.assertLogs(level="ERROR"):
+            identity, error = auth.authenticate_request(request("anything"))
+
+        self.assertIsNone(identity)
+        self.assertEqual(error, "Invalid API key")
+        self.assertIsNone(auth.authenticate_request(request())[0])
+
+    def test_non_object_json_is_rejected(self):
+        with self.assertRaises(auth.KeyConfigError):
+            auth._parse_named_keys('["key-a"]', "test")
+
+    def test_no_key_source_disables_authentication(self):
+        with mock.patch.object(auth, "API_KEYS_FILE", ""):
+            self.authenticator.request_reload()
+            self.assertEqual(auth.authenticate_request(request()), (auth.ANONYMOUS, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
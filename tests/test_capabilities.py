@@ -0,0 +1,82 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from processing import capabilities
+
+
+ENCODERS = """Encoders:
+ V..... = Video
+ ------
+ V....D libx264              libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V..... libopenh264          OpenH264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)
+ V....D libvpx-vp9           libvpx VP9 (codec vp9)
+"""
+FILTERS = """Filters:
+  T.. = Timeline support
+ TSC scale             V->V       Scale the input video size and/or convert the image format.
+ ... tile              V->V       Tile several successive frames together.
+"""
+
+
+def fake_ffmpeg(broken_encoders=()):
+    """Stand-in for capabilities._run answering like an ffmpeg build."""
+
+    def run(cmd):
+        if "-version" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, f"{cmd[0]} version 6.1.1 Copyright (c) 2000-2023", "")
+        if "-encoders" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, ENCODERS, "")
+        if "-filters" in cmd:
+            return subprocess.CompletedProcess(cmd, 0, FILTERS, "")
+        encoder = cmd[cmd.index("-c:v") + 1]
+        if encoder in broken_encoders:
+            return subprocess.CompletedProcess(cmd, 1, "", "Error initializing output stream")
+        return subprocess.CompletedProcess(cmd, 0, "", "")
+
+    return run
+
+
+class CapabilityProbeTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(capabilities, "_capabilities", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def probe(self, run):
+        with mock.patch.object(capabilities, "_run", side_effect=run):
+            return capabilities.probe_capabilities()
+
+    def test_preferred_working_encoder_is_picked(self):
+        result = self.probe(fake_ffmpeg())
+
+        self.assertEqual(result["ffmpeg_version"], "6.1.1")
+        self.assertEqual(result["encoders"], ["libopenh264", "libx264"])
+        self.assertEqual(result["filters"]["scale"], True)
+        self.assertEqual(result["filters"]["palettegen"], False)
+        self.assertEqual(capabilities.select_h264_encoder(), "libx264")
+
+    def test_encoder_failing_the_test_encode_is_skipped(self):
+        result = self.probe(fake_ffmpeg(broken_encoders={"libx264"}))
+
+        self.assertFalse(result["test_encodes"]["libx264"]["ok"])
+        self.assertEqual(capabilities.select_h264_encoder(), "libopenh264")
+
+    def test_missing_ffmpeg_fails_video_but_not_images(self):
+        result = self.probe(FileNotFoundError("ffmpeg"))
+
+        self.assertIsNone(result["ffmpeg_version"])
+        self.assertTrue(result["pillow_codecs"]["PNG"])
+        with self.assertRaises(RuntimeError):
+            capabilities.select_h264_encoder()
+
+    def test_probe_runs_once(self):
+        self.probe(fake_ffmpeg())
+
+        with mock.patch.object(capabilities, "_probe") as probe:
+            capabilities.probe_capabilities()
+        probe.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
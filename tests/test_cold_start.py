@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["PIL", "azure.storage.blob", "azure.data.tables", "processing.image", "processing.video"]
+PROBE = f"""
+import json, sys, threading
+import function_app, startup_profile
+print(json.dumps({{
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+    "threads": threading.active_count(),
+    "profile": startup_profile.summary(5),
+}}))
+"""
+
+
+def import_function_app(**env):
+    """Import function_app in a fresh interpreter and report what it loaded."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        env={**os.environ, "AzureWebJobsStorage": "UseDevelopmentStorage=true", **env},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    if result.returncode:
+        raise AssertionError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class ColdStartTest(unittest.TestCase):
+    def test_import_leaves_heavy_modules_and_workers_for_later(self):
+        report = import_function_app(STARTUP_PROFILE="0")
+
+        self.assertEqual(report["loaded"], [])
+        self.assertEqual(report["threads"], 1)
+        self.assertFalse(report["profile"]["enabled"])
+
+    def test_startup_profile_times_the_imports(self):
+        profile = import_function_app(STARTUP_PROFILE="1")["profile"]
+
+        self.assertTrue(profile["enabled"])
+        self.assertGreater(profile["modules"], 0)
+        self.assertEqual(len(profile["slowest"]), 5)
+        self_times = [entry["self_ms"] for entry in profile["slowest"]]
+        self.assertEqual(self_times, sorted(self_times, reverse=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
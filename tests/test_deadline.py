@@ -0,0 +1,134 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from processing import deadline as deadline_module
+from processing.deadline import Deadline, DeadlineExceeded, LeaseLost, run_process
+
+
+SLEEP = [sys.executable, "-c", "import time; time.sleep(60)"]
+# Ignores SIGTERM (noting it in argv[1]) and starts a helper in its process
+# group that ignores it too; writes the helper's pid to argv[2] once ready
+STUBBORN = """
+import signal, subprocess, sys, time
+signal.signal(signal.SIGTERM, lambda *args: open(sys.argv[1], "a").write("term\\n"))
+helper = subprocess.Popen([sys.executable, "-c",
+    "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"])
+open(sys.argv[2] + ".tmp", "w").write(str(helper.pid))
+__import__("os").rename(sys.argv[2] + ".tmp", sys.argv[2])
+time.sleep(60)
+"""
+
+
+def alive(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as fh:
+            return fh.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def wait_until(predicate, timeout=10.0):
+    give_up = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > give_up:
+            raise AssertionError("condition not reached")
+        time.sleep(0.02)
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_child_inherits_the_parents_cancel(self):
+        parent = Deadline(60)
+        child = parent.child(None)
+
+        parent.cancel("Lease lost to another worker", error=LeaseLost)
+
+        with self.assertRaises(LeaseLost) as caught:
+            child.check("encode")
+        self.assertEqual(caught.exception.stage, "encode")
+        self.assertEqual(child.cancel_reason, "Lease lost to another worker")
+
+    def test_timeout_is_not_a_lost_lease(self):
+        deadline = Deadline(0)
+
+        with self.assertRaises(DeadlineExceeded) as caught:
+            deadline.check("upload")
+        self.assertNotIsInstance(caught.exception, LeaseLost)
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "needs process groups and /proc")
+class RunProcessTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (("POLL_INTERVAL", 0.05), ("KILL_GRACE_SECONDS", 0.5)):
+            patcher = mock.patch.object(deadline_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def cancel_later(self, deadline, delay, **kwargs):
+        timer = threading.Timer(delay, deadline.cancel, kwargs=kwargs)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_finished_process_is_returned(self):
+        result = run_process([sys.executable, "-c", "print('ok')"], Deadline(30), "probe")
+
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout.strip(), "ok")
+
+    def test_passed_deadline_kills_the_process(self):
+        started = time.monotonic()
+
+        with self.assertRaises(DeadlineExceeded) as caught:
+            run_process(SLEEP, Deadline(0.3), "encode")
+
+        self.assertEqual(caught.exception.stage, "encode")
+        self.assertNotIsInstance(caught.exception, LeaseLost)
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_own_timeout_is_not_a_deadline(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            run_process(SLEEP, Deadline(30), "probe", timeout=0.3)
+
+    def test_cancel_from_another_thread_raises_lease_lost(self):
+        deadline = Deadline(30)
+        self.cancel_later(deadline, 0.3, reason="Lease lost to another worker", error=LeaseLost)
+
+        with self.assertRaises(LeaseLost) as caught:
+            run_process(SLEEP, deadline, "encode")
+
+        self.assertEqual(caught.exception.reason, "Lease lost to another worker")
+
+    def test_group_is_killed_when_sigterm_is_ignored(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        term_log = os.path.join(root.name, "term")
+        pid_file = os.path.join(root.name, "helper.pid")
+        deadline = Deadline(30)
+
+        def cancel_when_ready():
+            wait_until(lambda: os.path.exists(pid_file))
+            deadline.cancel("Cancelled")
+
+        canceller = threading.Thread(target=cancel_when_ready)
+        canceller.start()
+        with mock.patch.object(deadline_module.os, "killpg", wraps=os.killpg) as killpg:
+            with self.assertRaises(DeadlineExceeded):
+                run_process([sys.executable, "-c", STUBBORN, term_log, pid_file], deadline, "encode")
+        canceller.join()
+
+        self.assertEqual([c.args[1] for c in killpg.call_args_list], [signal.SIGTERM, signal.SIGKILL])
+        with open(term_log) as fh:
+            self.assertEqual(fh.read(), "term\n")
+        with open(pid_file) as fh:
+            helper_pid = int(fh.read())
+        wait_until(lambda: not alive(helper_pid))
+
+
+if __name__ == "__main__":
+    unittest.main()
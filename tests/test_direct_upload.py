@@ -0,0 +1,116 @@
+import base64
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import azure.functions as func
+
+os.environ.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+import function_app  # noqa: E402
+from integrations import tracking  # noqa: E402
+from processing import generate_upload_blob_sas_url, signing, storage  # noqa: E402
+from processing.storage import UPLOADS_CONTAINER, LocalFileStorage, SignedWriteUnsupported  # noqa: E402
+from tests.fakes import use_fake_table  # noqa: E402
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+ACCOUNT_KEY = base64.b64encode(b"k" * 64).decode()
+
+
+def blob_created(blob_name, size=4096):
+    return func.EventGridEvent(
+        id="1",
+        data={"contentLength": size},
+        topic="/subscriptions/x/resourceGroups/media/providers/Microsoft.Storage/storageAccounts/media",
+        subject=f"/blobServices/default/containers/{UPLOADS_CONTAINER}/blobs/{blob_name}",
+        event_type="Microsoft.Storage.BlobCreated",
+        event_time=datetime.now(timezone.utc),
+        data_version="1",
+    )
+
+
+class UploadUrlTest(unittest.TestCase):
+    def test_url_only_lets_the_client_write_its_own_blob(self):
+        connection_string = (
+            f"DefaultEndpointsProtocol=https;AccountName=media;AccountKey={ACCOUNT_KEY};EndpointSuffix=core.windows.net"
+        )
+        with mock.patch.dict(os.environ, {"AzureWebJobsStorage": connection_string}), \
+                mock.patch.object(storage, "_storage", storage.AzureBlobStorage(connection_string)), \
+                mock.patch.object(signing, "_signer", None):
+            url, expires_on = generate_upload_blob_sas_url(BLOB, expiry_minutes=15)
+
+        parts = urlsplit(url)
+        self.assertEqual(parts.path, f"/{UPLOADS_CONTAINER}/{BLOB}")
+        query = parse_qs(parts.query)
+        self.assertEqual(query["sp"], ["cw"])
+        self.assertEqual(query["sr"], ["b"])
+        lifetime = expires_on.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)
+        self.assertAlmostEqual(lifetime.total_seconds(), 15 * 60, delta=5)
+
+    def test_local_storage_refuses_upload_urls(self):
+        with tempfile.TemporaryDirectory() as root:
+            with self.assertRaises(SignedWriteUnsupported):
+                LocalFileStorage(root, "https://media.example").sign_url(UPLOADS_CONTAINER, BLOB, "cw")
+
+
+class BlobCreatedTest(unittest.TestCase):
+    handler = staticmethod(function_app.on_upload_blob_created.build().get_user_function())
+
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        self.storage = mock.Mock()
+        for name, value in (
+            ("_start_background_workers", mock.Mock()),
+            ("_run_processing", mock.Mock(return_value={})),
+            ("get_storage", mock.Mock(return_value=self.storage)),
+        ):
+            patcher = mock.patch.object(function_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_pending_direct_upload_is_processed(self):
+        tracking.create_job_record(BLOB, 0, "mp4", status="awaiting_upload", previews="poster")
+
+        self.handler(blob_created(BLOB))
+
+        args = function_app._run_processing.call_args.args
+        self.assertEqual(args[:3], (BLOB, 4096, "mp4"))
+        self.assertEqual(args[5], "poster")
+        self.storage.delete.assert_called_once_with(UPLOADS_CONTAINER, BLOB)
+
+    def test_uploads_through_the_function_are_ignored(self):
+        tracking.create_job_record(BLOB, 4096, "mp4")
+
+        self.handler(blob_created(BLOB))
+        self.handler(blob_created("upload-3f-unknown.mp4"))
+
+        function_app._run_processing.assert_not_called()
+        self.storage.delete.assert_not_called()
+
+    def test_oversized_upload_fails_the_job(self):
+        tracking.create_job_record(BLOB, 0, "mp4", status="awaiting_upload")
+
+        self.handler(blob_created(BLOB, size=function_app.MAX_UPLOAD_SIZE + 1))
+
+        function_app._run_processing.assert_not_called()
+        self.assertEqual(tracking.get_job_status(BLOB)["status"], "failed")
+        self.storage.delete.assert_called_once_with(UPLOADS_CONTAINER, BLOB)
+
+
+class ActivationTest(unittest.TestCase):
+    def test_landed_upload_activates_the_pending_record(self):
+        table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 0, "mp4", status="awaiting_upload", tenant="acme")
+
+        tracking.create_job_record(BLOB, 4096, "mp4", tenant="acme")
+
+        record = table.entities[("jobs", BLOB)]
+        self.assertEqual((record["status"], record["file_size"]), ("queued", 4096))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from integrations import tracking
+from processing.segments import SEGMENT_TTL_MINUTES
+from tests.fakes import use_fake_table
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+def after(minutes: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=minutes)
+
+
+class ExpiryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+
+    def record(self):
+        return self.table.entities.get(("jobs", BLOB))
+
+    def test_finished_job_is_indexed_and_expires(self):
+        tracking.update_job_status(BLOB, "failed", error_message="boom")
+
+        expires_at = self.record()["expires_at"]
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [f"{expires_at}|{BLOB}"])
+
+        self.assertEqual(tracking.expire_job_records(now=after(1)), 0)
+        self.assertIsNotNone(self.record())
+
+        self.assertEqual(tracking.expire_job_records(now=after(tracking.JOB_RECORD_TTL_MINUTES + 1)), 1)
+        self.assertIsNone(self.record())
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [])
+        self.assertIsNone(tracking.get_job_status(BLOB))
+
+    def test_requeued_job_drops_its_index_row(self):
+        tracking.update_job_status(BLOB, "failed", error_message="boom")
+        tracking.update_job_status(BLOB, "queued", retry_count=1)
+
+        self.assertNotIn("expires_at", self.record())
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [])
+
+    def test_claim_drops_the_index_row_of_a_failed_job(self):
+        tracking.update_job_status(BLOB, "failed", error_message="boom")
+
+        claimed, job = tracking.claim_job(BLOB, "owner-1")
+
+        self.assertTrue(claimed)
+        self.assertNotIn("expires_at", self.record())
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [])
+
+    def test_stale_row_does_not_delete_a_running_job(self):
+        tracking.update_job_status(BLOB, "failed", error_message="boom")
+        stale_row = self.table.rows(tracking.EXPIRY_PARTITION)[0]
+        tracking.claim_job(BLOB, "owner-1")
+        # A row left behind, e.g. by an instance that died between the two writes
+        self.table.upsert_entity({"PartitionKey": tracking.EXPIRY_PARTITION, "RowKey": stale_row, "blob_name": BLOB})
+
+        self.assertEqual(tracking.expire_job_records(now=after(tracking.JOB_RECORD_TTL_MINUTES + 1)), 0)
+
+        self.assertEqual(self.record()["status"], "processing")
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [])
+        self.assertTrue(tracking.renew_lease(BLOB, "owner-1"))
+
+    def test_refinished_job_keeps_only_its_latest_row(self):
+        tracking.update_job_status(BLOB, "failed", error_message="first")
+        tracking.claim_job(BLOB, "owner-1")
+        tracking.update_job_status(BLOB, "completed", result={"processed_blob_name": "processed-x.mp4"})
+
+        expires_at = self.record()["expires_at"]
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [f"{expires_at}|{BLOB}"])
+
+    def test_failed_job_with_checkpoints_outlives_the_record_ttl(self):
+        tracking.save_segment_manifest(BLOB, {"key": "k", "done": [0, 1], "count": 4})
+        tracking.update_job_status(BLOB, "failed", error_message="deadline")
+
+        self.assertEqual(tracking.expire_job_records(now=after(tracking.JOB_RECORD_TTL_MINUTES + 1)), 0)
+        self.assertIsNotNone(self.record())
+        self.assertEqual(tracking.expire_job_records(now=after(SEGMENT_TTL_MINUTES + 1)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import io
+import unittest
+
+from processing.ffmpeg_log import FFmpegLog, parse_progress
+
+
+PROGRESS = "frame= 1200 fps= 48 q=28.0 size=    2048kB time=00:00:40.00 bitrate= 419.4kbits/s speed=1.6x"
+
+
+class ParseProgressTest(unittest.TestCase):
+    def test_progress_line(self):
+        stats = parse_progress(PROGRESS)
+
+        self.assertEqual(stats["time"], "00:00:40.00")
+        self.assertEqual(stats["frame"], 1200)
+        self.assertEqual(stats["speed"], 1.6)
+        self.assertEqual(stats["size_kb"], 2048)
+
+    def test_other_lines(self):
+        self.assertIsNone(parse_progress("Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'in.mp4':"))
+        self.assertIsNone(parse_progress("[libx264 @ 0x55] frame I:5 Avg QP:20.1 size: 40000"))
+
+
+class FFmpegLogTest(unittest.TestCase):
+    def run_stage(self, log, stage, lines, returncode):
+        log.capture(io.StringIO("".join(line + "\n" for line in lines)), stage).join()
+        log.finish(returncode)
+
+    def test_ring_buffer_keeps_the_last_lines_only(self):
+        log = FFmpegLog("job", max_lines=3)
+
+        self.run_stage(log, "encode", [f"line {n}" for n in range(10)] + [PROGRESS] * 50, 0)
+
+        self.assertEqual(log.tail().splitlines(), ["[encode] line 7", "[encode] line 8", "[encode] line 9"])
+        self.assertEqual(log.dropped, 7)
+        self.assertEqual(log.runs[0]["progress"]["frame"], 1200)
+
+    def test_summary_has_the_tail_only_when_a_run_failed(self):
+        log = FFmpegLog("job")
+        self.run_stage(log, "probe", ["ok"], 0)
+        self.assertNotIn("stderr_tail", log.summary())
+
+        self.run_stage(log, "encode", ["Conversion failed!"], 1)
+        summary = log.summary()
+
+        self.assertTrue(log.failed)
+        self.assertIn("[encode] Conversion failed!", summary["stderr_tail"])
+        self.assertEqual([run["stage"] for run in summary["runs"]], ["probe", "encode"])
+        self.assertNotIn("started", summary["runs"][0])
+
+    def test_emit_logs_one_event(self):
+        log = FFmpegLog("job")
+        self.run_stage(log, "encode", [PROGRESS], 0)
+
+        with self.assertLogs(level="INFO") as captured:
+            with log:
+                pass
+
+        self.assertEqual(len(captured.records), 1)
+        self.assertIn("FFmpeg summary", captured.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
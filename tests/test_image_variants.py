@@ -0,0 +1,105 @@
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from processing import image as image_module
+from processing import storage
+from processing.image import parse_variant_request, process_image
+from processing.storage import PROCESSED_CONTAINER, UPLOADS_CONTAINER, LocalFileStorage
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.png"
+
+
+def png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def stripes(width, height):
+    """Black and white one-pixel columns: any real downscale turns them grey."""
+    image = Image.new("L", (width, height))
+    image.putdata([255 * (x % 2) for _ in range(height) for x in range(width)])
+    return image
+
+
+class VariantRequestTest(unittest.TestCase):
+    def test_request_field(self):
+        with mock.patch.object(image_module, "SRCSET_WIDTHS", [320, 640, 1024, 2048]):
+            self.assertEqual(parse_variant_request("poster,srcset"), [320, 640, 1024, 2048])
+            self.assertEqual(parse_variant_request("640, 320,4096,wide"), [320, 640])
+            with mock.patch.object(image_module, "SRCSET_DEFAULT", False):
+                self.assertEqual(parse_variant_request(None), [])
+            with mock.patch.object(image_module, "SRCSET_DEFAULT", True):
+                self.assertEqual(parse_variant_request(""), [320, 640, 1024, 2048])
+
+
+class ProcessImageVariantsTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.storage = LocalFileStorage(root.name, "https://media.example")
+        patcher = mock.patch.object(storage, "_storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(self, source, widths):
+        self.storage.write(UPLOADS_CONTAINER, BLOB, png(source))
+        return process_image(BLOB, {"tenant": "acme", "variant_widths": widths})
+
+    def stored(self, entry):
+        with Image.open(io.BytesIO(self.storage.read(PROCESSED_CONTAINER, entry["blob_name"]))) as output:
+            output.load()
+            return output
+
+    def test_srcset_ladder_from_one_decode(self):
+        result = self.process(Image.new("RGB", (1500, 1000), (40, 120, 200)), [320, 640, 1024, 2048])
+
+        srcset = result["srcset"]
+        self.assertEqual(
+            [(entry["width"], entry["height"]) for entry in srcset],
+            [(320, 214), (640, 427), (1024, 683), (1500, 1000)],
+        )
+        self.assertEqual(srcset[-1]["blob_name"], result["processed_blob_name"])
+        self.assertEqual(sorted(result["previews"]), ["w1024", "w320", "w640"])
+        self.assertEqual(sorted(result["renditions"]), sorted(entry["blob_name"] for entry in srcset))
+        for entry in srcset:
+            output = self.stored(entry)
+            self.assertEqual((output.format, output.size), ("WEBP", (entry["width"], entry["height"])))
+            self.assertEqual(entry["url"], f"https://media.example/{PROCESSED_CONTAINER}/{entry['blob_name']}")
+
+    def test_no_variants_without_a_request(self):
+        result = self.process(Image.new("RGB", (800, 600)), [])
+
+        self.assertEqual((result["srcset"], result["previews"]), ([], {}))
+        self.assertEqual(result["renditions"], [result["processed_blob_name"]])
+
+    def test_palette_variants_are_resampled_not_picked(self):
+        result = self.process(stripes(800, 100).convert("P"), [400])
+
+        variant = self.stored(result["previews"]["w400"]).convert("L")
+        self.assertEqual(variant.size, (400, 50))
+        self.assertTrue(any(60 < value < 200 for value in variant.tobytes()))
+
+    def test_transparent_palette_keeps_its_alpha(self):
+        source = Image.new("P", (600, 300), 1)
+        source.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+        source.paste(0, (0, 0, 300, 300))
+        source.info["transparency"] = 0
+
+        result = self.process(source, [300])
+
+        for entry in result["srcset"]:
+            output = self.stored(entry)
+            self.assertEqual(output.mode, "RGBA")
+            self.assertEqual(output.getpixel((10, 10))[3], 0)
+            red, green, _, alpha = output.getpixel((output.width - 10, 10))
+            self.assertEqual((red > 240, green < 16, alpha), (True, True, 255))
+
+
+if __name__ == "__main__":
+    unittest.main()
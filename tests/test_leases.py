@@ -0,0 +1,264 @@
+import functools
+import threading
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from integrations import singleflight, tracking
+from processing.deadline import Deadline, LeaseLost
+from tests.fakes import use_fake_table
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+class ClaimTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+
+    def expire_lease(self):
+        past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "lease_expires_at": past})
+
+    def test_only_one_owner_claims(self):
+        claimed, job = tracking.claim_job(BLOB, "owner-a")
+        self.assertTrue(claimed)
+        self.assertEqual(job["owner"], "owner-a")
+
+        claimed, job = tracking.claim_job(BLOB, "owner-b")
+        self.assertFalse(claimed)
+        self.assertEqual(job["owner"], "owner-a")
+
+    def test_concurrent_claim_loses_on_the_etag(self):
+        get_entity = self.table.get_entity
+        raced = []
+
+        def racing_get_entity(*args, **kwargs):
+            entity = get_entity(*args, **kwargs)
+            if not raced:
+                # owner-b claims between owner-a's read and its conditional update
+                raced.append(True)
+                self.assertTrue(tracking.claim_job(BLOB, "owner-b")[0])
+            return entity
+
+        with mock.patch.object(self.table, "get_entity", racing_get_entity):
+            claimed, job = tracking.claim_job(BLOB, "owner-a")
+
+        self.assertFalse(claimed)
+        self.assertEqual(job["owner"], "owner-b")
+        self.assertEqual(self.table.entities[("jobs", BLOB)]["owner"], "owner-b")
+
+    def test_completed_job_is_not_claimed(self):
+        tracking.claim_job(BLOB, "owner-a")
+        tracking.update_job_status(BLOB, "completed", result={"processed_blob_name": "processed-x.mp4"})
+
+        claimed, job = tracking.claim_job(BLOB, "owner-b")
+        self.assertFalse(claimed)
+        self.assertEqual(job["status"], "completed")
+
+    def test_renew_extends_the_lease(self):
+        tracking.claim_job(BLOB, "owner-a")
+        self.expire_lease()
+
+        self.assertTrue(tracking.renew_lease(BLOB, "owner-a"))
+        self.assertFalse(tracking.lease_expired(self.table.entities[("jobs", BLOB)]))
+
+    def test_expired_lease_is_taken_over_and_the_old_owner_loses_it(self):
+        tracking.claim_job(BLOB, "owner-a")
+        self.expire_lease()
+
+        claimed, _ = tracking.claim_job(BLOB, "owner-b")
+
+        self.assertTrue(claimed)
+        self.assertFalse(tracking.renew_lease(BLOB, "owner-a"))
+        self.assertTrue(tracking.renew_lease(BLOB, "owner-b"))
+
+    def test_missing_record_is_an_error(self):
+        self.table.delete_entity(partition_key="jobs", row_key=BLOB)
+
+        with self.assertRaises(tracking.JobRecordMissing):
+            tracking.claim_job(BLOB, "owner-a")
+        self.assertFalse(tracking.renew_lease(BLOB, "owner-a"))
+
+
+class RunOnceTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        self.work = mock.Mock(return_value={"status": "success"})
+
+    def test_claimed_job_runs_once(self):
+        self.assertEqual(singleflight.run_once(BLOB, self.work, timeout=1), {"status": "success"})
+        self.work.assert_called_once_with()
+
+    def test_missing_record_fails_without_waiting(self):
+        self.table.delete_entity(partition_key="jobs", row_key=BLOB)
+
+        with mock.patch.object(singleflight, "wait_for_job_result") as wait:
+            with self.assertRaises(tracking.JobRecordMissing):
+                singleflight.run_once(BLOB, self.work, timeout=60)
+
+        wait.assert_not_called()
+        self.work.assert_not_called()
+
+    def test_follower_fails_when_the_record_disappears(self):
+        tracking.claim_job(BLOB, "other-instance")
+
+        def claim_then_lose_record(blob_name, owner):
+            result = tracking.claim_job(blob_name, owner)
+            self.table.delete_entity(partition_key="jobs", row_key=blob_name)
+            return result
+
+        with mock.patch.object(singleflight, "claim_job", claim_then_lose_record):
+            with self.assertRaises(tracking.JobRecordMissing):
+                singleflight.run_once(BLOB, self.work, timeout=60)
+        self.work.assert_not_called()
+
+    def test_follower_returns_the_owners_result(self):
+        tracking.claim_job(BLOB, "other-instance")
+        tracking.update_job_status(BLOB, "completed", result={
+            "processed_blob_name": "processed-x.mp4", "compressed_size": 10, "output_url": "https://example/x",
+        })
+        # claim_job finds the job completed; run_once answers from its record
+        result = singleflight.run_once(BLOB, self.work, timeout=1)
+
+        self.assertEqual(result["compressed_size"], 10)
+        self.work.assert_not_called()
+
+
+class OwnedStatusTest(unittest.TestCase):
+    """A worker's status writes only land while it still holds the job."""
+
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        tracking.claim_job(BLOB, "owner-a")
+
+    def record(self):
+        return self.table.entities[("jobs", BLOB)]
+
+    def take_over(self):
+        past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "lease_expires_at": past})
+        self.assertTrue(tracking.claim_job(BLOB, "owner-b")[0])
+
+    def test_owner_completes_its_job(self):
+        self.assertTrue(tracking.update_job_status(BLOB, "completed", result={"compressed_size": 10}, owner="owner-a"))
+        self.assertEqual(self.record()["status"], "completed")
+
+    def test_worker_that_lost_the_lease_cannot_fail_the_new_owners_job(self):
+        self.take_over()
+
+        self.assertFalse(tracking.update_job_status(BLOB, "failed", error_message="Deadline exceeded", owner="owner-a"))
+
+        self.assertEqual(self.record()["status"], "processing")
+        self.assertEqual(self.record()["owner"], "owner-b")
+        self.assertTrue(tracking.renew_lease(BLOB, "owner-b"))
+
+    def test_takeover_between_read_and_write_is_not_overwritten(self):
+        get_entity = self.table.get_entity
+        raced = []
+
+        def racing_get_entity(*args, **kwargs):
+            entity = get_entity(*args, **kwargs)
+            if not raced:
+                raced.append(True)
+                self.take_over()
+            return entity
+
+        with mock.patch.object(self.table, "get_entity", racing_get_entity):
+            written = tracking.update_job_status(BLOB, "failed", error_message="boom", owner="owner-a")
+
+        self.assertFalse(written)
+        self.assertEqual(self.record()["owner"], "owner-b")
+
+    def test_heartbeat_between_read_and_write_does_not_block_the_owner(self):
+        get_entity = self.table.get_entity
+        raced = []
+
+        def racing_get_entity(*args, **kwargs):
+            entity = get_entity(*args, **kwargs)
+            if not raced:
+                raced.append(True)
+                self.assertTrue(tracking.renew_lease(BLOB, "owner-a"))
+            return entity
+
+        with mock.patch.object(self.table, "get_entity", racing_get_entity):
+            self.assertTrue(tracking.update_job_status(BLOB, "failed", error_message="boom", owner="owner-a"))
+
+        self.assertEqual(self.record()["status"], "failed")
+
+    def test_released_job_can_be_failed_before_anyone_claims_it(self):
+        # e.g. a retry whose upload blob is gone
+        entity = self.table.get_entity(partition_key="jobs", row_key=BLOB)
+        tracking.release_expired_lease(entity, "Lease expired")
+
+        self.assertTrue(tracking.update_job_status(BLOB, "failed", error_message="Upload blob is gone", owner="retry"))
+
+
+class LeaseLossTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        heartbeat = functools.partial(singleflight._Heartbeat, interval=0.05)
+        patcher = mock.patch.object(singleflight, "_Heartbeat", heartbeat)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def take_over(self):
+        past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "lease_expires_at": past})
+        self.assertTrue(tracking.claim_job(BLOB, "owner-b")[0])
+
+    def test_takeover_cancels_the_run_with_lease_lost(self):
+        deadline = Deadline(30)
+        lost = threading.Event()
+
+        def work():
+            self.take_over()
+            self.assertTrue(lost.wait(5))
+            deadline.check("encode")
+            return {"status": "success"}
+
+        def on_lease_lost():
+            deadline.cancel("Lease lost to another worker", error=LeaseLost)
+            lost.set()
+
+        with self.assertRaises(LeaseLost):
+            singleflight.run_once(BLOB, work, timeout=1, on_lease_lost=on_lease_lost, owner="owner-a")
+
+        self.assertEqual(self.table.entities[("jobs", BLOB)]["owner"], "owner-b")
+        self.assertTrue(tracking.renew_lease(BLOB, "owner-b"))
+
+
+class ReaperTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        tracking.claim_job(BLOB, "owner-a")
+
+    def expire_lease(self):
+        past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "lease_expires_at": past})
+
+    def test_live_lease_is_not_reaped(self):
+        self.assertEqual(tracking.find_expired_leases(), [])
+
+    def test_expired_lease_is_released_by_one_reaper(self):
+        self.expire_lease()
+        first = tracking.find_expired_leases()
+        second = tracking.find_expired_leases()
+        self.assertEqual([job["RowKey"] for job in first], [BLOB])
+
+        self.assertIsNotNone(tracking.release_expired_lease(first[0], "Lease expired"))
+        self.assertIsNone(tracking.release_expired_lease(second[0], "Lease expired"))
+
+        record = self.table.entities[("jobs", BLOB)]
+        self.assertEqual((record["status"], record["owner"], record["retry_count"]), ("queued", "", 1))
+        # The old owner's next heartbeat notices and cancels its run
+        self.assertFalse(tracking.renew_lease(BLOB, "owner-a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import re
+import unittest
+from unittest import mock
+
+from integrations.database import extract_step_id_from_blob_name
+from processing import naming
+from processing.ingest import InvalidUpload, new_upload_blob_name
+
+
+UPLOAD_NAME = re.compile(r"^upload-([0-9a-f]{2})-(?:step-[\w-]+-)?([0-9a-f]{22})\.\w+$")
+
+
+class UploadNameTest(unittest.TestCase):
+    def test_names_are_unique_and_sharded_by_their_random_part(self):
+        with mock.patch.object(naming.time, "time", return_value=1_700_000_000.0):
+            names = {naming.new_upload_blob_name("png") for _ in range(500)}
+
+        self.assertEqual(len(names), 500)
+        for name in names:
+            shard, blob_id = UPLOAD_NAME.match(name).groups()
+            self.assertEqual(shard, blob_id[12:14])
+        self.assertGreater(len({UPLOAD_NAME.match(name).group(1) for name in names}), 100)
+
+    def test_ids_sort_by_creation_time(self):
+        with mock.patch.object(naming.time, "time", side_effect=[1_700_000_000.0, 1_700_000_000.001]):
+            first, second = naming.new_blob_id(), naming.new_blob_id()
+
+        self.assertLess(first, second)
+
+    def test_step_id_round_trips(self):
+        name = new_upload_blob_name("clip.MOV", step_id="step_7-b")
+
+        self.assertRegex(name, UPLOAD_NAME)
+        self.assertTrue(name.endswith(".mov"))
+        self.assertEqual(extract_step_id_from_blob_name(name), "step_7-b")
+        self.assertEqual(extract_step_id_from_blob_name(naming.processed_blob_name(name, "mp4")), "step_7-b")
+
+    def test_invalid_names_are_refused(self):
+        with self.assertRaises(InvalidUpload):
+            new_upload_blob_name("notes.txt")
+        with self.assertRaises(InvalidUpload):
+            new_upload_blob_name("clip.mp4", step_id="../other")
+
+
+class ProcessedNameTest(unittest.TestCase):
+    def test_prefix_and_extension_are_swapped(self):
+        self.assertEqual(
+            naming.processed_blob_name("upload-3f-0199b1f2a4c83f9e0a1b2c.png", "webp"),
+            "processed-3f-0199b1f2a4c83f9e0a1b2c.webp",
+        )
+        self.assertEqual(naming.processed_blob_name("legacy.mp4"), "legacy.mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
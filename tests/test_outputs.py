@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from integrations import tracking
+from processing import retention
+from processing.storage import PROCESSED_CONTAINER, LocalFileStorage
+from tests.fakes import use_fake_table
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.png"
+OUTPUT = "processed-3f-0199b1f2a4c83f9e0a1b2c.webp"
+RENDITION = "processed-3f-0199b1f2a4c83f9e0a1b2c.w640.webp"
+
+
+class RecordedOutputsTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "png")
+
+    def test_completed_job_records_every_output(self):
+        tracking.update_job_status(BLOB, "completed", result={
+            "processed_blob_name": OUTPUT, "renditions": [OUTPUT, RENDITION],
+        })
+
+        job = tracking.get_job_status(BLOB, max_age=0)
+        self.assertEqual(job["processed_blob_name"], OUTPUT)
+        self.assertEqual(sorted(tracking.job_output_blobs(job)), [RENDITION, OUTPUT])
+        self.assertEqual(tracking.get_referenced_output_blobs(), {OUTPUT, RENDITION})
+
+    def test_legacy_record_derives_its_output_name(self):
+        self.assertEqual(tracking.job_output_blobs({"blob_name": BLOB, "file_type": "png"}), [OUTPUT])
+
+
+class ReconcileTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.storage = LocalFileStorage(root.name, "https://media.example")
+        patcher = mock.patch.object(retention, "get_storage", return_value=self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write(self, name, age_minutes):
+        self.storage.write(PROCESSED_CONTAINER, name, b"data")
+        modified = time.time() - age_minutes * 60
+        os.utime(os.path.join(self.storage.root, PROCESSED_CONTAINER, name), (modified, modified))
+
+    def remaining(self):
+        return sorted(name for name, _ in self.storage.list_blobs(PROCESSED_CONTAINER))
+
+    def test_only_old_unreferenced_outputs_are_removed(self):
+        self.write(OUTPUT, 120)
+        self.write("processed-3f-leaked.webp", 120)
+        self.write("processed-3f-finishing.webp", 5)
+
+        removed = retention.reconcile_orphaned_outputs({OUTPUT}, min_age_minutes=60)
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.remaining(), [OUTPUT, "processed-3f-finishing.webp"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from processing import previews
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+CONFIG = {
+    "max_width": 1280, "max_height": 720,
+    "poster": True, "sprite": True, "preview": True,
+    "sprite_frames": 6, "sprite_columns": 4, "sprite_thumb_width": 160,
+}
+VIDEO = {"width": 1920, "height": 1080, "duration": "60"}
+
+
+class PlanTest(unittest.TestCase):
+    def test_request_field_selects_known_previews(self):
+        self.assertEqual(previews.parse_preview_request(" Poster,sprite,thumbs"), {"poster": True, "sprite": True})
+        self.assertEqual(previews.parse_preview_request(None), {})
+
+    def test_sprite_cues_tile_the_whole_duration(self):
+        sprite = next(o for o in previews.plan_previews(CONFIG, VIDEO, "/tmp/job") if o["kind"] == "sprite")
+
+        self.assertIn("tile=4x2", sprite["filter"])
+        cues = sprite["cues"]
+        self.assertEqual(len(cues), 6)
+        self.assertEqual((cues[0]["start"], cues[-1]["end"]), (0.0, 60.0))
+        self.assertEqual([(c["x"], c["y"]) for c in cues[3:5]], [(480, 0), (0, 90)])
+        self.assertEqual((cues[0]["w"], cues[0]["h"]), (160, 90))
+
+    def test_one_decode_feeds_every_output(self):
+        outputs = previews.plan_previews(CONFIG, VIDEO, "/tmp/job")
+
+        graph, main_map = previews.filter_graph("scale=1280:720", outputs)
+
+        self.assertEqual(graph.count("[0:v]"), 1)
+        self.assertTrue(graph.startswith("[0:v]scale=1280:720,split=4[main][poster_in][sprite_in][preview_in]"))
+        self.assertEqual(main_map, "[main]")
+        copy_graph, copy_map = previews.filter_graph(None, outputs[:1])
+        self.assertEqual(copy_graph, f"[0:v]split=1[poster_in];[poster_in]{outputs[0]['filter']}[poster]")
+        self.assertEqual(copy_map, "0:v")
+        args = previews.output_args(outputs)
+        maps = [args[i + 1] for i, arg in enumerate(args) if arg == "-map"]
+        self.assertEqual(maps, ["[poster]", "[sprite]", "[preview]"])
+
+
+class FinalizeTest(unittest.TestCase):
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        self.workdir = workdir.name
+        patcher = mock.patch.object(
+            previews, "generate_processed_blob_sas_url", side_effect=lambda name: f"https://media.example/{name}?sig=x",
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sprite_becomes_webp_with_a_signed_vtt_index(self):
+        outputs = [o for o in previews.plan_previews(CONFIG, VIDEO, self.workdir) if o["kind"] != "preview"]
+        for output in outputs:
+            Image.new("RGB", (640, 180)).save(output["path"], "PNG")
+
+        files = {f["kind"]: f for f in previews.finalize_previews(outputs, BLOB)}
+
+        self.assertEqual(sorted(files), ["poster", "sprite", "sprite_vtt"])
+        sprite = files["sprite"]
+        self.assertEqual(sprite["blob_name"], "processed-3f-0199b1f2a4c83f9e0a1b2c.sprite.webp")
+        with Image.open(sprite["path"]) as image:
+            self.assertEqual(image.format, "WEBP")
+        with open(files["sprite_vtt"]["path"], encoding="utf-8") as fh:
+            vtt = fh.read()
+        self.assertTrue(vtt.startswith("WEBVTT\n"))
+        self.assertIn(
+            "00:00:10.000 --> 00:00:20.000\n"
+            f"https://media.example/{sprite['blob_name']}?sig=x#xywh=160,0,160,90\n",
+            vtt,
+        )
+
+    def test_missing_outputs_are_skipped(self):
+        outputs = previews.plan_previews(CONFIG, VIDEO, self.workdir)
+        open(outputs[0]["path"], "wb").close()
+
+        self.assertEqual(previews.finalize_previews(outputs, BLOB), [])
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, "sprite.vtt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
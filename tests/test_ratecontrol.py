@@ -0,0 +1,96 @@
+import subprocess
+import unittest
+from unittest import mock
+
+from processing import ratecontrol
+from processing.ratecontrol import crf_for_complexity, parse_kbps, plan_rate_control, rate_control_args
+
+
+CONFIG = {
+    "target_bitrate": "800k",
+    "min_bitrate": "200k",
+    "max_bitrate": "1200k",
+    "buffer_size": "2400k",
+    "crf": 24,
+    "auto_crf_min": 20,
+    "auto_crf_max": 30,
+    "target_file_size_mb": 10,
+    "complexity_samples": 3,
+    "complexity_sample_seconds": 2.0,
+}
+VIDEO = {"width": 1280, "height": 720, "duration": "120", "avg_frame_rate": "30/1"}
+
+
+def plan(mode, encoder="libx264", video=VIDEO, **overrides):
+    return plan_rate_control("in.mp4", video, {**CONFIG, "rate_control": mode, **overrides}, encoder, "scale=1280:720")
+
+
+class ModeSelectionTest(unittest.TestCase):
+    def test_capped_crf(self):
+        result = plan("capped_crf")
+
+        self.assertEqual((result["mode"], result["crf"], result["passes"]), ("capped_crf", 24, 1))
+        self.assertEqual(rate_control_args(result, CONFIG), ["-crf", "24", "-maxrate", "1200k", "-bufsize", "2400k"])
+
+    def test_two_pass_lands_on_the_target_size(self):
+        result = plan("two_pass")
+
+        self.assertEqual(result["passes"], 2)
+        self.assertEqual(result["bitrate_kbps"], int(10 * 8 * 1024 * 0.97 / 120))
+        self.assertEqual(rate_control_args(result, CONFIG)[:2], ["-b:v", f"{result['bitrate_kbps']}k"])
+
+    def test_two_pass_bitrate_stays_within_the_profile(self):
+        self.assertEqual(plan("two_pass", video={**VIDEO, "duration": "5"})["bitrate_kbps"], 1200)
+        self.assertEqual(plan("two_pass", video={**VIDEO, "duration": "3600"})["bitrate_kbps"], 200)
+        self.assertEqual(plan("two_pass", video={})["bitrate_kbps"], 800)
+
+    def test_encoders_without_crf_or_two_pass_fall_back_to_abr(self):
+        for mode in ("capped_crf", "auto", "two_pass"):
+            result = plan(mode, encoder="libopenh264")
+            self.assertEqual((result["mode"], result["requested_mode"]), ("abr", mode))
+            self.assertEqual(rate_control_args(result, CONFIG)[:2], ["-b:v", "800k"])
+
+    def test_unknown_mode_is_abr(self):
+        self.assertEqual(plan("vbr")["mode"], "abr")
+
+    def test_auto_picks_crf_from_the_pre_scan(self):
+        with mock.patch.object(ratecontrol, "measure_complexity", return_value=0.15):
+            busy = plan("auto")
+        with mock.patch.object(ratecontrol, "measure_complexity", return_value=0.01):
+            static = plan("auto")
+        with mock.patch.object(ratecontrol, "measure_complexity", return_value=None):
+            failed = plan("auto")
+
+        self.assertEqual((busy["crf"], static["crf"], failed["crf"]), (20, 30, 24))
+        self.assertEqual(busy["complexity_bpp"], 0.15)
+
+
+class ComplexityTest(unittest.TestCase):
+    def test_crf_falls_as_complexity_rises(self):
+        crfs = [crf_for_complexity(bpp, CONFIG) for bpp in (0.001, 0.01, 0.03, 0.08, 0.15, 1.0)]
+
+        self.assertEqual(crfs[0], 30)
+        self.assertEqual(crfs[-1], 20)
+        self.assertEqual(crfs, sorted(crfs, reverse=True))
+
+    def test_pre_scan_measures_bits_per_output_pixel(self):
+        encoded = subprocess.CompletedProcess([], 0, b"\0" * 27_648, b"")
+        with mock.patch.object(ratecontrol, "run_process", return_value=encoded) as run:
+            bpp = ratecontrol.measure_complexity("in.mp4", VIDEO, CONFIG, "scale=1280:720")
+
+        self.assertEqual(run.call_count, 3)
+        starts = [float(call.args[0][call.args[0].index("-ss") + 1]) for call in run.call_args_list]
+        self.assertEqual(starts, [29.0, 59.0, 89.0])
+        self.assertAlmostEqual(bpp, 27_648 * 8 / (2.0 * 30 * 1280 * 720))
+
+    def test_failed_pre_scan_returns_none(self):
+        failed = subprocess.CompletedProcess([], 1, b"", b"Unknown encoder 'libx264'")
+        with mock.patch.object(ratecontrol, "run_process", return_value=failed):
+            self.assertIsNone(ratecontrol.measure_complexity("in.mp4", VIDEO, CONFIG, "scale=1280:720"))
+
+    def test_parse_kbps(self):
+        self.assertEqual([parse_kbps(v) for v in ("800k", "1.2M", 800000)], [800, 1200, 800])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from unittest import mock
+
+from azure.core.exceptions import ResourceModifiedError
+
+from integrations import ratelimit
+from integrations.auth import ApiKeyIdentity
+from integrations.ratelimit import TokenBucket
+from tests.fakes import FakeTableClient
+
+
+NOW = 1_000_000.0
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit.time, "time", return_value=NOW)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_takes_until_empty_then_reports_the_wait(self):
+        bucket = TokenBucket(rate=0.5, capacity=2)
+
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        self.assertAlmostEqual(bucket.take(), 2.0)  # one token at 0.5 per second
+
+    def test_refills_up_to_capacity(self):
+        bucket = TokenBucket(rate=1.0, capacity=3, tokens=0, updated=NOW)
+
+        self.clock.return_value = NOW + 2
+        self.assertEqual(bucket.take(2), 0)
+
+        self.clock.return_value = NOW + 100
+        self.assertTrue(bucket.positive())
+        self.assertEqual(bucket.tokens, 3)
+
+    def test_debt_blocks_until_repaid(self):
+        bucket = TokenBucket(rate=1.0, capacity=10)
+
+        self.assertEqual(bucket.take(25, allow_debt=True), 0)
+        self.assertFalse(bucket.positive())
+        self.assertAlmostEqual(bucket.retry_after(0.001), 15.001)
+
+        self.clock.return_value = NOW + 16
+        self.assertTrue(bucket.positive())
+
+
+class CheckRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(ratelimit, "_store", ratelimit._LocalBucketStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.identity = ApiKeyIdentity(
+            name="acme", quota={"requests_per_minute": 60, "request_burst": 2, "encode_seconds_per_hour": 3600}
+        )
+
+    def test_request_burst_then_retry_after(self):
+        self.assertIsNone(ratelimit.check_rate_limit(self.identity))
+        self.assertIsNone(ratelimit.check_rate_limit(self.identity))
+        self.assertGreater(ratelimit.check_rate_limit(self.identity), 0)
+
+    def test_encode_debt_refuses_new_requests(self):
+        ratelimit.charge_encode_seconds(self.identity, 7200)
+
+        retry_after = ratelimit.check_rate_limit(self.identity)
+
+        self.assertGreater(retry_after, 3500)
+
+
+class TableBucketStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeTableClient()
+        self.store = ratelimit._TableBucketStore("ratelimits", ratelimit._LocalBucketStore())
+        self.store._table_client = self.table
+        patcher = mock.patch.object(ratelimit, "_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.identity = ApiKeyIdentity(name="acme", quota={"requests_per_minute": 60, "request_burst": 1})
+
+    def test_a_request_writes_once(self):
+        self.assertIsNone(ratelimit.check_rate_limit(self.identity))
+
+        self.assertEqual(self.table.writes, 1)
+        self.assertEqual(self.table.rows("acme"), ["requests"])
+
+    def test_refused_request_writes_nothing(self):
+        ratelimit.check_rate_limit(self.identity)
+        writes = self.table.writes
+
+        self.assertGreater(ratelimit.check_rate_limit(self.identity), 0)
+        self.assertEqual(self.table.writes, writes)
+
+    def test_two_instances_cannot_both_take_the_last_token(self):
+        self.table.create_entity({"PartitionKey": "acme", "RowKey": "requests", "tokens": 1.0, "updated": NOW})
+        get_entity = self.table.get_entity
+        raced = []
+        results = []
+
+        def racing_get_entity(*args, **kwargs):
+            entity = get_entity(*args, **kwargs)
+            if not raced:
+                # Another instance takes the token between this read and its update
+                raced.append(True)
+                results.append(self.store.apply("acme", "requests", 1 / 60, 1, lambda bucket: bucket.take(1.0)))
+            return entity
+
+        with mock.patch.object(ratelimit.time, "time", return_value=NOW), \
+                mock.patch.object(self.table, "get_entity", racing_get_entity):
+            results.append(self.store.apply("acme", "requests", 1 / 60, 1, lambda bucket: bucket.take(1.0)))
+
+        self.assertEqual(results[0], 0)
+        self.assertGreater(results[1], 0)
+        self.assertLess(self.table.entities[("acme", "requests")]["tokens"], 1)
+
+
+class UnbilledEncodeSecondsTest(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeTableClient()
+        self.store = ratelimit._TableBucketStore("ratelimits", ratelimit._LocalBucketStore())
+        self.store._table_client = self.table
+        for patcher in (
+            mock.patch.object(ratelimit, "_store", self.store),
+            mock.patch.dict(ratelimit._unbilled, clear=True),
+            mock.patch.object(ratelimit.time, "time", return_value=NOW),
+            mock.patch.object(ratelimit.time, "sleep"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.identity = ApiKeyIdentity(name="acme", quota={"encode_seconds_per_hour": 3600})
+        self.table.create_entity({"PartitionKey": "acme", "RowKey": "encode_seconds", "tokens": 3600.0, "updated": NOW})
+
+    def tokens(self):
+        return self.table.entities[("acme", "encode_seconds")]["tokens"]
+
+    def test_contended_charge_is_paid_by_the_next_request(self):
+        contended = mock.patch.object(self.table, "update_entity", side_effect=ResourceModifiedError("etag"))
+        with contended, self.assertLogs(level="WARNING"):
+            ratelimit.charge_encode_seconds(self.identity, 30)
+        self.assertEqual(self.tokens(), 3600)
+        self.assertEqual(ratelimit._unbilled, {"acme": 30})
+
+        self.assertIsNone(ratelimit.check_rate_limit(self.identity))
+
+        self.assertEqual(self.tokens(), 3570)
+        self.assertEqual(ratelimit._unbilled, {})
+
+    def test_debt_is_added_to_the_next_charge(self):
+        ratelimit._unbilled["acme"] = 30.0
+
+        ratelimit.charge_encode_seconds(self.identity, 10)
+
+        self.assertEqual(self.tokens(), 3560)
+        self.assertEqual(ratelimit._unbilled, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
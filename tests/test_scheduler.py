@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from processing.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, FairScheduler, SchedulerTimeout
+
+
+def wait_until(predicate, timeout=10.0):
+    give_up = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > give_up:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+
+class FairQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = FairScheduler(slots=1)
+        self.order = []
+        self.threads = []
+
+    def queue(self, label, tenant, cost=10.0, weight=1.0, priority=PRIORITY_BATCH):
+        """Queue one job behind the held slot; it records its label once it runs."""
+
+        def job():
+            self.scheduler.acquire(tenant, cost, weight, priority, timeout=10)
+            self.order.append(label)
+            self.scheduler.release()
+
+        queued = self.scheduler.snapshot()["queued"]
+        thread = threading.Thread(target=job)
+        thread.start()
+        self.threads.append(thread)
+        wait_until(lambda: self.scheduler.snapshot()["queued"] == queued + 1)
+
+    def run_queue(self):
+        self.scheduler.release()
+        for thread in self.threads:
+            thread.join(10)
+        return self.order
+
+    def test_a_tenants_backlog_only_delays_itself(self):
+        self.scheduler.acquire("holder")
+        for label in ("a1", "a2", "a3"):
+            self.queue(label, "a")
+        self.queue("b1", "b")
+
+        self.assertEqual(self.run_queue(), ["a1", "b1", "a2", "a3"])
+
+    def test_weights_share_slots_proportionally(self):
+        self.scheduler.acquire("holder")
+        for label in ("a1", "a2", "a3"):
+            self.queue(label, "a")
+        for label in ("b1", "b2", "b3"):
+            self.queue(label, "b", weight=2.0)
+
+        self.assertEqual(self.run_queue(), ["b1", "a1", "b2", "b3", "a2", "a3"])
+
+    def test_interactive_work_goes_first(self):
+        self.scheduler.acquire("holder")
+        self.queue("video", "a", cost=1.0)
+        self.queue("image", "b", cost=100.0, priority=PRIORITY_INTERACTIVE)
+
+        self.assertEqual(self.run_queue(), ["image", "video"])
+
+    def test_timed_out_job_leaves_the_queue(self):
+        self.scheduler.acquire("holder")
+
+        with self.assertRaises(SchedulerTimeout):
+            self.scheduler.acquire("a", timeout=0.1)
+
+        self.assertEqual(self.scheduler.snapshot(), {"slots": 1, "available": 0, "queued": 0})
+        self.scheduler.release()
+        self.assertLess(self.scheduler.acquire("a", timeout=1), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from processing import scratch
+from processing.scheduler import SchedulerTimeout
+from processing.scratch import ScratchManager, ScratchSpaceExhausted
+
+
+Usage = namedtuple("Usage", "total used free")
+
+
+class _VolumesTestCase(unittest.TestCase):
+    """Two scratch volumes whose free space the test controls."""
+
+    def setUp(self):
+        self.volumes = {}
+        for kind in ("tmpfs", "disk"):
+            volume = tempfile.TemporaryDirectory()
+            self.addCleanup(volume.cleanup)
+            self.volumes[kind] = volume.name
+        self.free = {self.volumes["tmpfs"]: 2000, self.volumes["disk"]: 10_000}
+        for name, value in (
+            ("TMPFS_MAX_BYTES", 1000),
+            ("MIN_FREE_BYTES", 100),
+            ("shutil", mock.Mock(disk_usage=lambda path: Usage(20_000, 0, self.free[path]), rmtree=shutil.rmtree)),
+        ):
+            patcher = mock.patch.object(scratch, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = ScratchManager(self.volumes)
+
+    def volume_of(self, path):
+        return next(kind for kind, volume in self.volumes.items() if path.startswith(volume))
+
+
+class ReservationTest(_VolumesTestCase):
+    def test_small_jobs_use_tmpfs_and_large_ones_disk(self):
+        self.assertEqual(self.volume_of(self.manager.reserve(500)), "tmpfs")
+        self.assertEqual(self.volume_of(self.manager.reserve(5000)), "disk")
+
+    def test_unwritten_reservations_hold_their_space(self):
+        first = self.manager.reserve(900)
+        # 2000 free - 900 outstanding - 100 kept free leaves 1000 on tmpfs
+        self.assertEqual(self.volume_of(self.manager.reserve(1000)), "tmpfs")
+        self.assertEqual(self.volume_of(self.manager.reserve(500)), "disk")
+
+        self.manager.release(first)
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(self.volume_of(self.manager.reserve(500)), "tmpfs")
+
+    def test_written_bytes_are_counted_once(self):
+        path = self.manager.reserve(900)
+        with open(os.path.join(path, "input.mp4"), "wb") as fh:
+            fh.write(b"x" * 600)
+        self.free[self.volumes["tmpfs"]] -= 600
+
+        self.assertEqual(self.manager._available("tmpfs"), 1400 - 300 - 100)
+
+    def test_full_volumes_refuse_like_a_busy_scheduler(self):
+        with self.assertRaises(ScratchSpaceExhausted) as caught:
+            self.manager.reserve(20_000, "upload-3f-big.mp4")
+
+        self.assertIsInstance(caught.exception, SchedulerTimeout)
+        for volume in self.volumes.values():
+            self.assertFalse(os.path.exists(os.path.join(volume, scratch.ROOT_NAME)))
+
+    def test_scratch_dir_is_removed_on_error(self):
+        with mock.patch.object(scratch, "_manager", self.manager):
+            with self.assertRaises(RuntimeError):
+                with scratch.scratch_dir(100) as path:
+                    open(os.path.join(path, "partial.mp4"), "wb").close()
+                    raise RuntimeError("encode failed")
+
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.manager.snapshot()["volumes"]["tmpfs"]["active_jobs"], 0)
+
+
+class ReaperTest(_VolumesTestCase):
+    def make_dir(self, pid, age=0.0):
+        root = os.path.join(self.volumes["disk"], scratch.ROOT_NAME)
+        os.makedirs(root, exist_ok=True)
+        path = os.path.join(root, f"{pid}-{len(os.listdir(root))}")
+        os.mkdir(path)
+        modified = time.time() - age
+        os.utime(path, (modified, modified))
+        return path
+
+    def test_orphans_are_reaped(self):
+        dead = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead.wait()
+        in_use = self.manager.reserve(5000)
+        keep = [in_use, self.make_dir(os.getppid())]
+        reap = [
+            self.make_dir(dead.pid),
+            self.make_dir(os.getppid(), age=scratch.MAX_AGE_SECONDS + 60),
+            self.make_dir(os.getpid()),
+        ]
+
+        self.assertEqual(self.manager.reap_orphans(), 3)
+
+        self.assertEqual([os.path.exists(path) for path in keep], [True, True])
+        self.assertEqual([os.path.exists(path) for path in reap], [False, False, False])
+        self.assertEqual(self.manager.snapshot()["reaped"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
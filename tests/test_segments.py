@@ -0,0 +1,95 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from processing.deadline import Deadline
+from processing.segments import encode_segments, load_manifest, manifest_key, segment_blob_name
+from processing.storage import PROCESSED_CONTAINER, LocalFileStorage
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+SEGMENTS = [(0.0, 60.0), (60.0, 60.0), (120.0, 60.0), (180.0, 30.0)]
+# Stands in for ffmpeg: writes "<start>" to the output path
+WRITE_START = "import sys; open(sys.argv[2], 'w').write(sys.argv[1])"
+
+
+class EncodeSegmentsTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.storage = LocalFileStorage(os.path.join(root.name, "storage"), "")
+        self.root = root.name
+        self.encoded = []
+        self.checkpoints = []
+
+    def build_cmd(self, start, duration, output_path):
+        self.encoded.append(start)
+        return [sys.executable, "-c", WRITE_START, str(start), output_path]
+
+    def encode(self, manifest, run):
+        work_dir = os.path.join(self.root, run)
+        os.mkdir(work_dir)
+        return encode_segments(
+            self.storage, BLOB, SEGMENTS, manifest, self.build_cmd, work_dir, Deadline(30),
+            on_checkpoint=lambda m: self.checkpoints.append(sorted(m["done"])),
+        )
+
+    def contents(self, paths):
+        result = []
+        for path in paths:
+            with open(path) as fh:
+                result.append(fh.read())
+        return result
+
+    def test_fresh_run_checkpoints_every_segment(self):
+        manifest = {"key": "k"}
+        paths = self.encode(manifest, "first")
+
+        self.assertEqual(self.encoded, [0.0, 60.0, 120.0, 180.0])
+        self.assertEqual(manifest["done"], [0, 1, 2, 3])
+        self.assertEqual(manifest["count"], 4)
+        self.assertEqual(self.checkpoints, [[0], [0, 1], [0, 1, 2], [0, 1, 2, 3]])
+        self.assertEqual(self.contents(paths), ["0.0", "60.0", "120.0", "180.0"])
+        stored = [bytes(self.storage.read(PROCESSED_CONTAINER, segment_blob_name(BLOB, i))).decode() for i in range(4)]
+        self.assertEqual(stored, self.contents(paths))
+
+    def test_retry_encodes_only_missing_segments(self):
+        manifest = {"key": "k"}
+        self.encode(manifest, "first")
+        manifest["done"] = [0, 1]
+        self.encoded.clear()
+
+        paths = self.encode(manifest, "retry")
+
+        self.assertEqual(self.encoded, [120.0, 180.0])
+        self.assertEqual(manifest["done"], [0, 1, 2, 3])
+        self.assertEqual(self.contents(paths), ["0.0", "60.0", "120.0", "180.0"])
+
+    def test_missing_checkpoint_is_encoded_again(self):
+        manifest = {"key": "k"}
+        self.encode(manifest, "first")
+        self.storage.delete(PROCESSED_CONTAINER, segment_blob_name(BLOB, 1))
+        self.encoded.clear()
+
+        paths = self.encode(manifest, "retry")
+
+        self.assertEqual(self.encoded, [60.0])
+        self.assertEqual(self.contents(paths), ["0.0", "60.0", "120.0", "180.0"])
+        self.assertTrue(self.storage.size(PROCESSED_CONTAINER, segment_blob_name(BLOB, 1)))
+
+
+class ManifestTest(unittest.TestCase):
+    def test_manifest_is_reused_only_for_the_same_input_and_settings(self):
+        config = {"preset": "veryfast", "target_bitrate": "1200k", "segment_seconds": 60}
+        key = manifest_key(config, 1024)
+        raw = '{"key": "%s", "done": [0, 1]}' % key
+
+        self.assertEqual(load_manifest(raw, key)["done"], [0, 1])
+        self.assertIsNone(load_manifest(raw, manifest_key(config, 2048)))
+        self.assertIsNone(load_manifest(raw, manifest_key(dict(config, crf=23), 1024)))
+        self.assertIsNone(load_manifest("not json", key))
+
+
+if __name__ == "__main__":
+    unittest.main()
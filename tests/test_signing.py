@@ -0,0 +1,81 @@
+import base64
+import unittest
+from unittest import mock
+
+from processing import signing
+from processing.signing import BlobUrlSigner
+from processing.storage import PROCESSED_CONTAINER, AzureBlobStorage
+
+
+ACCOUNT_KEY = base64.b64encode(b"k" * 64).decode()
+CONNECTION_STRING = (
+    f"DefaultEndpointsProtocol=https;AccountName=media;AccountKey={ACCOUNT_KEY};EndpointSuffix=core.windows.net"
+)
+OUTPUT = "processed-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+class SignerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.signer = BlobUrlSigner("https://media.blob.core.windows.net", "media", ACCOUNT_KEY)
+
+    def test_urls_are_reused_until_invalidated(self):
+        first = self.signer.sign(PROCESSED_CONTAINER, OUTPUT)
+        self.assertIs(self.signer.sign(PROCESSED_CONTAINER, OUTPUT), first)
+
+        self.signer.invalidate(PROCESSED_CONTAINER, OUTPUT)
+
+        self.assertIsNot(self.signer.sign(PROCESSED_CONTAINER, OUTPUT), first)
+
+    def test_invalidate_leaves_other_blobs_cached(self):
+        other = self.signer.sign(PROCESSED_CONTAINER, "processed-3f-other.mp4")
+        self.signer.sign(PROCESSED_CONTAINER, OUTPUT)
+
+        self.signer.invalidate(PROCESSED_CONTAINER, OUTPUT)
+
+        self.assertIs(self.signer.sign(PROCESSED_CONTAINER, "processed-3f-other.mp4"), other)
+
+
+class StorageForgetsUrlsTest(unittest.TestCase):
+    """Deleting or rewriting a blob drops its cached URL."""
+
+    def setUp(self):
+        self.signer = BlobUrlSigner("https://media.blob.core.windows.net", "media", ACCOUNT_KEY)
+        patcher = mock.patch.object(signing, "_signer", self.signer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.storage = AzureBlobStorage(CONNECTION_STRING)
+        self.storage._blob = mock.Mock()
+        self.storage._containers.add(PROCESSED_CONTAINER)
+
+    def cached(self):
+        return [key[1] for key in self.signer._urls]
+
+    def test_delete(self):
+        self.signer.sign(PROCESSED_CONTAINER, OUTPUT)
+
+        self.storage.delete(PROCESSED_CONTAINER, OUTPUT)
+
+        self.assertEqual(self.cached(), [])
+
+    def test_rewrite(self):
+        self.signer.sign(PROCESSED_CONTAINER, OUTPUT)
+
+        with mock.patch("processing.transfer.upload_bytes"):
+            self.storage.write(PROCESSED_CONTAINER, OUTPUT, b"reprocessed")
+
+        self.assertEqual(self.cached(), [])
+
+    def test_batch_delete_forgets_only_deleted_blobs(self):
+        for name in (OUTPUT, "processed-3f-kept.mp4"):
+            self.signer.sign(PROCESSED_CONTAINER, name)
+        responses = [mock.Mock(status_code=202), mock.Mock(status_code=500)]
+        container = mock.Mock(**{"delete_blobs.return_value": iter(responses)})
+
+        with mock.patch.object(self.storage.service, "get_container_client", return_value=container):
+            self.storage.delete_batch(PROCESSED_CONTAINER, [OUTPUT, "processed-3f-kept.mp4"])
+
+        self.assertEqual(self.cached(), ["processed-3f-kept.mp4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+import azure.functions as func
+
+os.environ.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+import function_app  # noqa: E402
+from integrations import tracking  # noqa: E402
+from tests.fakes import use_fake_table  # noqa: E402
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+class StatusCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+
+    def test_reads_are_served_from_the_cache(self):
+        with mock.patch.object(self.table, "get_entity", wraps=self.table.get_entity) as get_entity:
+            for _ in range(3):
+                self.assertEqual(tracking.get_job_status(BLOB)["status"], "queued")
+
+        get_entity.assert_not_called()
+
+    def test_other_instances_changes_show_up_once_the_cache_is_stale(self):
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "status": "processing"})
+
+        self.assertEqual(tracking.get_job_status(BLOB)["status"], "queued")
+        self.assertEqual(tracking.get_job_status(BLOB, max_age=0)["status"], "processing")
+
+    def test_segment_progress_changes_the_etag(self):
+        before = tracking.job_etag(tracking.get_job_status(BLOB))
+
+        tracking.save_segment_manifest(BLOB, {"count": 4, "done": [0]})
+
+        self.assertNotEqual(tracking.job_etag(tracking.get_job_status(BLOB)), before)
+
+
+class LongPollTest(unittest.TestCase):
+    def setUp(self):
+        use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        self.etag = tracking.job_etag(tracking.get_job_status(BLOB))
+
+    def test_local_change_wakes_the_wait(self):
+        timer = threading.Timer(0.2, tracking.update_job_status, args=(BLOB, "processing"))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+
+        job = tracking.wait_for_job_change(BLOB, self.etag, timeout=10)
+
+        self.assertEqual(job["status"], "processing")
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_unchanged_job_is_returned_after_the_timeout(self):
+        job = tracking.wait_for_job_change(BLOB, self.etag, timeout=0.2)
+
+        self.assertEqual(tracking.job_etag(job), self.etag)
+
+
+class StatusEndpointTest(unittest.TestCase):
+    handler = staticmethod(function_app.get_status.build().get_user_function())
+
+    def setUp(self):
+        use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        self.etag = tracking.job_etag(tracking.get_job_status(BLOB))
+        for name, value in (("require_auth", mock.Mock(return_value=None)), ("_start_background_workers", mock.Mock())):
+            patcher = mock.patch.object(function_app, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, etag=None, wait=None):
+        params = {"blob_name": BLOB}
+        if wait is not None:
+            params["wait"] = str(wait)
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.handler(func.HttpRequest("GET", "/api/status", params=params, headers=headers, body=b""))
+
+    def test_matching_etag_is_not_modified(self):
+        self.assertEqual(self.get().headers["ETag"], self.etag)
+        self.assertEqual(self.get(self.etag).status_code, 304)
+
+    def test_long_polls_beyond_the_cap_answer_at_once(self):
+        with mock.patch.object(function_app, "_status_waiters", threading.Semaphore(0)):
+            started = time.monotonic()
+            response = self.get(self.etag, wait=20)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["Retry-After"], str(function_app.STATUS_POLL_RETRY_AFTER))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from integrations import tracking
+from integrations.database import extract_step_id_from_blob_name
+from tests.fakes import use_fake_table
+
+
+BLOB_ID = "0199b1f2a4c83f9e0a1b2c"
+STEP_BLOB = f"upload-3f-step-42-{BLOB_ID}.mp4"
+STEP_IMAGE = "upload-a0-step-42-0199b1f2a4c83f9e0a1b2d.png"
+OTHER_STEP_BLOB = f"upload-3f-step-421-{BLOB_ID}.mp4"
+
+
+class ExtractStepIdTest(unittest.TestCase):
+    def test_sharded_upload_and_processed_names(self):
+        self.assertEqual(extract_step_id_from_blob_name(STEP_BLOB), "42")
+        self.assertEqual(extract_step_id_from_blob_name(f"processed-3f-step-42-{BLOB_ID}.mp4"), "42")
+
+    def test_processed_names_with_several_suffixes(self):
+        self.assertEqual(extract_step_id_from_blob_name(f"processed-3f-step-42-{BLOB_ID}.w640.webp"), "42")
+        self.assertEqual(extract_step_id_from_blob_name(f"processed-3f-step-a-b-{BLOB_ID}.sprite.vtt"), "a-b")
+
+    def test_legacy_names(self):
+        self.assertEqual(extract_step_id_from_blob_name("step-42-video.mp4"), "42")
+        with self.assertRaises(ValueError):
+            extract_step_id_from_blob_name(f"upload-3f-{BLOB_ID}.mp4")
+
+
+class StepIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        for blob_name in (STEP_BLOB, STEP_IMAGE, OTHER_STEP_BLOB):
+            tracking.create_job_record(blob_name, 1024, blob_name.rsplit(".", 1)[1])
+        tracking.create_job_record(f"upload-3f-{BLOB_ID}.mp4", 1024, "mp4")
+
+    def test_step_jobs_are_found_without_scanning_the_jobs_partition(self):
+        with mock.patch.object(self.table, "query_entities", wraps=self.table.query_entities) as query:
+            jobs = tracking.query_jobs(step_id="42")
+
+        self.assertEqual(sorted(job["RowKey"] for job in jobs), [STEP_BLOB, STEP_IMAGE])
+        self.assertEqual(query.call_args.kwargs["parameters"]["partition"], tracking.STEP_PARTITION)
+
+    def test_deleted_records_leave_the_index(self):
+        tracking.delete_job_records([STEP_BLOB])
+        self.assertNotIn(f"42|{STEP_BLOB}", self.table.rows(tracking.STEP_PARTITION))
+
+        tracking.update_job_status(OTHER_STEP_BLOB, "completed")
+        later = datetime.now(timezone.utc) + timedelta(minutes=tracking.JOB_RECORD_TTL_MINUTES + 1)
+        tracking.expire_job_records(now=later)
+
+        self.assertEqual(self.table.rows(tracking.STEP_PARTITION), [f"42|{STEP_IMAGE}"])
+
+    def test_stale_index_rows_are_dropped_on_read(self):
+        self.table.delete_entity(partition_key="jobs", row_key=STEP_BLOB)
+        tracking._status_cache.clear()
+
+        self.assertEqual(len(tracking.query_jobs(step_id="42")), 1)
+        self.assertNotIn(f"42|{STEP_BLOB}", self.table.rows(tracking.STEP_PARTITION))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+from processing import storage
+from processing.storage import BlobNotFound, LocalFileStorage, StorageBackend
+
+
+CONTAINER = "processed"
+
+
+class LocalFileStorageTest(unittest.TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.storage = LocalFileStorage(root.name, "https://media.example/")
+
+    def test_reads_see_what_was_written(self):
+        self.storage.write(CONTAINER, "a/clip.mp4", io.BytesIO(b"0123456789"), content_type="video/mp4")
+
+        self.assertEqual(self.storage.size(CONTAINER, "a/clip.mp4"), 10)
+        self.assertEqual(self.storage.read(CONTAINER, "a/clip.mp4"), b"0123456789")
+        self.assertEqual(self.storage.read_range(CONTAINER, "a/clip.mp4", 8, 5), b"89")
+        self.assertEqual(b"".join(self.storage.read_stream(CONTAINER, "a/clip.mp4", chunk_size=4)), b"0123456789")
+        with tempfile.TemporaryFile() as out:
+            self.assertEqual(self.storage.download_to(CONTAINER, "a/clip.mp4", out), 10)
+            out.seek(0)
+            self.assertEqual(out.read(), b"0123456789")
+        self.assertEqual([name for name, _ in self.storage.list_blobs(CONTAINER)], ["a/clip.mp4"])
+
+    def test_missing_blobs_and_escaping_names(self):
+        with self.assertRaises(BlobNotFound):
+            self.storage.read(CONTAINER, "missing.mp4")
+        with self.assertRaises(ValueError):
+            self.storage.write(CONTAINER, "../uploads/clip.mp4", b"x")
+        self.storage.delete(CONTAINER, "missing.mp4")
+
+    def test_blocks_are_committed_in_the_given_order(self):
+        for index, data in ((1, b"world"), (0, b"hello "), (2, b"stale")):
+            self.storage.stage_block("uploads", "clip.mp4", index, data)
+        self.storage.stage_block("uploads", "clip.mp4", 2, b"!")
+
+        self.assertEqual(self.storage.staged_blocks("uploads", "clip.mp4"), {0: 6, 1: 5, 2: 1})
+        self.storage.commit_blocks("uploads", "clip.mp4", [0, 1, 2])
+
+        self.assertEqual(self.storage.read("uploads", "clip.mp4"), b"hello world!")
+        self.assertEqual(self.storage.staged_blocks("uploads", "clip.mp4"), {})
+        self.assertEqual([name for name, _ in self.storage.list_blobs("uploads")], ["clip.mp4"])
+
+    def test_tag_search_pages_and_batch_delete(self):
+        for name, expires in (("a.webp", "2026-01-01T00:00:00Z"), ("b.webp", "2026-01-02T00:00:00Z"),
+                              ("c.webp", "2026-01-03T00:00:00Z")):
+            self.storage.write(CONTAINER, name, b"x", tags={"expires_at": expires})
+        self.storage.write(CONTAINER, "untagged.webp", b"x")
+
+        pages = list(self.storage.find_by_tag_before(CONTAINER, "expires_at", "2026-01-03T00:00:00Z", page_size=1))
+        self.assertEqual(sorted(name for page in pages for name in page), ["a.webp", "b.webp"])
+        self.assertEqual([len(page) for page in pages], [1, 1])
+
+        deleted, failed = self.storage.delete_batch(CONTAINER, ["a.webp", "a.webp", "gone.webp"])
+        self.assertEqual((deleted, failed), (["a.webp", "gone.webp"], []))
+        pages = list(self.storage.find_by_tag_before(CONTAINER, "expires_at", "2026-01-02T00:00:00Z"))
+        self.assertEqual(pages, [])
+
+    def test_urls_point_into_the_served_tree(self):
+        url, _ = self.storage.sign_url(CONTAINER, "a b.webp")
+
+        self.assertEqual(url, "https://media.example/processed/a%20b.webp")
+
+
+class BackendSelectionTest(unittest.TestCase):
+    def test_backend_is_chosen_by_setting(self):
+        with mock.patch.object(storage, "_storage", None), mock.patch.object(storage, "STORAGE_BACKEND", "local"):
+            backend = storage.get_storage()
+            self.assertIsInstance(backend, LocalFileStorage)
+            self.assertIs(storage.get_storage(), backend)
+
+    def test_unknown_backend_is_refused(self):
+        with mock.patch.object(storage, "_storage", None), mock.patch.object(storage, "STORAGE_BACKEND", "s3"):
+            with self.assertRaises(ValueError):
+                storage.get_storage()
+
+    def test_backends_must_implement_the_interface(self):
+        with self.assertRaises(TypeError):
+            type("PartialStorage", (StorageBackend,), {"name": "partial"})()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from processing import transfer
+from processing.transfer import DOWNLOAD, MIB, UPLOAD, TransferStats, plan_transfer
+
+
+DATA = os.urandom(3 * MIB + 123)
+
+
+class FakeBlobClient:
+    """Blob client answering ranged reads and block uploads from memory."""
+
+    blob_name = "processed-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+    def __init__(self, data=b""):
+        self.data = data
+        self.ranges = []
+        self.staged = {}
+        self.committed = None
+        self._lock = threading.Lock()
+
+    def download_blob(self, offset, length):
+        with self._lock:
+            self.ranges.append((offset, length))
+        return mock.Mock(readinto=lambda stream: stream.write(self.data[offset:offset + length]))
+
+    def stage_block(self, block_id, data, length):
+        with self._lock:
+            self.staged[block_id] = data
+
+    def commit_block_list(self, blocks, content_settings=None, tags=None):
+        self.committed = [block.id for block in blocks]
+        self.data = b"".join(self.staged[block_id] for block_id in self.committed)
+
+    def upload_blob(self, data, overwrite, content_settings=None, tags=None):
+        self.data = data
+
+
+class TransferTest(unittest.TestCase):
+    def setUp(self):
+        for name, value in (("SINGLE_SHOT_SIZE", MIB), ("MIN_BLOCK_SIZE", MIB), ("_stats", TransferStats())):
+            patcher = mock.patch.object(transfer, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_plan_follows_measured_throughput(self):
+        self.assertEqual(plan_transfer(1000, DOWNLOAD), (1000, 1))
+
+        self.assertEqual(plan_transfer(512 * MIB, DOWNLOAD), (8 * MIB, 16))
+        transfer._stats.record({"direction": DOWNLOAD, "bytes": 64 * MIB, "seconds": 0.5, "mb_per_s": 800,
+                                "concurrency": 4})
+        self.assertEqual(plan_transfer(512 * MIB, DOWNLOAD), (64 * MIB, 2))
+        # Uploads keep their own estimate
+        self.assertEqual(plan_transfer(512 * MIB, UPLOAD)[1], 16)
+
+    def test_small_transfers_do_not_move_the_estimate(self):
+        transfer._stats.record({"direction": UPLOAD, "bytes": 1000, "seconds": 1.0, "mb_per_s": 0.1,
+                                "concurrency": 1})
+
+        self.assertEqual(transfer._stats.stream_mbps(UPLOAD), transfer.DEFAULT_STREAM_MBPS)
+        self.assertEqual(transfer._stats.snapshot()[UPLOAD]["transfers"], 1)
+
+    def test_parallel_download_into_memory(self):
+        client = FakeBlobClient(DATA)
+
+        self.assertEqual(bytes(transfer.download_bytes(client, len(DATA))), DATA)
+        self.assertEqual(sorted(client.ranges), [(0, MIB), (MIB, MIB), (2 * MIB, MIB), (3 * MIB, 123)])
+
+    def test_parallel_download_into_a_file_at_its_position(self):
+        client = FakeBlobClient(DATA)
+        with tempfile.TemporaryFile() as out:
+            out.write(b"header")
+
+            self.assertEqual(transfer.download_to_file(client, out, len(DATA)), len(DATA))
+
+            self.assertEqual(out.tell(), 6 + len(DATA))
+            out.seek(0)
+            self.assertEqual(out.read(), b"header" + DATA)
+
+    def test_parallel_upload_commits_blocks_in_order(self):
+        client = FakeBlobClient()
+
+        report = transfer.upload_bytes(client, DATA)
+
+        self.assertEqual(client.data, DATA)
+        self.assertEqual(client.committed, sorted(client.committed))
+        self.assertEqual(len(client.committed), 4)
+        self.assertEqual(report["bytes"], len(DATA))
+
+    def test_file_upload_and_single_shot(self):
+        client = FakeBlobClient()
+        with tempfile.NamedTemporaryFile() as source:
+            source.write(DATA)
+            source.flush()
+            transfer.upload_file(client, source.name)
+        self.assertEqual(client.data, DATA)
+
+        transfer.upload_bytes(client, b"small")
+        self.assertEqual(client.data, b"small")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+os.environ.setdefault("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+import function_app  # noqa: E402
+from integrations import tracking  # noqa: E402
+from processing.retention import EXPIRY_TAG, expiry_tags, format_expiry  # noqa: E402
+from processing.storage import PROCESSED_CONTAINER, LocalFileStorage  # noqa: E402
+from tests.fakes import use_fake_table  # noqa: E402
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+OUTPUT = "processed-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+class RedirectOrInlineTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(function_app, "UPLOAD_INLINE_MAX_BYTES", 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_large_reachable_results_redirect(self):
+        result = {"output_url": f"https://account.blob.core.windows.net/processed/{OUTPUT}?sig=x"}
+
+        self.assertFalse(function_app._redirects_result(result, 100))
+        self.assertTrue(function_app._redirects_result(result, 101))
+
+    def test_results_without_a_client_url_stay_inline(self):
+        self.assertFalse(function_app._redirects_result({"output_url": f"file:///srv/processed/{OUTPUT}"}, 10**9))
+        self.assertFalse(function_app._redirects_result({"output_url": ""}, 10**9))
+
+
+class ResultUrlLifetimeTest(unittest.TestCase):
+    """X-Result-Expires must not outlast the output the URL points at."""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.storage = LocalFileStorage(root.name, "https://media.example")
+
+    def sign(self, ttl_minutes):
+        tags = expiry_tags(ttl_minutes)
+        self.storage.write(PROCESSED_CONTAINER, OUTPUT, b"video", tags=tags)
+        result = {"processed_blob_name": OUTPUT, "output_expires_at": tags[EXPIRY_TAG]}
+        _, expires = function_app._sign_result_url(self.storage, result)
+        return expires.replace(tzinfo=timezone.utc)
+
+    def swept_by(self, moment):
+        pages = self.storage.find_by_tag_before(PROCESSED_CONTAINER, EXPIRY_TAG, format_expiry(moment))
+        return OUTPUT in [name for page in pages for name in page]
+
+    def test_url_is_capped_at_the_output_expiry(self):
+        with mock.patch.object(function_app, "UPLOAD_RESULT_URL_MINUTES", 60):
+            expires = self.sign(10)
+
+        self.assertLess(expires, datetime.now(timezone.utc) + timedelta(minutes=10, seconds=1))
+        # The expiry sweep still leaves the output alone when the URL expires
+        self.assertFalse(self.swept_by(expires))
+        self.assertTrue(self.swept_by(expires + timedelta(seconds=2)))
+
+    def test_url_keeps_its_lifetime_when_the_output_outlives_it(self):
+        with mock.patch.object(function_app, "UPLOAD_RESULT_URL_MINUTES", 60):
+            expires = self.sign(600)
+
+        self.assertAlmostEqual(
+            (expires - datetime.now(timezone.utc)).total_seconds(), 3600, delta=5,
+        )
+
+    def test_joined_run_keeps_the_output_expiry(self):
+        # A duplicate request gets the result rebuilt from the job record
+        use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 1024, "mp4")
+        expires_at = expiry_tags()[EXPIRY_TAG]
+        tracking.update_job_status(BLOB, "completed", result={
+            "processed_blob_name": OUTPUT, "output_expires_at": expires_at,
+        })
+
+        self.assertEqual(tracking.job_result(tracking.get_job_status(BLOB))["output_expires_at"], expires_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from integrations import tracking
+from processing.ingest import UploadNotFound
+from tests.fakes import use_fake_table
+
+
+BLOB = "upload-3f-0199b1f2a4c83f9e0a1b2c.mp4"
+
+
+class UploadSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.table = use_fake_table(self, tracking)
+        tracking.create_job_record(BLOB, 0, "mp4", status="uploading", tenant="acme")
+
+    def record(self):
+        return self.table.entities[("jobs", BLOB)]
+
+    def test_session_belongs_to_its_tenant(self):
+        self.assertEqual(tracking.get_upload_session(BLOB, "acme")["status"], "uploading")
+
+        with self.assertRaises(UploadNotFound):
+            tracking.get_upload_session(BLOB, "other")
+        with self.assertRaises(UploadNotFound):
+            tracking.get_upload_session("upload-3f-unknown.mp4", "acme")
+
+    def test_only_one_commit_begins(self):
+        self.assertTrue(tracking.begin_upload_commit(BLOB))
+        self.assertFalse(tracking.begin_upload_commit(BLOB))
+        self.assertEqual(self.record()["status"], "committing")
+
+    def test_commit_after_a_failed_one_may_begin(self):
+        tracking.begin_upload_commit(BLOB)
+        tracking.update_job_status(BLOB, "failed", error_message="commit failed")
+
+        self.assertTrue(tracking.begin_upload_commit(BLOB))
+        self.assertNotIn("expires_at", self.record())
+        self.assertEqual(self.table.rows(tracking.EXPIRY_PARTITION), [])
+
+    def test_abandoned_commit_is_taken_over(self):
+        tracking.begin_upload_commit(BLOB)
+        started = datetime.now(timezone.utc) - timedelta(seconds=tracking.UPLOAD_COMMIT_TIMEOUT + 1)
+        self.table.update_entity({"PartitionKey": "jobs", "RowKey": BLOB, "commit_started_at": started.isoformat()})
+
+        self.assertTrue(tracking.begin_upload_commit(BLOB))
+
+    def test_processing_activates_the_committed_session(self):
+        tracking.begin_upload_commit(BLOB)
+
+        tracking.create_job_record(BLOB, 4096, "mp4", tenant="acme")
+
+        self.assertEqual(self.record()["status"], "queued")
+        self.assertEqual(self.record()["file_size"], 4096)
+        self.assertFalse(tracking.begin_upload_commit(BLOB))
+
+
+if __name__ == "__main__":
+    unittest.main()